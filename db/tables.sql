@@ -4,6 +4,9 @@ CREATE TABLE sites (
 	parent_element TEXT,
 	child_element TEXT,
 	name TEXT,
+	ready_strategy TEXT,
+	ready_value TEXT,
+	ready_timeout_ms INTEGER,
 	UNIQUE (base_url)
 );
 
@@ -22,9 +25,16 @@ CREATE TABLE pages (
 	tags TEXT,
 	workspaces TEXT, 
 	last_update DATETIME,
+	attempts INTEGER DEFAULT 0,
+	next_attempt DATETIME,
+	last_error TEXT,
+	canonical_url TEXT,
+	duplicate_of INTEGER,
+	revalidate INTEGER DEFAULT 0,
 	UNIQUE(normalized_url)
 	CONSTRAINT pages_sites_FK FOREIGN KEY (site_id) REFERENCES sites(site_id)
 );
+CREATE INDEX pages_retry_IDX ON pages (status, next_attempt);
 
 CREATE TABLE files (
 	file_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
@@ -35,4 +45,82 @@ CREATE TABLE files (
 	status TEXT,
 	last_update DATETIME
 );
-CREATE UNIQUE INDEX files_git_repo_IDX ON files (anythingllm_folder,anythingllm_file_name);
\ No newline at end of file
+CREATE UNIQUE INDEX files_git_repo_IDX ON files (anythingllm_folder,anythingllm_file_name);
+
+CREATE TABLE crawl_runs (
+	job TEXT NOT NULL PRIMARY KEY,
+	start_url TEXT,
+	status TEXT,
+	started DATETIME,
+	last_update DATETIME
+);
+
+CREATE TABLE crawl_frontier (
+	job TEXT NOT NULL,
+	normalized_url TEXT NOT NULL,
+	url TEXT,
+	state TEXT,
+	seq INTEGER,
+	priority INTEGER DEFAULT 0,
+	PRIMARY KEY (job, normalized_url)
+);
+CREATE INDEX crawl_frontier_state_IDX ON crawl_frontier (job, state, seq);
+CREATE INDEX crawl_frontier_priority_IDX ON crawl_frontier (job, state, priority, seq);
+
+CREATE TABLE crawl_found_pages (
+	job TEXT NOT NULL,
+	normalized_url TEXT NOT NULL,
+	original_url TEXT,
+	title TEXT,
+	image_urls TEXT,
+	PRIMARY KEY (job, normalized_url)
+);
+
+CREATE TABLE work_queue (
+	queue TEXT NOT NULL,
+	item_key TEXT NOT NULL,
+	payload TEXT,
+	state TEXT NOT NULL,
+	lease_owner TEXT,
+	lease_expires REAL,
+	attempts INTEGER DEFAULT 0,
+	priority INTEGER DEFAULT 0,
+	last_update DATETIME,
+	PRIMARY KEY (queue, item_key)
+);
+CREATE INDEX work_queue_state_IDX ON work_queue (queue, state, lease_expires);
+CREATE INDEX work_queue_priority_IDX ON work_queue (queue, state, priority);
+
+CREATE TABLE images (
+	image_id INTEGER PRIMARY KEY,
+	url_hash INTEGER NOT NULL UNIQUE,
+	url TEXT NOT NULL,
+	first_seen DATETIME
+);
+
+CREATE TABLE page_images (
+	page_id INTEGER NOT NULL,
+	image_id INTEGER NOT NULL,
+	PRIMARY KEY (page_id, image_id)
+) WITHOUT ROWID;
+CREATE INDEX page_images_image_IDX ON page_images (image_id);
+
+CREATE TABLE page_snapshots (
+	url_hash INTEGER NOT NULL,
+	fetched_at DATETIME NOT NULL,
+	url TEXT NOT NULL,
+	content_hash TEXT NOT NULL,
+	PRIMARY KEY (url_hash, fetched_at)
+) WITHOUT ROWID;
+
+CREATE TABLE http_validators (
+	url_hash INTEGER NOT NULL,
+	source TEXT NOT NULL,
+	normalized_url TEXT NOT NULL,
+	url TEXT NOT NULL,
+	etag TEXT,
+	last_modified TEXT,
+	body_hash TEXT,
+	checked_at DATETIME,
+	PRIMARY KEY (url_hash, source)
+) WITHOUT ROWID;
@@ -0,0 +1,93 @@
+"""
+Microbenchmark for url canonicalization, run on every link that passes the crawler's UrlFilter.
+
+  before: normalize_url (urlparse, parse_qs, urlencode, urlunparse) for every link
+  after:  a Canonicalizer with the same rules: fast path for urls without a query string or fragment,
+          the LRU cache for the rest
+
+The corpus is the recorded toolkit hrefs (links_maui_communitytoolkit.txt, which already has ?source= and
+trailing slash variants) repeated the way they show up page after page, with ?view= versions and fragments mixed in.
+
+run from src/rag-content-manager:
+    python benchmarks/bench_canonicalize.py [--pages 2000] [--links-per-page 150]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import canonicalize
+from canonicalize import Canonicalizer, normalize_url, cache_stats
+
+LINKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'links_maui_communitytoolkit.txt')
+
+# the rules of the maui jobs in crawler_jobs.json
+RULES = {
+    'sort_query_params': True,
+    'ignored_query_parameters': ['source', 'tabs', 'view'],
+    'remove_trailing_slash_from_paths': True,
+    'version_preference_order': ['net-maui-9.0']
+}
+
+VIEWS = ["net-maui-9.0", "net-maui-8.0", "net-8.0", "net-9.0"]
+
+def load_corpus(pages: int, links_per_page: int, seed: int = 42) -> list[list[str]]:
+    """
+    builds `pages` lists of hrefs from the recorded urls, some with a ?view= version or a fragment added
+    """
+    with open(LINKS_FILE, 'r', encoding='utf-8') as f:
+        doc_links = [line.split(' - ', 1)[0].strip() for line in f if line.strip()]
+
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(pages):
+        hrefs = []
+        for _ in range(links_per_page):
+            href = rng.choice(doc_links)
+            roll = rng.random()
+            if roll < 0.2:
+                href += ("&" if "?" in href else "?") + "view=" + rng.choice(VIEWS)
+            elif roll < 0.3:
+                href += "#" + rng.choice(["overview", "syntax", "remarks"])
+            hrefs.append(href)
+        corpus.append(hrefs)
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark url canonicalization")
+    parser.add_argument("--pages", type=int, default=2000, help="number of simulated pages")
+    parser.add_argument("--links-per-page", type=int, default=150, help="matched links per simulated page")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pages, args.links_per_page)
+    total_links = args.pages * args.links_per_page
+    normalize_url_params = {k: v for k, v in canonicalize.normalization_rules(RULES).items() if k != 'version_preference_order'}
+
+    start = time.perf_counter()
+    before = [[normalize_url(href, **normalize_url_params) for href in hrefs] for hrefs in corpus]
+    before_seconds = time.perf_counter() - start
+
+    canonicalize._normalize_cached.cache_clear()
+    start = time.perf_counter()
+    canonicalizer = Canonicalizer(RULES)
+    after = [[canonicalizer(href) for href in hrefs] for hrefs in corpus]
+    after_seconds = time.perf_counter() - start
+
+    if before != after:
+        mismatches = sum(b != a for bs, as_ in zip(before, after) for b, a in zip(bs, as_))
+        print(f"mismatch: {mismatches} urls differ")
+        sys.exit(1)
+
+    stats = cache_stats()
+    cached = stats['hits'] + stats['misses']
+    print(f"{args.pages} pages, {total_links} links, {len({url for urls in after for url in urls})} unique canonical urls")
+    print(f"fast path: {total_links - cached} links, cache: {stats['hits']} hits, {stats['misses']} misses")
+    print(f"before: {before_seconds:.2f}s, {total_links / before_seconds:,.0f} links per second")
+    print(f"after:  {after_seconds:.2f}s, {total_links / after_seconds:,.0f} links per second")
+    print(f"speedup: {before_seconds / after_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
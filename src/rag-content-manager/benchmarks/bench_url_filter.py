@@ -0,0 +1,130 @@
+"""
+Microbenchmark for the crawler's link filtering, the per href work done for every page.
+
+  before: urlparse image check, normalize_url and fnmatch against every glob, for every href
+  after:  UrlFilter (prefix check + one compiled regex), normalize_url only for links that pass
+
+run from src/rag-content-manager:
+    python benchmarks/bench_url_filter.py [--pages 2000] [--links-per-page 300]
+"""
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import time
+from urllib.parse import urljoin, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from canonicalize import normalize_url, normalization_rules
+from url_filter import UrlFilter, IMAGE_EXTENSIONS
+
+LINKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'links_maui_communitytoolkit.txt')
+
+GLOBS = [
+    "https://learn.microsoft.com/en-us/dotnet/communitytoolkit/maui/**",
+    "https://learn.microsoft.com/en-us/dotnet/maui/**",
+    "https://learn.microsoft.com/en-us/dotnet/api/microsoft.maui.**"
+]
+
+# links every learn.microsoft.com page carries in its header, footer and side bars
+NAV_LINKS = [
+    "https://learn.microsoft.com/en-us/",
+    "https://learn.microsoft.com/en-us/training/",
+    "https://learn.microsoft.com/en-us/credentials/",
+    "https://learn.microsoft.com/en-us/answers/",
+    "https://learn.microsoft.com/en-us/samples/browse/",
+    "https://learn.microsoft.com/en-us/shows/",
+    "https://learn.microsoft.com/en-us/previous-versions/",
+    "https://learn.microsoft.com/en-us/legal/termsofuse",
+    "https://learn.microsoft.com/en-us/principles-for-ai-generated-content",
+    "https://go.microsoft.com/fwlink/?LinkId=521839",
+    "https://www.microsoft.com/legal/intellectualproperty/trademarks",
+    "https://github.com/MicrosoftDocs/CommunityToolkit/blob/main/docs/maui/index.md",
+    "https://learn.microsoft.com/en-us/dotnet/communitytoolkit/maui/images/logo.png",
+    "https://learn.microsoft.com/en-us/media/learn/not-found.svg",
+    "javascript:void(0)",
+    "mailto:someone@example.com",
+]
+
+def load_corpus(pages: int, links_per_page: int, seed: int = 42) -> list[list[str]]:
+    """
+    builds `pages` lists of hrefs, mixing the recorded toolkit urls with nav links, fragments and images
+    """
+    with open(LINKS_FILE, 'r', encoding='utf-8') as f:
+        doc_links = [line.split(' - ', 1)[0].strip() for line in f if line.strip()]
+
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(pages):
+        hrefs = []
+        for _ in range(links_per_page):
+            roll = rng.random()
+            if roll < 0.45:
+                hrefs.append(rng.choice(NAV_LINKS))
+            elif roll < 0.55:
+                hrefs.append(rng.choice(doc_links) + "#" + rng.choice(["overview", "syntax", "remarks"]))
+            else:
+                hrefs.append(rng.choice(doc_links))
+        corpus.append(hrefs)
+    return corpus
+
+def filter_before(request_url: str, hrefs: list[str], normalize_url_params: dict) -> list[tuple[str, str]]:
+    # the link loop as it was before UrlFilter
+    matched_links = []
+    for href in hrefs:
+        full_url = urljoin(request_url, href)
+        if urlparse(full_url).path.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        normalized_link = normalize_url(full_url, **normalize_url_params)
+        if any(fnmatch.fnmatch(full_url, glob) for glob in GLOBS):
+            matched_links.append((full_url, normalized_link))
+    return matched_links
+
+def filter_after(url_filter: UrlFilter, hrefs: list[str], normalize_url_params: dict) -> list[tuple[str, str]]:
+    # the link loop in run_crawler
+    return [
+        (full_url, normalize_url(full_url, **normalize_url_params))
+        for full_url in dict.fromkeys(hrefs)
+        if url_filter.matches(full_url)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawler's link filtering")
+    parser.add_argument("--pages", type=int, default=2000, help="number of simulated pages")
+    parser.add_argument("--links-per-page", type=int, default=300, help="hrefs per simulated page")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pages, args.links_per_page)
+    total_links = args.pages * args.links_per_page
+    request_url = "https://learn.microsoft.com/en-us/dotnet/communitytoolkit/maui/"
+    rules = normalization_rules({
+        'ignored_query_parameters': ['source'],
+        'remove_trailing_slash_from_paths': True
+    })
+    normalize_url_params = {k: v for k, v in rules.items() if k != 'version_preference_order'}
+
+    start = time.perf_counter()
+    before = [filter_before(request_url, hrefs, normalize_url_params) for hrefs in corpus]
+    before_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    url_filter = UrlFilter(GLOBS)
+    after = [filter_after(url_filter, hrefs, normalize_url_params) for hrefs in corpus]
+    after_seconds = time.perf_counter() - start
+
+    # both must enqueue the same set of urls
+    before_urls = {link for links in before for link in links}
+    after_urls = {link for links in after for link in links}
+    if before_urls != after_urls:
+        print(f"mismatch: {len(before_urls ^ after_urls)} urls differ")
+        sys.exit(1)
+
+    print(f"{args.pages} pages, {total_links} links, {len(after_urls)} unique links enqueued")
+    print(f"before: {before_seconds:.2f}s, {total_links / before_seconds:,.0f} links per second")
+    print(f"after:  {after_seconds:.2f}s, {total_links / after_seconds:,.0f} links per second")
+    print(f"speedup: {before_seconds / after_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import Playwright, Browser, BrowserContext, Page
+from request_blocking import RequestBlocker
+
+class PooledPage:
+    """
+    A page handed out by the BrowserPool, along with the bookkeeping needed to decide when to recycle it
+    """
+    def __init__(self, slot: int, context: BrowserContext, page: Page):
+        self.slot = slot
+        self.context = context
+        self.page = page
+        self.navigations = 0
+
+
+class BrowserPool:
+    """
+    Keeps a small number of long lived Chromium browsers and hands out isolated context/page pairs to workers.
+
+    Workers borrow a page with `async with pool.page() as page:` for a single URL and give it back afterwards.
+    Idle pages are re-used by the next worker, so the number of open pages never exceeds the number of workers,
+    while the number of browser processes stays at `size` no matter how high the crawl concurrency is.
+
+    A page (and its context) is closed instead of being re-used once it has done `max_navigations_per_page`
+    navigations, or when the browser processes are using more than `max_rss_mb` of memory.
+
+    When a `request_blocker` is given, every context the pool creates is routed through it.
+    """
+    def __init__(
+        self,
+        playwright: Playwright,
+        size: int = 1,
+        max_navigations_per_page: int = 50,
+        max_rss_mb: int = None,
+        launch_options: dict = None,
+        request_blocker: RequestBlocker = None
+    ):
+        self.playwright = playwright
+        self.size = max(1, size)
+        self.max_navigations_per_page = max_navigations_per_page
+        self.max_rss_mb = max_rss_mb
+        self.launch_options = launch_options or {}
+        self.request_blocker = request_blocker
+
+        self._browsers: list[Browser] = [None] * self.size
+        self._open_pages = [0] * self.size # open contexts per browser slot, used to spread the load
+        self._idle: list[PooledPage] = []
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+        # memory checks walk /proc, so we only re-check every few seconds
+        self._rss_checked_at = 0.0
+        self._rss_mb = None
+
+        self.stats = {
+            'browsers_launched': 0,
+            'contexts_created': 0,
+            'contexts_recycled': 0,
+            'pages_reused': 0
+        }
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _get_browser(self, slot: int) -> Browser:
+        """
+        returns the browser for a slot, (re)launching it if it was never started or has crashed
+        """
+        browser = self._browsers[slot]
+        if browser is None or not browser.is_connected():
+            browser = await self.playwright.chromium.launch(**self.launch_options)
+            self._browsers[slot] = browser
+            self.stats['browsers_launched'] += 1
+        return browser
+
+    async def acquire(self) -> PooledPage:
+        """
+        returns an idle page if there is one, otherwise opens a new context on the least loaded browser
+        """
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("BrowserPool is closed")
+
+            while self._idle:
+                pooled = self._idle.pop()
+                if not pooled.page.is_closed():
+                    self.stats['pages_reused'] += 1
+                    return pooled
+                self._open_pages[pooled.slot] -= 1
+
+            slot = min(range(self.size), key=lambda s: self._open_pages[s])
+            browser = await self._get_browser(slot)
+            self._open_pages[slot] += 1
+
+        try:
+            context = await browser.new_context()
+            if self.request_blocker is not None:
+                await self.request_blocker.attach(context)
+            page = await context.new_page()
+        except Exception:
+            async with self._lock:
+                self._open_pages[slot] -= 1
+            raise
+
+        self.stats['contexts_created'] += 1
+        return PooledPage(slot, context, page)
+
+    async def release(self, pooled: PooledPage, discard: bool = False) -> None:
+        """
+        hands a page back to the pool. The page is closed instead of re-used when it has hit its navigation
+        budget, the browsers are over the memory ceiling, or the caller asks for it to be discarded (after an error)
+        """
+        recycle = (
+            discard or
+            self._closed or
+            pooled.page.is_closed() or
+            (self.max_navigations_per_page is not None and pooled.navigations >= self.max_navigations_per_page) or
+            self._over_memory_ceiling()
+        )
+
+        if not recycle:
+            async with self._lock:
+                self._idle.append(pooled)
+            return
+
+        await self._close_pooled(pooled)
+        self.stats['contexts_recycled'] += 1
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        borrows a page for the duration of the `async with` block. every borrow counts as one navigation.
+        """
+        pooled = await self.acquire()
+        discard = False
+        try:
+            yield pooled.page
+        except BaseException:
+            # the page may be left mid navigation, don't hand it to another worker
+            discard = True
+            raise
+        finally:
+            pooled.navigations += 1
+            await self.release(pooled, discard=discard)
+
+    async def _close_pooled(self, pooled: PooledPage) -> None:
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass # the browser may already be gone
+        async with self._lock:
+            self._open_pages[pooled.slot] -= 1
+
+    def _over_memory_ceiling(self) -> bool:
+        if self.max_rss_mb is None:
+            return False
+
+        now = time.monotonic()
+        if now - self._rss_checked_at > 5:
+            self._rss_checked_at = now
+            self._rss_mb = _children_rss_mb()
+
+        return self._rss_mb is not None and self._rss_mb > self.max_rss_mb
+
+    async def close(self) -> None:
+        """
+        closes all idle pages and every browser in the pool
+        """
+        async with self._lock:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+
+        for pooled in idle:
+            await self._close_pooled(pooled)
+
+        for slot, browser in enumerate(self._browsers):
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+                self._browsers[slot] = None
+
+    def print_stats(self) -> None:
+        print(
+            f"       - Browser pool: {self.stats['browsers_launched']} browser(s) launched, "
+            f"{self.stats['contexts_created']} contexts created, {self.stats['contexts_recycled']} recycled, "
+            f"{self.stats['pages_reused']} page re-uses."
+        )
+
+
+def _children_rss_mb() -> float:
+    """
+    returns the resident memory (MB) of all processes descended from this one (the browsers and their renderers).
+    only supported on linux, returns None everywhere else
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+
+    parents = {}
+    rss_kb = {}
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/status", "r") as f:
+                    pid = int(entry)
+                    for line in f:
+                        if line.startswith("PPid:"):
+                            parents[pid] = int(line.split()[1])
+                        elif line.startswith("VmRSS:"):
+                            rss_kb[pid] = int(line.split()[1])
+            except (OSError, ValueError):
+                continue # process went away while we were reading it
+    except OSError:
+        return None
+
+    me = os.getpid()
+    total_kb = 0
+    for pid, kb in rss_kb.items():
+        # walk up the tree to see if this process belongs to us
+        ancestor = parents.get(pid)
+        seen = 0
+        while ancestor and ancestor != me and seen < 64:
+            ancestor = parents.get(ancestor)
+            seen += 1
+        if ancestor == me:
+            total_kb += kb
+
+    return total_kb / 1024
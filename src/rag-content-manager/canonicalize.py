@@ -0,0 +1,124 @@
+import os
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+
+# urls kept in the canonicalization cache, shared by all jobs (the rules are part of the key)
+CACHE_SIZE = 65536
+
+DEFAULT_NORMALIZATION_RULES = {
+    'strip_fragments': True,
+    'sort_query_params': True,
+    'ignored_query_parameters': [],
+    'remove_trailing_slash_from_paths': False,
+    'version_preference_order': [] # Default to empty list for preference handling
+}
+
+def normalization_rules(url_normalization_rules: dict = None) -> dict:
+    """
+    returns the job's url_normalization_rules merged over the defaults
+    """
+    rules = dict(DEFAULT_NORMALIZATION_RULES)
+    if url_normalization_rules:
+        rules.update(url_normalization_rules)
+    return rules
+
+def normalize_url(
+    url: str,
+    strip_fragments: bool = True,
+    sort_query_params: bool = True,
+    ignored_query_parameters: list[str] = None,
+    remove_trailing_slash_from_paths: bool = False
+) -> str:
+    """
+    Normalizes a URL by stripping fragments, sorting/ignoring query parameters,
+    and optionally removing trailing slashes from paths.
+
+    This is the uncached reference implementation, use a Canonicalizer in the crawl loops.
+
+    Args:
+        url: The URL string to normalize.
+        strip_fragments: If True, removes the fragment (part after #).
+        sort_query_params: If True, sorts query parameters alphabetically.
+        ignored_query_parameters: A list of query parameter names to remove.
+        remove_trailing_slash_from_paths: If True, removes trailing slash from path
+                                          unless it's part of a file name.
+
+    Returns:
+        The normalized URL string.
+    """
+    parsed = urlparse(url)
+
+    # 1. Strip fragment
+    if strip_fragments:
+        parsed = parsed._replace(fragment="")
+
+    # 2. Process query parameters
+    query_params_dict = parse_qs(parsed.query, keep_blank_values=True)
+    if ignored_query_parameters:
+        for param in ignored_query_parameters:
+            query_params_dict.pop(param, None) # Remove if exists
+
+    # Sort parameters and rebuild query string
+    if sort_query_params:
+        # urlencode expects a list of 2-item tuples for doseq=True
+        sorted_items = sorted(query_params_dict.items())
+        rebuilt_query = urlencode(sorted_items, doseq=True)
+        parsed = parsed._replace(query=rebuilt_query)
+    else:
+        # If not sorting, just rebuild the query from potentially removed params
+        parsed = parsed._replace(query=urlencode(query_params_dict, doseq=True))
+
+    # 3. Handle trailing slashes
+    if remove_trailing_slash_from_paths:
+        path = parsed.path
+        # Check if path ends with a slash AND doesn't seem to have a file extension
+        # (e.g., /doc/ vs /doc/file.html)
+        if path.endswith('/') and '.' not in os.path.basename(path):
+            parsed = parsed._replace(path=path.rstrip('/'))
+
+    return urlunparse(parsed)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_cached(url: str, rules_key: tuple) -> str:
+    strip_fragments, sort_query_params, ignored_query_parameters, remove_trailing_slash_from_paths = rules_key
+    return normalize_url(url, strip_fragments, sort_query_params, ignored_query_parameters, remove_trailing_slash_from_paths)
+
+def cache_stats() -> dict:
+    """
+    hits, misses and size of the canonicalization cache shared by all Canonicalizers
+    """
+    info = _normalize_cached.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
+
+
+class Canonicalizer:
+    """
+    A job's url normalization rules compiled once, called as `canonicalize(url)`.
+    Gives the same result as normalize_url with the same rules.
+
+    http(s) urls without a query string, fragment or path parameters don't need urlparse at all: they are returned
+    as they are, or with the trailing slashes of the path removed. Everything else goes through normalize_url behind
+    an LRU cache keyed by (url, rules), since the same nav and version links show up on every page of a site.
+    """
+    def __init__(self, url_normalization_rules: dict = None):
+        self.rules = normalization_rules(url_normalization_rules)
+        self.strip_fragments = bool(self.rules['strip_fragments'])
+        self.remove_trailing_slash = bool(self.rules['remove_trailing_slash_from_paths'])
+        self._rules_key = (
+            self.strip_fragments,
+            bool(self.rules['sort_query_params']),
+            tuple(self.rules['ignored_query_parameters'] or ()),
+            self.remove_trailing_slash
+        )
+
+    def __call__(self, url: str) -> str:
+        # urlparse lowercases the scheme, so only plain lowercase http(s) urls take the fast path
+        if '?' in url or '#' in url or ';' in url or not url.startswith(('https://', 'http://')):
+            return _normalize_cached(url, self._rules_key)
+        if not self.remove_trailing_slash or not url.endswith('/'):
+            return url
+        # the path starts at the first "/" after the netloc
+        path_start = url.find('/', url.find('//') + 2)
+        if path_start == -1:
+            return url
+        return url[:path_start] + url[path_start:].rstrip('/')
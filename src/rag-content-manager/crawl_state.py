@@ -0,0 +1,346 @@
+import hashlib
+import heapq
+import math
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable
+
+# urls added to a VisitedSet are kept in a small set until this many pile up, then merged into the sorted array
+MIN_MERGE_BUFFER = 65536
+
+def url_fingerprint(url: str) -> int:
+    """
+    64 bit fingerprint of a (normalized) url. With a million urls the chance of any two colliding is ~3e-8,
+    so 128 bits would only double the memory for nothing
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class BloomFilter:
+    """
+    Bloom filter over url fingerprints, the k bit positions are derived from the fingerprint by double hashing
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, fingerprint: int):
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, fingerprint: int) -> None:
+        for position in self._positions(fingerprint):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+class VisitedSet:
+    """
+    Drop in for the crawler's set of visited/queued normalized urls that stores 8 byte fingerprints
+    in a sorted array instead of the url strings.
+
+    New fingerprints go to a small set first and are merged into the sorted array in bulk, the buffer grows
+    with the array so merging stays linear overall. A Bloom filter can be put in front of the lookups
+    (`bloom_capacity`), it answers most "never seen" lookups without the binary search.
+    """
+    def __init__(self, urls=None, bloom_capacity: int = None, bloom_error_rate: float = 0.01):
+        self._sorted = array('Q')
+        self._buffer = set()
+        self._bloom = BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity else None
+        if urls:
+            self.update(urls)
+
+    def _contains_fingerprint(self, fingerprint: int) -> bool:
+        if self._bloom is not None and fingerprint not in self._bloom:
+            return False
+        if fingerprint in self._buffer:
+            return True
+        index = bisect_left(self._sorted, fingerprint)
+        return index < len(self._sorted) and self._sorted[index] == fingerprint
+
+    def __contains__(self, url: str) -> bool:
+        return self._contains_fingerprint(url_fingerprint(url))
+
+    def add(self, url: str) -> None:
+        fingerprint = url_fingerprint(url)
+        if self._contains_fingerprint(fingerprint):
+            return
+        self._buffer.add(fingerprint)
+        if self._bloom is not None:
+            self._bloom.add(fingerprint)
+        if len(self._buffer) >= max(MIN_MERGE_BUFFER, len(self._sorted) // 8):
+            self._merge()
+
+    def update(self, urls) -> None:
+        for url in urls:
+            self.add(url)
+
+    def _merge(self) -> None:
+        self._sorted = array('Q', heapq.merge(self._sorted, sorted(self._buffer)))
+        self._buffer = set()
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._buffer)
+
+    @property
+    def nbytes(self) -> int:
+        # array storage, the buffer's hash table and its int objects, and the bloom filter
+        total = self._sorted.buffer_info()[1] * self._sorted.itemsize
+        total += sys.getsizeof(self._buffer) + sum(sys.getsizeof(f) for f in self._buffer)
+        if self._bloom is not None:
+            total += self._bloom.nbytes
+        return total
+
+
+class UrlPrefixes:
+    """
+    Interns the part of a url up to the last "/" of its path ("https://learn.microsoft.com/en-us/dotnet/api/"),
+    so thousands of pages in the same folder share one prefix string
+    """
+    def __init__(self):
+        self._ids = {}
+        self._prefixes = []
+
+    def split(self, url: str) -> tuple[int, str]:
+        query = url.find('?')
+        cut = url.rfind('/', 0, query if query != -1 else len(url)) + 1
+        prefix = url[:cut]
+        prefix_id = self._ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = len(self._prefixes)
+            self._ids[prefix] = prefix_id
+            self._prefixes.append(prefix)
+        return prefix_id, url[cut:]
+
+    def join(self, prefix_id: int, tail: str) -> str:
+        return self._prefixes[prefix_id] + tail
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._ids) + sys.getsizeof(self._prefixes) + sum(sys.getsizeof(p) for p in self._prefixes)
+
+
+class PageRecord:
+    """
+    A found page. The original url is only kept when it differs from the normalized url,
+    image urls are interned strings shared between all the pages showing the same image
+    """
+    __slots__ = ('prefix_id', 'tail', 'original_prefix_id', 'original_tail', 'title', 'image_urls', 'content_html')
+
+    def __init__(self, prefix_id: int, tail: str, original_prefix_id: int, original_tail: str, title: str, image_urls: tuple, content_html: str = None):
+        self.prefix_id = prefix_id
+        self.tail = tail
+        self.original_prefix_id = original_prefix_id
+        self.original_tail = original_tail
+        self.title = title
+        self.image_urls = image_urls
+        self.content_html = content_html
+
+
+class PageStore:
+    """
+    The crawler's found pages, keyed by the normalized url's fingerprint and stored as PageRecords.
+    Pages go in and come out as the same dicts run_crawler has always returned.
+    """
+    def __init__(self):
+        self._records = {} # url_fingerprint(normalized_url) -> PageRecord
+        self._prefixes = UrlPrefixes()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, normalized_url: str) -> bool:
+        return url_fingerprint(normalized_url) in self._records
+
+    def put(self, page: dict) -> None:
+        """
+        stores a page dict with normalized_url, original_url, title, image_urls and optionally content_html
+        """
+        prefix_id, tail = self._prefixes.split(page['normalized_url'])
+        original_prefix_id = original_tail = None
+        if page['original_url'] != page['normalized_url']:
+            original_prefix_id, original_tail = self._prefixes.split(page['original_url'])
+        self._records[url_fingerprint(page['normalized_url'])] = PageRecord(
+            prefix_id,
+            tail,
+            original_prefix_id,
+            original_tail,
+            page['title'],
+            tuple(sys.intern(image_url) for image_url in page['image_urls']),
+            page.get('content_html')
+        )
+
+    def _to_dict(self, record: PageRecord, include_content: bool = True) -> dict:
+        normalized_url = self._prefixes.join(record.prefix_id, record.tail)
+        page = {
+            'normalized_url': normalized_url,
+            'original_url': self._prefixes.join(record.original_prefix_id, record.original_tail) if record.original_tail is not None else normalized_url,
+            'title': record.title,
+            'image_urls': list(record.image_urls)
+        }
+        if include_content and record.content_html is not None:
+            page['content_html'] = record.content_html
+        return page
+
+    def get_original_url(self, normalized_url: str) -> str:
+        record = self._records[url_fingerprint(normalized_url)]
+        if record.original_tail is None:
+            return normalized_url
+        return self._prefixes.join(record.original_prefix_id, record.original_tail)
+
+    def pages(self) -> list[dict]:
+        """
+        returns all pages as dicts, sorted by normalized_url
+        """
+        return sorted((self._to_dict(record) for record in self._records.values()), key=lambda page: page['normalized_url'])
+
+    @property
+    def nbytes(self) -> int:
+        # the records, their strings and the dict holding them. content_html isn't counted,
+        # it's only there in extract during crawl mode and is the page content, not crawl state
+        total = sys.getsizeof(self._records) + self._prefixes.nbytes
+        seen_images = set()
+        for fingerprint, record in self._records.items():
+            total += sys.getsizeof(fingerprint) + sys.getsizeof(record) + sys.getsizeof(record.tail) + sys.getsizeof(record.title)
+            total += sys.getsizeof(record.image_urls)
+            if record.original_tail is not None:
+                total += sys.getsizeof(record.original_tail)
+            for image_url in record.image_urls:
+                if id(image_url) not in seen_images:
+                    seen_images.add(id(image_url))
+                    total += sys.getsizeof(image_url)
+        return total
+
+
+class VariantGroups:
+    """
+    The url variants of the queued and in flight pages (e.g. ?view=net-8.0 and ?view=net-maui-9.0 of the same
+    api page), grouped by normalized url. Only the best ranked variant is loaded, the others are only tried
+    when it fails.
+
+    A group is started when its page is queued and dropped when the page is done, so the memory follows the
+    queue, not the whole crawl. Groups aren't checkpointed, a resumed crawl loads its queued urls as they are.
+    """
+    def __init__(self, rank: Callable[[str], tuple]):
+        self._rank = rank # lower is better
+        self._groups = {} # normalized_url -> untried variant urls
+        self.stats = {'grouped': 0, 'swapped': 0, 'fallbacks': 0, 'avoided': 0}
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def start(self, normalized_url: str, url: str) -> None:
+        """
+        starts the group of a page that was just queued with `url`
+        """
+        self._groups[normalized_url] = [url]
+
+    def add(self, normalized_url: str, url: str) -> bool:
+        """
+        adds a variant to a queued or in flight page, False if the page has no group (done, or never grouped)
+        """
+        group = self._groups.get(normalized_url)
+        if group is None:
+            return False
+        if url not in group:
+            group.append(url)
+            self.stats['grouped'] += 1
+        return True
+
+    def pick(self, normalized_url: str, url: str) -> str:
+        """
+        returns the variant to load for `url` handed out by the frontier: the best ranked one not tried yet
+        """
+        group = self._groups.get(normalized_url)
+        if group is None:
+            return url
+        if url not in group:
+            group.append(url)
+        best = min(group, key=self._rank)
+        group.remove(best)
+        if best != url:
+            self.stats['swapped'] += 1
+        return best
+
+    def next_fallback(self, normalized_url: str) -> str:
+        """
+        the variant to try after the loaded one failed, None when there is none left (the group is dropped)
+        """
+        group = self._groups.get(normalized_url)
+        if not group:
+            self._groups.pop(normalized_url, None)
+            return None
+        self.stats['fallbacks'] += 1
+        return min(group, key=self._rank)
+
+    def done(self, normalized_url: str) -> None:
+        """
+        drops the group of a finished page, its untried variants are navigations we didn't need
+        """
+        group = self._groups.pop(normalized_url, None)
+        if group:
+            self.stats['avoided'] += len(group)
+
+    def print_stats(self) -> None:
+        print(
+            f"       - Url variants: {self.stats['grouped']} grouped under a queued page, {self.stats['swapped']} pages loaded "
+            f"with a preferred variant found after queueing, {self.stats['fallbacks']} fallbacks after a failed load, "
+            f"{self.stats['avoided']} navigations avoided."
+        )
+
+
+class WorkerGauges:
+    """
+    Live gauges of a crawl's workers: how many are active (working on a url) and how many are idle (waiting for
+    the frontier to hand out a url). Worker seconds spent active are summed up for the utilisation, the share of
+    the workers' time spent on pages rather than waiting.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._states = {} # worker_id -> 'active' or 'idle'
+        self.active = 0
+        self.idle = 0
+        self.peak_active = 0
+        self._started = time.monotonic()
+        self._last_change = self._started
+        self._active_seconds = 0.0
+
+    def set(self, worker_id: int, state: str = None) -> None:
+        """
+        moves a worker to 'active' or 'idle', None when it has exited
+        """
+        now = time.monotonic()
+        self._active_seconds += self.active * (now - self._last_change)
+        self._last_change = now
+
+        previous = self._states.pop(worker_id, None)
+        if previous is not None:
+            setattr(self, previous, getattr(self, previous) - 1)
+        if state is not None:
+            self._states[worker_id] = state
+            setattr(self, state, getattr(self, state) + 1)
+        self.peak_active = max(self.peak_active, self.active)
+
+    def utilisation(self) -> float:
+        elapsed = time.monotonic() - self._started
+        if elapsed <= 0 or self.workers == 0:
+            return 0.0
+        active_seconds = self._active_seconds + self.active * (time.monotonic() - self._last_change)
+        return active_seconds / (self.workers * elapsed)
+
+    def print_stats(self) -> None:
+        print(
+            f"       - Workers: {self.workers}, at most {self.peak_active} active at once, "
+            f"{self.utilisation():.0%} of the worker time spent on pages."
+        )
@@ -1,67 +1,31 @@
 import asyncio
-import fnmatch
+import collections
+import inspect
 import json
 import os
 import re
 import time
-from urllib.parse import urljoin, urlparse, parse_qs, urlunparse, urlencode
+from contextlib import nullcontext
+from urllib.parse import urlparse, parse_qs
+from typing import Callable
 from playwright.async_api import async_playwright, Playwright, Page
 # Re-import Playwright-specific error types to resolve NameError
 from playwright._impl._errors import TargetClosedError, Error as PlaywrightError 
-
-def _normalize_url(
-    url: str,
-    strip_fragments: bool = True,
-    sort_query_params: bool = True,
-    ignored_query_parameters: list[str] = None,
-    remove_trailing_slash_from_paths: bool = False
-) -> str:
-    """
-    Normalizes a URL by stripping fragments, sorting/ignoring query parameters,
-    and optionally removing trailing slashes from paths.
-
-    Args:
-        url: The URL string to normalize.
-        strip_fragments: If True, removes the fragment (part after #).
-        sort_query_params: If True, sorts query parameters alphabetically.
-        ignored_query_parameters: A list of query parameter names to remove.
-        remove_trailing_slash_from_paths: If True, removes trailing slash from path
-                                          unless it's part of a file name.
-
-    Returns:
-        The normalized URL string.
-    """
-    parsed = urlparse(url)
-
-    # 1. Strip fragment
-    if strip_fragments:
-        parsed = parsed._replace(fragment="")
-
-    # 2. Process query parameters
-    query_params_dict = parse_qs(parsed.query, keep_blank_values=True)
-    if ignored_query_parameters:
-        for param in ignored_query_parameters:
-            query_params_dict.pop(param, None) # Remove if exists
-
-    # Sort parameters and rebuild query string
-    if sort_query_params:
-        # urlencode expects a list of 2-item tuples for doseq=True
-        sorted_items = sorted(query_params_dict.items())
-        rebuilt_query = urlencode(sorted_items, doseq=True)
-        parsed = parsed._replace(query=rebuilt_query)
-    else:
-        # If not sorting, just rebuild the query from potentially removed params
-        parsed = parsed._replace(query=urlencode(query_params_dict, doseq=True))
-
-    # 3. Handle trailing slashes
-    if remove_trailing_slash_from_paths:
-        path = parsed.path
-        # Check if path ends with a slash AND doesn't seem to have a file extension
-        # (e.g., /doc/ vs /doc/file.html)
-        if path.endswith('/') and '.' not in os.path.basename(path):
-            parsed = parsed._replace(path=path.rstrip('/'))
-
-    return urlunparse(parsed)
+from browser_pool import BrowserPool
+from http_fetcher import HttpFetcher, parse_html, needs_javascript, is_html_response
+from http_cache import HttpCache
+from frontier import CrawlFrontier, crawl_priority, priority_depth
+from rate_limiter import HostRateLimiter, ThrottledError, THROTTLE_STATUSES
+from url_filter import UrlFilter
+from canonicalize import Canonicalizer, cache_stats
+from get_web_markdown import extract_page_async, ExtractionStats
+from readiness import ReadinessStrategy
+from crawl_state import VisitedSet, PageStore, VariantGroups, WorkerGauges
+
+# how often a page that got a 429/503 is put back in the queue before we give up on it
+MAX_THROTTLE_RETRIES = 3
+# how often the worker gauges and crawl progress are printed during a crawl
+PROGRESS_INTERVAL_SECONDS = 60
 
 def _get_version_rank_and_numeric(
     url_str: str, 
@@ -108,177 +72,564 @@ def _get_version_rank_and_numeric(
     return (rank, -numeric_version)
 
 
+async def _call(callback: Callable, *args) -> None:
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        await result
+
+async def iter_crawl(playwright: Playwright, start_url: str, globs: list[str], **kwargs):
+    """
+    Async iterator over the pages of a crawl as they are found, takes the same arguments as run_crawler:
+
+        async for page in iter_crawl(playwright, start_url, globs, max_concurrency=10):
+            ...
+
+    Errors from the crawl are raised from the iterator. Leaving the loop early cancels the crawl.
+    """
+    queue = asyncio.Queue()
+    finished = object()
+
+    async def crawl():
+        try:
+            await run_crawler(playwright, start_url, globs, on_page=queue.put, **kwargs)
+        finally:
+            queue.put_nowait(finished)
+
+    crawl_task = asyncio.create_task(crawl())
+    try:
+        while True:
+            page = await queue.get()
+            if page is finished:
+                break
+            yield page
+        await crawl_task
+    finally:
+        if not crawl_task.done():
+            crawl_task.cancel()
+            try:
+                await crawl_task
+            except asyncio.CancelledError:
+                pass
+
 async def run_crawler(
     playwright: Playwright, 
     start_url: str, 
     globs: list[str], 
     max_concurrency: int = 20,
     url_normalization_rules: dict = None,
-    max_urls_to_find: int = None
+    max_urls_to_find: int = None,
+    browser_pool: BrowserPool = None,
+    crawl_engine: str = "browser",
+    js_fallback_rules: dict = None,
+    container_selector: str = None,
+    frontier: CrawlFrontier = None,
+    resume: bool = False,
+    time_budget_seconds: float = None,
+    seed_urls: list[str] = None,
+    skip_normalized_urls: set = None,
+    follow_links: bool = True,
+    rate_limiter: HostRateLimiter = None,
+    exclude_globs: list[str] = None,
+    extract_content: bool = False,
+    content_selector: str = None,
+    readiness: ReadinessStrategy = None,
+    bloom_filter_capacity: int = None,
+    on_page: Callable = None,
+    page_slot: Callable = None,
+    max_depth: int = None,
+    links_in_container: bool = False,
+    worker_gauges: WorkerGauges = None,
+    http_cache: HttpCache = None
 ) -> list[dict]:
     """
     Crawls a given start URL, enqueues links based on globs, and returns found URLs with titles.
     Prioritizes newer versions of pages based on a 'view' query parameter if specified
     via `url_normalization_rules.version_preference_order`.
     Also collects image URLs found on each page.
+
+    The options by what they change, each one is described where it is used below:
+      - how pages are loaded: browser_pool, crawl_engine, js_fallback_rules, http_cache, readiness, rate_limiter,
+        page_slot
+      - which links are followed: globs, exclude_globs, seed_urls, skip_normalized_urls, follow_links, max_depth,
+        links_in_container, max_urls_to_find
+      - the queue: frontier, resume, time_budget_seconds, bloom_filter_capacity
+      - what comes back: extract_content (with container_selector and content_selector), on_page
+      - the workers: max_concurrency, worker_gauges
     """
-    # Set default normalization rules if not provided
-    rules = {
-        'strip_fragments': True,
-        'sort_query_params': True,
-        'ignored_query_parameters': [],
-        'remove_trailing_slash_from_paths': False,
-        'version_preference_order': [] # Default to empty list for preference handling
-    }
-    if url_normalization_rules:
-        rules.update(url_normalization_rules)
+    canonicalize = Canonicalizer(url_normalization_rules)
+    rules = canonicalize.rules
 
     start_time = time.time()
-    # found_pages_data now stores normalized_url as key, and a dict value containing:
-    # 'normalized_url', 'original_url', 'title', and 'image_urls'
-    found_pages_data = {} 
-    to_crawl_queue = asyncio.Queue()
+    # found_pages_data stores a compact record per normalized_url, holding the
+    # 'normalized_url', 'original_url', 'title', and 'image_urls' of the page
+    found_pages_data = PageStore()
+    if frontier is None:
+        frontier = CrawlFrontier() # in-memory only
     
-    # Create a copy of rules to pass to _normalize_url, excluding version_preference_order
-    normalize_url_params = {k: v for k, v in rules.items() if k != 'version_preference_order'}
 
-    # Initial setup: Put the start URL into the queue and mark its normalized version as visited.
-    normalized_start_url = _normalize_url(start_url, **normalize_url_params)
-    await to_crawl_queue.put(start_url)
-    visited_or_queued_urls = {normalized_start_url}
-
-    # Define common image extensions for filtering and collection
-    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp')
+    # globs, exclude globs and image extensions compiled once for the whole crawl, only links that pass the
+    # filter are normalized, with the job's Canonicalizer
+    url_filter = UrlFilter(globs, exclude_globs)
+
+    # the queue is a priority queue: shallower pages first, then links matched by a more specific glob, then the
+    # preferred versions (see frontier.crawl_priority), so under max_urls_to_find the most valuable pages are found
+    # first. Links more than max_depth clicks away from the start and seed urls aren't followed
+    version_preference_order = rules.get('version_preference_order', [])
+    def link_priority(url: str, depth: int) -> int:
+        version_rank = 0
+        if version_preference_order:
+            rank, _ = _get_version_rank_and_numeric(url, "view", version_preference_order)
+            version_rank = rank if rank != float('inf') else len(version_preference_order)
+        return crawl_priority(depth, url_filter.specificity(url), version_rank)
+
+    # with a version preference, the ?view= variants of a queued page are grouped and only the best one is loaded,
+    # the next one only when that load fails. The number of navigations avoided is printed
+    variant_groups = None
+    if version_preference_order:
+        variant_groups = VariantGroups(lambda url: _get_version_rank_and_numeric(url, "view", version_preference_order))
+
+    async def queue_url(url: str, normalized_url: str, priority: int) -> None:
+        await frontier.put(url, normalized_url, priority)
+        visited_or_queued_urls.add(normalized_url)
+        if variant_groups is not None:
+            variant_groups.start(normalized_url, url)
+
+    # visited urls are kept as 64 bit fingerprints and found pages as compact PageRecords, bloom_filter_capacity
+    # puts a Bloom filter sized for that many urls in front of the visited lookups. The bytes used per url are
+    # printed at the end of the crawl
+    visited_or_queued_urls = VisitedSet(bloom_capacity=bloom_filter_capacity)
+
+    # a database backed frontier checkpoints the crawl to SQLite, with resume a saved unfinished crawl of the job is
+    # picked up where it stopped. seed_urls (e.g. from the sitemap) are queued next to the start url and
+    # skip_normalized_urls are treated as already visited. With follow_links=False only those are crawled
+    resumed_urls, resumed_pages = frontier.start(start_url, resume)
+    visited_or_queued_urls.update(resumed_urls)
+    del resumed_urls
+    if frontier.resumed:
+        for page in resumed_pages:
+            found_pages_data.put(page)
+            if on_page is not None:
+                # they may have been checkpointed but never made it to the caller before the crash
+                await _call(on_page, page)
+    else:
+        if skip_normalized_urls:
+            visited_or_queued_urls.update(skip_normalized_urls)
+        # Initial setup: Put the start URL (and any seeds) into the queue and mark their normalized versions as visited.
+        for seed_url in [start_url] + (seed_urls or []):
+            normalized_seed_url = canonicalize(seed_url)
+            if normalized_seed_url not in visited_or_queued_urls:
+                await queue_url(seed_url, normalized_seed_url, link_priority(seed_url, 0))
 
     # Lock for protecting access to found_pages_data and visited_or_queued_urls during concurrent updates
     # This is crucial for preventing race conditions with `found_pages_data` accuracy.
     data_access_lock = asyncio.Lock()
 
+    # on_page(page) (a function or coroutine function) gets every page dict as soon as it is processed, including
+    # the pages of a resumed crawl, and again when a more preferred variant of it is found later. With on_page the
+    # content_html isn't kept until the end of the crawl, see also iter_crawl().
+    # pages stored under data_access_lock that still have to go to on_page, see deliver_pages(). They are passed in
+    # the order they were stored but outside the lock, so a slow on_page only holds back the pages after it
+    pending_pages = collections.deque()
+    delivery_lock = asyncio.Lock()
+
+    async def deliver_pages() -> None:
+        """
+        hands the pending pages to on_page in the order they were stored, one worker at a time
+        """
+        async with delivery_lock:
+            while pending_pages:
+                await _call(on_page, pending_pages.popleft())
+
     print(f"       - Starting crawl for: {start_url} with {max_concurrency} concurrent workers.")
     if max_urls_to_find is not None:
         print(f"       - Stopping after {max_urls_to_find} unique URLs are found.")
+    if max_depth is not None:
+        print(f"       - Following links up to {max_depth} clicks deep.")
+    if time_budget_seconds is not None:
+        # then pages in flight finish, the rest of the queue stays on disk and the pages found so far are
+        # returned. frontier.paused tells a paused crawl from a finished one
+        print(f"       - Pausing after {time_budget_seconds / 60:.1f} minutes.")
     print(f"       - Normalization rules: {rules}")
 
-    async def worker(worker_id: int):
-        browser = None
-        context = None
-        page = None
+    # pages are borrowed from the browser pool, so max_concurrency only controls how many urls are in flight and
+    # not how many browsers are running.
+    # only close the pool when we created it, a pool passed in by the caller may be shared with other jobs
+    owns_browser_pool = browser_pool is None
+    if owns_browser_pool:
+        browser_pool = BrowserPool(playwright)
+
+    # every request goes through the rate limiter, which adapts the per host concurrency to how the host responds.
+    # throttled pages (429/503) are put back in the queue up to MAX_THROTTLE_RETRIES times
+    if rate_limiter is None:
+        rate_limiter = HostRateLimiter.from_config(None, max_concurrency)
+    throttle_retries = {} # normalized_url -> times the page was put back after a 429/503
+
+    # when a page loaded in the browser is ready to be read
+    if readiness is None:
+        readiness = ReadinessStrategy('networkidle')
+    print(f"       - Page readiness: {readiness.label}, at most {readiness.timeout_ms} ms")
+
+    # with crawl_engine="http" pages are fetched with a pooled HTTP client and parsed with lxml. A page is only loaded
+    # in the browser when js_fallback_rules say it needs javascript (e.g. container_selector, the site's
+    # parent_element, is missing from the raw HTML), or when the fetch or the parse fails.
+    # with an http_cache (an HttpCache with a SnapshotStore) the body of every page fetched is kept and requested
+    # again with the validators of that fetch. A page that didn't change (304, or the same body) is parsed from the
+    # kept body and its content isn't extracted again, the page keeps what is stored
+    if crawl_engine not in ("browser", "http"):
+        raise ValueError(f"Invalid crawl engine: {crawl_engine}")
+
+    if crawl_engine != "http":
+        # only pages fetched over http are cached
+        http_cache = None
+    if http_cache is not None and http_cache.snapshots is None:
+        raise ValueError("the crawler's http_cache needs a SnapshotStore for the page bodies")
+
+    http_fetcher = None
+    if crawl_engine == "http":
+        http_fetcher = HttpFetcher(max_connections=max_concurrency)
+        print(f"       - Crawl engine: http, falling back to the browser when a page needs javascript")
+        if http_cache is not None:
+            print(f"       - Conditional requests for the pages fetched before, their bodies are kept in {http_cache.snapshots.root}")
+
+    # with extract_content the page content is pulled out in the same navigation that finds the links: the
+    # content_selector (child_element) children of container_selector (parent_element), the same extraction
+    # scrape_to_markdown does. It is returned as 'content_html' on each page, None when the container wasn't found.
+    # pages restored from a resumed crawl have no 'content_html'
+    if extract_content:
+        if not container_selector or not content_selector:
+            raise ValueError("extract_content needs a container_selector and a content_selector")
+        print(f"       - Extracting content during the crawl: '{content_selector}' in '{container_selector}'")
+
+    # with links_in_container only the links inside container_selector are followed, not the header, footer and
+    # table of contents around it. Pages without the container fall back to all their links
+    if links_in_container:
+        if container_selector:
+            print(f"       - Following only the links inside '{container_selector}'")
+        else:
+            print(f"       - No container selector, following all links on the page")
+            links_in_container = False
+
+    # workers run until the frontier has nothing left to hand out and no page is in flight, a worker waiting for a
+    # url while the others are still loading pages stays around for the links they find. Once max_urls_to_find
+    # pages are found the frontier is stopped and the pages in flight finish. worker_gauges (for max_concurrency
+    # workers) shows the active and idle workers, they are also printed every PROGRESS_INTERVAL_SECONDS
+    if worker_gauges is None:
+        worker_gauges = WorkerGauges(max_concurrency)
+
+    # how each page was loaded, printed at the end of the crawl
+    engine_stats = {'http': 0, 'browser': 0, 'browser_fallback': 0, 'skipped_not_html': 0, 'extracted': 0, 'links': 0, 'depth_limited': 0, 'canonical_elsewhere': 0, 'parse_failed': 0}
+    # browser round trips spent reading the rendered pages
+    extraction_stats = ExtractionStats()
+
+    async def load_page_http(request_url: str, normalized_url: str):
+        """
+        returns (title, hrefs, img_srcs, content_html, canonical_url) from a plain HTTP fetch, None if the page has to go to the browser
+        raises ValueError for non html responses, which the browser can't crawl either
+        with the http_cache a page that didn't change is parsed from its kept body, without its content_html
+        """
+        validators = http_cache.get(normalized_url, request_url) if http_cache is not None else None
         try:
-            browser = await playwright.chromium.launch()
-            context = await browser.new_context()
-            page = await context.new_page()
+            async with rate_limiter.slot(request_url) as outcome:
+                response = await http_fetcher.fetch(
+                    request_url,
+                    raise_for_status=False,
+                    headers=HttpCache.conditional_headers(validators)
+                )
+                outcome.status = response.status_code
+                outcome.retry_after = response.headers.get("retry-after")
+            if response.status_code in THROTTLE_STATUSES:
+                # the browser would be throttled just the same
+                raise ThrottledError(f"http status {response.status_code}")
+            if response.status_code != 304 or validators is None:
+                response.raise_for_status()
+        except ThrottledError:
+            raise
+        except Exception as e:
+            if http_cache is not None:
+                http_cache.count('failed')
+            print(f"       - http fetch failed for {request_url}, using the browser: {e}")
+            return None
+
+        body_hash = None
+        cache_outcome = None
+        if response.status_code == 304:
+            cache_outcome = 'not_modified'
+            try:
+                html = await asyncio.to_thread(http_cache.snapshots.get, validators['body_hash'])
+            except OSError as e:
+                http_cache.count('failed')
+                print(f"       - kept body of {request_url} can't be read, using the browser: {e}")
+                return None
+            base_url = request_url
+        else:
+            if not is_html_response(response):
+                engine_stats['skipped_not_html'] += 1
+                raise ValueError(f"not an html page ({response.headers.get('content-type', 'unknown')})")
+            html = response.text
+            base_url = str(response.url)
+            if http_cache is not None:
+                body_hash = HttpCache.body_hash(html)
+                cache_outcome = HttpCache.outcome(validators, response.status_code, body_hash)
+        unchanged = cache_outcome in ('not_modified', 'same_body')
+        if cache_outcome is not None:
+            http_cache.count(cache_outcome)
 
+        try:
+            parsed = parse_html(
+                html,
+                base_url,
+                container_selector,
+                content_selector if extract_content and not unchanged else None,
+                links_in_container
+            )
+        except Exception as e:
+            # an empty body, or XHTML with an <?xml encoding?> declaration lxml won't take as a str
+            engine_stats['parse_failed'] += 1
+            print(f"       - could not parse {request_url}, using the browser: {e}")
+            return None
+        needs_js, reason = needs_javascript(parsed, js_fallback_rules)
+        if needs_js:
+            print(f"       - {request_url} needs javascript ({reason}), using the browser")
+            return None
+
+        if body_hash is not None:
+            # the body is kept for the next crawl's 304s, and its validators recorded
+            try:
+                await asyncio.to_thread(http_cache.snapshots.put, html)
+                http_cache.record(HttpCache.validators_row(normalized_url, request_url, response.headers, body_hash))
+            except OSError as e:
+                print(f"       - could not keep the body of {request_url}: {e}")
+
+        engine_stats['http'] += 1
+        hrefs = parsed.container_hrefs if parsed.container_hrefs is not None else parsed.hrefs
+        return parsed.title, hrefs, parsed.img_srcs, parsed.content_html, parsed.canonical_url
+
+    async def load_page_browser(request_url: str):
+        """
+        returns (title, hrefs, img_srcs, content_html, canonical_url) from a page rendered in a pooled browser page,
+        all read in one round trip once the page is ready
+        """
+        # borrow a page from the shared pool for this one URL
+        async with browser_pool.page() as page:
+            async with rate_limiter.slot(request_url) as outcome:
+                response = await readiness.goto(page, request_url)
+                if response is not None:
+                    outcome.status = response.status
+                    outcome.retry_after = response.headers.get("retry-after")
+            if outcome.status in THROTTLE_STATUSES:
+                raise ThrottledError(f"http status {outcome.status}")
+            # the container's links, or all of them when the page has no container
+            extraction = await extract_page_async(
+                page,
+                container_selector,
+                content_selector if extract_content else None,
+                with_links=True,
+                links_in_container=links_in_container,
+                stats=extraction_stats
+            )
+        return extraction.title, extraction.hrefs, extraction.img_srcs, extraction.content_html, extraction.canonical_url
+
+    async def load_page(request_url: str, normalized_url: str):
+        if http_fetcher is not None:
+            loaded = await load_page_http(request_url, normalized_url)
+            if loaded is not None:
+                return loaded
+            engine_stats['browser_fallback'] += 1
+        else:
+            engine_stats['browser'] += 1
+        return await load_page_browser(request_url)
+
+    def max_urls_found() -> bool:
+        return max_urls_to_find is not None and len(found_pages_data) >= max_urls_to_find
+
+    async def worker(worker_id: int):
+        try:
             while True:
-                try:
-                    request_url = await asyncio.wait_for(to_crawl_queue.get(), timeout=0.5)
-                except asyncio.TimeoutError:
+                worker_gauges.set(worker_id, 'idle')
+                next_url = await frontier.get()
+                if next_url is None:
+                    # nothing queued, nothing in flight that could queue more: the crawl is over
                     break
-
-                try:
-                    # Check early exit after fetching from queue
-                    async with data_access_lock:
-                        if max_urls_to_find is not None and len(found_pages_data) >= max_urls_to_find:
-                            to_crawl_queue.task_done()
-                            continue
-
-                    normalized_request_url = _normalize_url(request_url, **normalize_url_params)
-                    should_process_and_store = True
-
-                    # Check for duplicate/less preferred URLs
-                    async with data_access_lock:
-                        if normalized_request_url in found_pages_data:
-                            stored_page_info = found_pages_data[normalized_request_url]
-                            current_url_comparison_value = _get_version_rank_and_numeric(
-                                request_url, 
-                                "view", 
-                                rules.get('version_preference_order', [])
-                            )
-                            stored_url_comparison_value = _get_version_rank_and_numeric(
-                                stored_page_info['original_url'], 
-                                "view", 
-                                rules.get('version_preference_order', [])
-                            )
-                            if current_url_comparison_value < stored_url_comparison_value:
-                                should_process_and_store = True
-                            else:
-                                should_process_and_store = False  # Skip, stored is preferred
-
-                    if not should_process_and_store:
-                        to_crawl_queue.task_done()
-                        continue
-
-                    try:
-                        await page.goto(request_url, wait_until="networkidle")
-                        page_title = await page.title()
-                        img_srcs = await page.evaluate('Array.from(document.querySelectorAll("img[src]")).map(img => img.src)')
-                        href_img_links = await page.evaluate('Array.from(document.querySelectorAll("a[href]")).map(a => a.href)')
-                        media_links = set(img_srcs) | set(href_img_links)
-                        page_image_urls = []
-                        for link in media_links:
-                            absolute_link = urljoin(request_url, link)
-                            if urlparse(absolute_link).path.lower().endswith(IMAGE_EXTENSIONS):
-                                page_image_urls.append(absolute_link)
-                        page_image_urls = list(set(page_image_urls))  # Deduplicate
-
-                        async with data_access_lock:
-                            found_pages_data[normalized_request_url] = {
-                                'normalized_url': normalized_request_url,
-                                'original_url': request_url,
-                                'title': page_title,
-                                'image_urls': page_image_urls
-                            }
-
-                        # Discover new links and enqueue
-                        hrefs = await page.evaluate('Array.from(document.querySelectorAll("a[href]")).map(a => a.href)')
-                        for href in hrefs:
-                            full_url = urljoin(request_url, href)
-                            if urlparse(full_url).path.lower().endswith(IMAGE_EXTENSIONS):
-                                continue
-                            normalized_link = _normalize_url(full_url, **normalize_url_params)
-                            matched = any(fnmatch.fnmatch(full_url, glob) for glob in globs)
-                            async with data_access_lock:
-                                # Only enqueue new URLs if we haven't reached max_urls_to_find
-                                if (
-                                    matched and
-                                    normalized_link not in visited_or_queued_urls and
-                                    (max_urls_to_find is None or len(found_pages_data) < max_urls_to_find)
-                                ):
-                                    await to_crawl_queue.put(full_url)
-                                    visited_or_queued_urls.add(normalized_link)
-
-                    except Exception as e:
-                        print(f"Worker {worker_id}: error processing {request_url}: {e}")
-
-                    finally:
-                        to_crawl_queue.task_done()
-
-                except Exception as e:
-                    # If any error occurs after get(), mark task done and continue
-                    print(f"Worker {worker_id}: unexpected error after fetching from queue: {e}")
-                    to_crawl_queue.task_done()
-
+                worker_gauges.set(worker_id, 'active')
+                await process_url(worker_id, *next_url)
+
+                if (
+                    time_budget_seconds is not None and
+                    not frontier.paused and
+                    time.time() - start_time > time_budget_seconds
+                ):
+                    print(f"       - Time budget of {time_budget_seconds / 60:.1f} minutes used up, pausing the crawl.")
+                    await frontier.pause()
         finally:
-            if page: await page.close()
-            if context: await context.close()
-            if browser: await browser.close()
-
+            worker_gauges.set(worker_id, None)
 
+    async def process_url(worker_id: int, request_url: str, priority: int):
+        normalized_request_url = None
+        try:
+            normalized_request_url = canonicalize(request_url)
+
+            # Check early exit after fetching from queue
+            async with data_access_lock:
+                if max_urls_found():
+                    if variant_groups is not None:
+                        variant_groups.done(normalized_request_url)
+                    await frontier.task_done(request_url, normalized_request_url)
+                    return
+                if variant_groups is not None:
+                    # a better variant may have been found since the page was queued
+                    request_url = variant_groups.pick(normalized_request_url, request_url)
+
+            should_process_and_store = True
+
+            # Check for duplicate/less preferred URLs
+            async with data_access_lock:
+                if normalized_request_url in found_pages_data:
+                    current_url_comparison_value = _get_version_rank_and_numeric(
+                        request_url, 
+                        "view", 
+                        rules.get('version_preference_order', [])
+                    )
+                    stored_url_comparison_value = _get_version_rank_and_numeric(
+                        found_pages_data.get_original_url(normalized_request_url), 
+                        "view", 
+                        rules.get('version_preference_order', [])
+                    )
+                    if current_url_comparison_value < stored_url_comparison_value:
+                        should_process_and_store = True
+                    else:
+                        should_process_and_store = False  # Skip, stored is preferred
+
+            if not should_process_and_store:
+                if variant_groups is not None:
+                    variant_groups.done(normalized_request_url)
+                await frontier.task_done(request_url, normalized_request_url)
+                return
+
+            completed = True
+            try:
+                # page_slot() is how the scheduler shares a global worker budget between jobs crawling at once
+                async with (page_slot() if page_slot is not None else nullcontext()):
+                    page_title, hrefs, img_srcs, content_html, canonical_url = await load_page(request_url, normalized_request_url)
+
+                # hrefs and img srcs are already absolute (resolved by the browser or parse_html)
+                page_image_urls = [link for link in set(img_srcs) | set(hrefs) if url_filter.is_image(link)]
+
+                # Discover new links, filtered and normalized outside the lock.
+                # dict.fromkeys drops the repeated nav links while keeping the page order
+                engine_stats['links'] += len(hrefs)
+                link_depth = priority_depth(priority) + 1
+                follow = follow_links
+                if follow and max_depth is not None and link_depth > max_depth:
+                    engine_stats['depth_limited'] += 1
+                    follow = False
+                new_links = []
+                for full_url in (dict.fromkeys(hrefs) if follow else []):
+                    if url_filter.matches(full_url):
+                        new_links.append((full_url, canonicalize(full_url)))
+
+                # the page the site says this one is a copy of, the dedupe step (dedupe.py) uses it
+                normalized_canonical_url = canonicalize(canonical_url) if canonical_url else None
+                if normalized_canonical_url is not None and normalized_canonical_url != normalized_request_url:
+                    engine_stats['canonical_elsewhere'] += 1
+
+                async with data_access_lock:
+                    page_data = {
+                        'normalized_url': normalized_request_url,
+                        'original_url': request_url,
+                        'title': page_title,
+                        'image_urls': page_image_urls,
+                        'canonical_url': normalized_canonical_url
+                    }
+                    if extract_content:
+                        # not checkpointed, a resumed page is downloaded the usual way
+                        page_data['content_html'] = content_html
+                        if content_html:
+                            engine_stats['extracted'] += 1
+                    # with on_page the content goes straight to the caller instead of staying in memory
+                    found_pages_data.put(page_data if on_page is None else {**page_data, 'content_html': None})
+                    frontier.record_page(page_data)
+                    if on_page is not None:
+                        # queued under the lock, so the caller sees the variants of a page in the order they were stored
+                        pending_pages.append(page_data)
+                    if variant_groups is not None:
+                        variant_groups.done(normalized_request_url)
+
+                    if max_urls_found():
+                        if not frontier.stopped:
+                            print(f"       - Found {max_urls_to_find} unique URLs, finishing the pages in flight.")
+                            await frontier.stop()
+                        new_links = []
+
+                    # enqueue in one pass under the lock
+                    for full_url, normalized_link in new_links:
+                        if normalized_link not in visited_or_queued_urls:
+                            await queue_url(full_url, normalized_link, link_priority(full_url, link_depth))
+                        elif variant_groups is not None:
+                            # another variant of a queued page, loaded only if it ranks better or the page fails
+                            variant_groups.add(normalized_link, full_url)
+
+                if on_page is not None:
+                    await deliver_pages()
+
+            except ThrottledError as e:
+                retries = throttle_retries.get(normalized_request_url, 0)
+                if retries < MAX_THROTTLE_RETRIES:
+                    # back in the queue, the rate limiter holds the host off until it's ready again
+                    throttle_retries[normalized_request_url] = retries + 1
+                    completed = False
+                    await frontier.put(request_url, normalized_request_url, priority)
+                else:
+                    print(f"Worker {worker_id}: giving up on {request_url} after {retries} throttled retries: {e}")
+
+            except Exception as e:
+                print(f"Worker {worker_id}: error processing {request_url}: {e}")
+                fallback_url = None
+                if variant_groups is not None:
+                    async with data_access_lock:
+                        fallback_url = variant_groups.next_fallback(normalized_request_url)
+                if fallback_url is not None:
+                    # back in the queue with the next best variant, the same way a throttled page is
+                    print(f"Worker {worker_id}: trying variant {fallback_url} instead")
+                    completed = False
+                    await frontier.put(fallback_url, normalized_request_url, priority)
+
+            finally:
+                await frontier.task_done(request_url, normalized_request_url, completed)
+
+        except Exception as e:
+            # If any error occurs after get(), mark task done and continue
+            print(f"Worker {worker_id}: unexpected error after fetching from queue: {e}")
+            await frontier.task_done(request_url, normalized_request_url or request_url)
+
+    async def print_progress():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+            print(
+                f"       - {start_url}: {worker_gauges.active} workers active, {worker_gauges.idle} idle, "
+                f"{len(found_pages_data)} pages found, {frontier.qsize()} urls queued, "
+                f"{worker_gauges.utilisation():.0%} utilisation."
+            )
 
     # Create and start the worker tasks
     workers = [asyncio.create_task(worker(i)) for i in range(max_concurrency)]
-    
+    progress_task = asyncio.create_task(print_progress())
+
     # Wait until all URLs in the queue have been processed by the workers.
-    # This will naturally stop when the queue is empty AND all tasks put into it are marked done.
-    await to_crawl_queue.join() 
-    
-    # Cancel any worker tasks that are still running (e.g., waiting for new items).
-    # This is a cleanup step after the queue has been processed.
-    for w in workers:
-        #if not w.done():
-        w.cancel()
-    
-    # Gather all worker tasks to ensure they finish their cleanup (e.g., browser closing)
-    # and to retrieve any exceptions.
+    # This will naturally stop when the queue is empty AND all tasks put into it are marked done,
+    # or when the crawl is paused or stopped and the pages in flight are done.
+    try:
+        await frontier.join()
+    except asyncio.CancelledError:
+        # Ctrl-C: save what we have, the run stays 'running' so it can be picked up with --resume
+        frontier.checkpoint()
+        for w in workers:
+            w.cancel()
+        raise
+    finally:
+        progress_task.cancel()
+
+    # the frontier now hands out None to every worker, they exit by themselves.
+    # Gather them to retrieve any exceptions.
     results = await asyncio.gather(*workers, return_exceptions=True)
 
     # Iterate through results to "retrieve" any exceptions and prevent "Future exception was never retrieved" warnings.
@@ -290,17 +641,69 @@ async def run_crawler(
             # Log any other truly unexpected exceptions
             print(f"       - Unexpected exception in gathered task: {result}")
 
+    if on_page is not None:
+        # pages stored by a worker that failed before it delivered them
+        await deliver_pages()
+
+    frontier.finish()
+
+    worker_gauges.print_stats()
+    rate_limiter.print_stats()
+    readiness.print_stats()
+    if variant_groups is not None:
+        variant_groups.print_stats()
+    browser_pool.print_stats()
+    if owns_browser_pool:
+        await browser_pool.close()
+    if http_fetcher is not None:
+        await http_fetcher.close()
+    if http_cache is not None:
+        http_cache.flush()
+
     end_time = time.time()
     total_crawl_duration = end_time - start_time
     minutes = int(total_crawl_duration // 60)
     seconds = total_crawl_duration % 60
 
-    print(f"       - Crawl finished for {start_url}. Found {len(found_pages_data)} unique base links.")
-    print(f"       - Total crawl time: {minutes} minutes {seconds:.2f} seconds.") 
+    if frontier.paused:
+        print(f"       - Crawl paused for {start_url}. Found {len(found_pages_data)} unique base links so far, {frontier.qsize()} urls left to crawl.")
+    else:
+        print(f"       - Crawl finished for {start_url}. Found {len(found_pages_data)} unique base links.")
+    print(f"       - Total crawl time: {minutes} minutes {seconds:.2f} seconds.")
+    if total_crawl_duration > 0:
+        print(f"       - Pages per second: {len(found_pages_data) / total_crawl_duration:.2f}")
+    print(
+        f"       - Pages loaded over http: {engine_stats['http']}, in the browser: {engine_stats['browser']}, "
+        f"browser fallbacks: {engine_stats['browser_fallback']}, non html skipped: {engine_stats['skipped_not_html']}"
+        + (f", not parsed over http: {engine_stats['parse_failed']}" if engine_stats['parse_failed'] else "")
+    )
+    if extract_content:
+        print(f"       - Pages with content extracted during the crawl: {engine_stats['extracted']}")
+    extraction_stats.print_stats()
+    if http_cache is not None:
+        http_cache.print_stats()
+    canonical = cache_stats()
+    print(f"       - Url canonicalization cache: {canonical['hits']} hits, {canonical['misses']} misses, {canonical['size']} urls cached")
+    pages_loaded = engine_stats['http'] + engine_stats['browser'] + engine_stats['browser_fallback']
+    if pages_loaded > 0:
+        print(
+            f"       - Candidate links per page: {engine_stats['links'] / pages_loaded:.1f}"
+            + (f", pages not followed past max_depth: {engine_stats['depth_limited']}" if max_depth is not None else "")
+        )
+        print(f"       - Pages with a canonical url pointing to another page: {engine_stats['canonical_elsewhere']}")
+    if len(visited_or_queued_urls) > 0:
+        visited_bytes = visited_or_queued_urls.nbytes
+        pages_bytes = found_pages_data.nbytes
+        print(
+            f"       - Crawl state: {len(visited_or_queued_urls)} urls seen, {(visited_bytes + pages_bytes) / 1024 / 1024:.1f} MB, "
+            f"{(visited_bytes + pages_bytes) / len(visited_or_queued_urls):.1f} bytes per url "
+            f"(visited set {visited_bytes / len(visited_or_queued_urls):.1f}, "
+            f"pages {pages_bytes / max(1, len(found_pages_data)):.1f} bytes per page)"
+        )
     
     # Return the collected data as a list of dictionaries.
     # Apply max_urls_to_find limit to the *returned* pages if set.
-    sorted_pages = sorted(found_pages_data.values(), key=lambda page: page['normalized_url'])
+    sorted_pages = found_pages_data.pages()
     if max_urls_to_find is not None:
         sorted_pages = sorted_pages[:max_urls_to_find]
 
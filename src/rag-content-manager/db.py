@@ -1,11 +1,16 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import hashlib
 import json
+import os
 import re
 import sqlite3
 import textwrap
+import time
 from urllib.parse import urlparse
 
+# the sqlite journal modes SITES_DB_JOURNAL_MODE can set
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'WAL')
+
 class DatabaseManager:
     def __init__(self, db_file):
         self.db_file = db_file
@@ -14,39 +19,221 @@ class DatabaseManager:
         self.site_parent_element = None
         self.site_child_element = None
         self.site_name = None
+        self.site_ready_strategy = None
+        self.site_ready_value = None
+        self.site_ready_timeout_ms = None
         self._site_config_set = False
         try:
-            self.conn = sqlite3.connect(db_file)
+            # several processes may share the db (see work_queue.py), wait for their locks instead of failing
+            self.conn = sqlite3.connect(db_file, timeout=30)
             self.conn.row_factory = sqlite3.Row
+            # the db keeps sqlite's default rollback journal, which works for processes on several hosts sharing
+            # the file over the network. SITES_DB_JOURNAL_MODE=WAL lets the downloader read pages while a crawl on
+            # the same host is still writing them, but WAL needs shared memory (one host only) and a copy of the
+            # db then needs its -wal file. The mode sticks to the file, DELETE switches a db back
+            journal_mode = os.getenv("SITES_DB_JOURNAL_MODE")
+            if journal_mode:
+                if journal_mode.upper() not in JOURNAL_MODES:
+                    raise ValueError(f"SITES_DB_JOURNAL_MODE must be one of {', '.join(JOURNAL_MODES)}, not {journal_mode}")
+                self.conn.execute(f"PRAGMA journal_mode={journal_mode.upper()}")
             self.cursor = self.conn.cursor()
+            self.create_tables()
         except sqlite3.Error as e:
             print(f"database error: {e}")
     
     @property
     def site_config_set(self):
         return self._site_config_set
+
+    def create_tables(self) -> None:
+        """
+        creates the working tables that were added after the original schema (see db/tables.sql)
+        safe to run on every start
+        """
+        images_existed = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'"
+        ).fetchone() is not None
+
+        self.conn.executescript(
+            """
+                CREATE TABLE IF NOT EXISTS crawl_runs (
+                    job TEXT NOT NULL PRIMARY KEY,
+                    start_url TEXT,
+                    status TEXT,
+                    started DATETIME,
+                    last_update DATETIME
+                );
+
+                CREATE TABLE IF NOT EXISTS crawl_frontier (
+                    job TEXT NOT NULL,
+                    normalized_url TEXT NOT NULL,
+                    url TEXT,
+                    state TEXT,
+                    seq INTEGER,
+                    priority INTEGER DEFAULT 0,
+                    PRIMARY KEY (job, normalized_url)
+                );
+                CREATE INDEX IF NOT EXISTS crawl_frontier_state_IDX ON crawl_frontier (job, state, seq);
+
+                CREATE TABLE IF NOT EXISTS crawl_found_pages (
+                    job TEXT NOT NULL,
+                    normalized_url TEXT NOT NULL,
+                    original_url TEXT,
+                    title TEXT,
+                    image_urls TEXT,
+                    PRIMARY KEY (job, normalized_url)
+                );
+
+                CREATE TABLE IF NOT EXISTS work_queue (
+                    queue TEXT NOT NULL,
+                    item_key TEXT NOT NULL,
+                    payload TEXT,
+                    state TEXT NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER DEFAULT 0,
+                    priority INTEGER DEFAULT 0,
+                    last_update DATETIME,
+                    PRIMARY KEY (queue, item_key)
+                );
+                CREATE INDEX IF NOT EXISTS work_queue_state_IDX ON work_queue (queue, state, lease_expires);
+
+                CREATE TABLE IF NOT EXISTS images (
+                    image_id INTEGER PRIMARY KEY,
+                    url_hash INTEGER NOT NULL UNIQUE,
+                    url TEXT NOT NULL,
+                    first_seen DATETIME
+                );
+
+                CREATE TABLE IF NOT EXISTS page_images (
+                    page_id INTEGER NOT NULL,
+                    image_id INTEGER NOT NULL,
+                    PRIMARY KEY (page_id, image_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS page_images_image_IDX ON page_images (image_id);
+
+                CREATE TABLE IF NOT EXISTS page_snapshots (
+                    url_hash INTEGER NOT NULL,
+                    fetched_at DATETIME NOT NULL,
+                    url TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    PRIMARY KEY (url_hash, fetched_at)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS http_validators (
+                    url_hash INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    normalized_url TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body_hash TEXT,
+                    checked_at DATETIME,
+                    PRIMARY KEY (url_hash, source)
+                ) WITHOUT ROWID;
+            """
+        )
+
+        # columns added to existing tables, sqlite has no ADD COLUMN IF NOT EXISTS
+        added_columns = {
+            'sites': [
+                ('ready_strategy', 'TEXT'),
+                ('ready_value', 'TEXT'),
+                ('ready_timeout_ms', 'INTEGER')
+            ],
+            'crawl_frontier': [
+                ('priority', 'INTEGER DEFAULT 0')
+            ],
+            'work_queue': [
+                ('priority', 'INTEGER DEFAULT 0')
+            ],
+            'pages': [
+                ('attempts', 'INTEGER DEFAULT 0'),
+                ('next_attempt', 'DATETIME'),
+                ('last_error', 'TEXT'),
+                ('canonical_url', 'TEXT'),
+                ('duplicate_of', 'INTEGER'),
+                ('revalidate', 'INTEGER DEFAULT 0')
+            ]
+        }
+        for table, columns in added_columns.items():
+            existing = {row['name'] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                # table doesn't exist (yet), it comes from db/tables.sql
+                continue
+            for column, column_type in columns:
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+        # indexes on the added columns, once they exist
+        self.conn.executescript(
+            """
+                CREATE INDEX IF NOT EXISTS crawl_frontier_priority_IDX ON crawl_frontier (job, state, priority, seq);
+                CREATE INDEX IF NOT EXISTS work_queue_priority_IDX ON work_queue (queue, state, priority);
+            """
+        )
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pages'").fetchone() is not None:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS pages_retry_IDX ON pages (status, next_attempt)")
+        self.conn.commit()
+
+        if not images_existed:
+            self.migrate_page_images()
     
-    def insert_site(self, base_url: str, parent_element: str, child_element: str, name: str) -> None:
+    def insert_site(
+            self,
+            base_url: str,
+            parent_element: str,
+            child_element: str,
+            name: str,
+            ready_strategy: str = None,
+            ready_value: str = None,
+            ready_timeout_ms: int = None) -> None:
         """
         Inserts a single site into the sites table
+        ready_strategy/ready_value/ready_timeout_ms control when a page of the site counts as loaded, see readiness.py
         """
         try:
             parameters = (
                 base_url,
                 parent_element,
                 child_element,
-                name
+                name,
+                ready_strategy,
+                ready_value,
+                ready_timeout_ms
             )
             self.cursor.execute(
                 """
-                    INSERT INTO sites (base_url, parent_element, child_element, name)
-                    VALUES (?, ?, ?, ?)
+                    INSERT INTO sites (base_url, parent_element, child_element, name, ready_strategy, ready_value, ready_timeout_ms)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                 """, parameters
             )
         except sqlite3.IntegrityError:
             self.conn.rollback()
             print(f"an entry for site: {name} already exists - skipping")
 
+    def get_site_config(self, url: str) -> sqlite3.Row:
+        """
+        returns the sites row for the requested URL's base_url, or None if there is none.
+        unlike set_site_config this doesn't change the current site config, so jobs running at the same time
+        can each hold on to their own
+        """
+        base_url = urlparse(url).netloc
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT site_id, base_url, parent_element, child_element, name,
+                           ready_strategy, ready_value, ready_timeout_ms
+                    FROM sites
+                    WHERE base_url = ?;
+                """, (base_url,)
+            )
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return None
+
     def set_site_config(self, url: str) -> None:
         """
         retrieves the site configuration for the requested URL
@@ -56,29 +243,21 @@ class DatabaseManager:
         base_url = api_url.netloc
         #print(f"setting base_url to: {base_url}")
         if self.site_base_url is not None or self.site_base_url != base_url:
-            try:
-                cursor = self.conn.cursor()
-                cursor.execute(
-                    """
-                        SELECT site_id, base_url, parent_element, child_element, name 
-                        FROM sites
-                        WHERE base_url = ?;
-                    """, (base_url,)
-                )
-                results = cursor.fetchone()
-                #print(f"retrieved base_url for site: {results['name']}")
-                if results:
-                    self.site_id = results["site_id"]
-                    self.site_base_url = base_url
-                    self.site_parent_element = results['parent_element']
-                    self.site_child_element = results['child_element']
-                    self.site_name = results['name']
-                    self._site_config_set = True
-                    return True
-                else:
-                    raise ValueError(f"Invalid Site Configuration: base_url: {base_url} not found")
-            except sqlite3.Error as e:
-                print(f"database error: {e}")
+            results = self.get_site_config(url)
+            #print(f"retrieved base_url for site: {results['name']}")
+            if results:
+                self.site_id = results["site_id"]
+                self.site_base_url = base_url
+                self.site_parent_element = results['parent_element']
+                self.site_child_element = results['child_element']
+                self.site_name = results['name']
+                self.site_ready_strategy = results['ready_strategy']
+                self.site_ready_value = results['ready_value']
+                self.site_ready_timeout_ms = results['ready_timeout_ms']
+                self._site_config_set = True
+                return True
+            else:
+                raise ValueError(f"Invalid Site Configuration: base_url: {base_url} not found")
 
     def set_foreign_keys(self, state):
         state = state.lower()
@@ -96,6 +275,7 @@ class DatabaseManager:
             base_url: {self.site_base_url}
             parent_element: {self.site_parent_element}
             parent_element: {self.site_child_element}
+            ready_strategy: {self.site_ready_strategy} {self.site_ready_value or ""} {self.site_ready_timeout_ms or ""}
             ID: {self.site_id}
         """
         print(textwrap.dedent(site_config))
@@ -113,6 +293,58 @@ class DatabaseManager:
         return title
 
 
+    # inserts a page, or updates the crawl data of an existing page
+    # content (extracted during the crawl) only changes the status when its hash changed
+    # the page's images go to the images / page_images tables, see _link_page_images
+    # a canonical_url is kept when the page is crawled again without one (a resumed crawl)
+    _upsert_page_sql = """
+        INSERT INTO pages 
+        (site_id, normalized_url, original_url, title, status, job, tags, workspaces, last_update, content, content_hash, canonical_url) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (normalized_url) DO UPDATE SET
+            original_url = excluded.original_url,
+            title = excluded.title,
+            job = excluded.job,
+            tags = excluded.tags,
+            workspaces = excluded.workspaces,
+            last_update = excluded.last_update,
+            status = CASE
+                WHEN excluded.content_hash IS NOT NULL AND excluded.content_hash IS NOT pages.content_hash THEN excluded.status
+                ELSE pages.status
+            END,
+            content = COALESCE(excluded.content, pages.content),
+            content_hash = COALESCE(excluded.content_hash, pages.content_hash),
+            canonical_url = COALESCE(excluded.canonical_url, pages.canonical_url)
+    """
+
+    def _page_parameters(
+            self,
+            site_id: int,
+            normalized_url: str,
+            original_url: str,
+            title: str,
+            status: str,
+            job: str,
+            tags: list,
+            workspaces: str,
+            content: str,
+            last_update: str,
+            canonical_url: str = None) -> tuple:
+        return (
+            site_id,
+            normalized_url,
+            original_url,
+            self.generate_title(title),
+            status,
+            job,
+            json.dumps(tags),
+            workspaces,
+            last_update,
+            content,
+            self.content_hash(content) if content is not None else None,
+            canonical_url
+        )
+
     def insert_new_page(
             self, 
             normalized_url: str, 
@@ -122,9 +354,13 @@ class DatabaseManager:
             job: str = "", 
             tags: list = [],
             workspaces: str = "",
-            image_urls: list = []) -> None:
+            image_urls: list = [],
+            content: str = None,
+            canonical_url: str = None) -> None:
         """
         Inserts a page into the pages table
+        with content (extracted during the crawl) the page is stored with its content_hash, and an existing
+        page only has its status changed to `status` when the content changed
         """
         if self._site_config_set == False:
             print("You must set the site config before attempting to insert a page!")
@@ -134,36 +370,254 @@ class DatabaseManager:
             now = datetime.now()
             sqlite_datetime_str = now.strftime('%Y-%m-%d %H:%M:%S')
 
-            parameters = (
-                self.site_id,
-                normalized_url,
-                original_url,
-                self.generate_title(title),
-                status,
-                job,
-                json.dumps(tags),
-                workspaces,
-                sqlite_datetime_str,
-                json.dumps(image_urls)
+            parameters = self._page_parameters(
+                self.site_id, normalized_url, original_url, title, status, job,
+                tags, workspaces, content, sqlite_datetime_str, canonical_url
             )
-            self.cursor.execute(
-                """
-                    INSERT INTO pages 
-                    (site_id, normalized_url, original_url, title, status, job, tags, workspaces, last_update, image_urls) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT (normalized_url) DO UPDATE SET
-                        title = excluded.title,
-                        job = excluded.job,
-                        tags = excluded.tags,
-                        workspaces = excluded.workspaces,
-                        last_update = excluded.last_update,
-                        image_urls = excluded.image_urls
-                """, parameters
+            self.cursor.execute(self._upsert_page_sql, parameters)
+            page_ids = self._page_ids(self.cursor, [normalized_url])
+            self._link_page_images(self.cursor, {page_ids[normalized_url]: image_urls}, sqlite_datetime_str)
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def insert_pages(self, site_id: int, job: str, tags: list, workspaces: str, pages: list[dict]) -> bool:
+        """
+        Inserts a batch of crawled pages for one job in a single transaction and commits it.
+        Each page is a dict with normalized_url, original_url, title, image_urls, and optionally
+        content, status (default 'new', 'scraped' when content is set) and canonical_url.
+        Takes the site_id explicitly instead of using the current site config.
+        uses a seperate cursor to not interfere with any other DB operations
+        """
+        try:
+            now = datetime.now()
+            sqlite_datetime_str = now.strftime('%Y-%m-%d %H:%M:%S')
+            rows = [
+                self._page_parameters(
+                    site_id,
+                    page['normalized_url'],
+                    page['original_url'],
+                    page['title'],
+                    page.get('status', 'scraped' if page.get('content') is not None else 'new'),
+                    job,
+                    tags,
+                    workspaces,
+                    page.get('content'),
+                    sqlite_datetime_str,
+                    page.get('canonical_url')
+                )
+                for page in pages
+            ]
+            cursor = self.conn.cursor()
+            cursor.executemany(self._upsert_page_sql, rows)
+            page_ids = self._page_ids(cursor, [page['normalized_url'] for page in pages])
+            self._link_page_images(
+                cursor,
+                {page_ids[page['normalized_url']]: page['image_urls'] for page in pages},
+                sqlite_datetime_str
             )
+            # we have to commit since it's a seperate cursor
+            self.conn.commit()
+            return True
         except sqlite3.Error as e:
             self.conn.rollback()
             print(f"database error: {e}")
+            return False
     
+    @staticmethod
+    def url_hash(url: str) -> int:
+        """
+        a signed 64 bit hash of a url, fits an sqlite INTEGER key
+        """
+        return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+    @staticmethod
+    def image_url_hash(url: str) -> int:
+        """
+        the images table key of an image url, a url_hash.
+        page_images links the small image_id instead, it's stored twice per link (table and index)
+        """
+        return DatabaseManager.url_hash(url)
+
+    def _page_ids(self, cursor: sqlite3.Cursor, normalized_urls: list[str]) -> dict:
+        """
+        returns {normalized_url: page_id} for the given pages
+        """
+        page_ids = {}
+        for start in range(0, len(normalized_urls), 500):
+            chunk = normalized_urls[start:start + 500]
+            cursor.execute(
+                f"SELECT page_id, normalized_url FROM pages WHERE normalized_url IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            page_ids.update((row['normalized_url'], row['page_id']) for row in cursor.fetchall())
+        return page_ids
+
+    def _link_page_images(self, cursor: sqlite3.Cursor, page_images: dict, last_update: str) -> None:
+        """
+        stores {page_id: [image urls]}: new image urls go to the images table once, and each page's links in
+        page_images are brought in line with its list. Unchanged links aren't written again.
+        runs on the caller's cursor and transaction, the caller commits
+        """
+        images = {} # url_hash -> url
+        page_hashes = {} # page_id -> url hashes
+        for page_id, image_urls in page_images.items():
+            hashes = set()
+            for url in image_urls or []:
+                url_hash = self.image_url_hash(url)
+                images[url_hash] = url
+                hashes.add(url_hash)
+            page_hashes[page_id] = hashes
+
+        cursor.executemany(
+            "INSERT OR IGNORE INTO images (url_hash, url, first_seen) VALUES (?, ?, ?)",
+            [(url_hash, url, last_update) for url_hash, url in images.items()]
+        )
+        image_ids = {} # url_hash -> image_id
+        url_hashes = list(images)
+        for start in range(0, len(url_hashes), 500):
+            chunk = url_hashes[start:start + 500]
+            cursor.execute(
+                f"SELECT image_id, url_hash FROM images WHERE url_hash IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            image_ids.update((row['url_hash'], row['image_id']) for row in cursor.fetchall())
+        links = {page_id: {image_ids[url_hash] for url_hash in hashes} for page_id, hashes in page_hashes.items()}
+
+        existing = {page_id: set() for page_id in links}
+        page_ids = list(links)
+        for start in range(0, len(page_ids), 500):
+            chunk = page_ids[start:start + 500]
+            cursor.execute(
+                f"SELECT page_id, image_id FROM page_images WHERE page_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                existing[row['page_id']].add(row['image_id'])
+
+        cursor.executemany(
+            "DELETE FROM page_images WHERE page_id = ? AND image_id = ?",
+            [(page_id, image_id) for page_id, ids in links.items() for image_id in existing[page_id] - ids]
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO page_images (page_id, image_id) VALUES (?, ?)",
+            [(page_id, image_id) for page_id, ids in links.items() for image_id in ids - existing[page_id]]
+        )
+
+    def migrate_page_images(self) -> None:
+        """
+        moves the image_urls json arrays of existing pages into the images / page_images tables, runs once when
+        the images table is created. The database file only shrinks after a VACUUM
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT page_id, image_urls FROM pages WHERE image_urls IS NOT NULL")
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for start in range(0, len(rows), 1000):
+                self._link_page_images(
+                    cursor,
+                    {row['page_id']: json.loads(row['image_urls'] or "[]") for row in rows[start:start + 1000]},
+                    now
+                )
+            cursor.execute("UPDATE pages SET image_urls = NULL WHERE image_urls IS NOT NULL")
+            self.conn.commit()
+            counts = self.get_image_counts()
+            print(f"moved the image urls of {len(rows)} pages to the images table: {counts['images']} images, {counts['links']} page links. Run VACUUM to shrink the db file")
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def get_page_images(self, page_id: int) -> list[str]:
+        """
+        returns the image urls of a page
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT images.url
+                    FROM page_images
+                    JOIN images ON images.image_id = page_images.image_id
+                    WHERE page_images.page_id = ?
+                    ORDER BY images.url
+                """, (page_id,)
+            )
+            return [row['url'] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return []
+
+    def get_image_pages(self, url: str) -> list[sqlite3.Row]:
+        """
+        returns page_id, normalized_url and job of every page showing an image
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT pages.page_id, pages.normalized_url, pages.job
+                    FROM images
+                    JOIN page_images ON page_images.image_id = images.image_id
+                    JOIN pages ON pages.page_id = page_images.page_id
+                    WHERE images.url_hash = ?
+                    ORDER BY pages.normalized_url
+                """, (self.image_url_hash(url),)
+            )
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return []
+
+    def get_images(self, job: str = None) -> sqlite3.Cursor:
+        """
+        returns an iterable cursor over image_id, url and the number of pages showing the image,
+        for all images or the images on a job's pages, most used first
+        """
+        try:
+            cursor = self.conn.cursor()
+            if job is not None:
+                cursor.execute(
+                    """
+                        SELECT images.image_id, images.url, COUNT(*) AS pages
+                        FROM page_images
+                        JOIN images ON images.image_id = page_images.image_id
+                        JOIN pages ON pages.page_id = page_images.page_id
+                        WHERE pages.job = ?
+                        GROUP BY images.image_id
+                        ORDER BY pages DESC, images.url
+                    """, (job,)
+                )
+            else:
+                cursor.execute(
+                    """
+                        SELECT images.image_id, images.url, COUNT(page_images.page_id) AS pages
+                        FROM images
+                        LEFT JOIN page_images ON page_images.image_id = images.image_id
+                        GROUP BY images.image_id
+                        ORDER BY pages DESC, images.url
+                    """
+                )
+            return cursor
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return None
+
+    def get_image_counts(self) -> dict:
+        """
+        returns {'images': distinct image urls, 'links': page to image links}
+        """
+        try:
+            cursor = self.conn.cursor()
+            images = cursor.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            links = cursor.execute("SELECT COUNT(*) FROM page_images").fetchone()[0]
+            return {'images': images, 'links': links}
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return {'images': 0, 'links': 0}
+
     def update_page(self, page_id: int, content: str, status: str = "complete") -> None:
         """
         Updates a page into the pages table
@@ -197,6 +651,297 @@ class DatabaseManager:
             print(f"database error: {e}")
             return None
     
+    def update_pages(self, pages: list[tuple[int, str, str]]) -> bool:
+        """
+        update_page for a batch of (page_id, content, status), written in one transaction
+        a page with content None only gets its status, its content didn't change since it was last downloaded
+        the revalidate flag (see set_pages_status) is cleared, unless the page is to be retried
+        """
+        try:
+            sqlite_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    UPDATE pages
+                    SET content=?, content_hash=?, status=?, last_update=?, revalidate=0
+                    WHERE page_id=?;
+                """,
+                [
+                    (content, self.content_hash(content), status, sqlite_datetime_str, page_id)
+                    for page_id, content, status in pages if content is not None
+                ]
+            )
+            cursor.executemany(
+                """
+                    UPDATE pages
+                    SET status=?, revalidate=CASE WHEN ? = 'retry' THEN revalidate ELSE 0 END
+                    WHERE page_id=?;
+                """,
+                [(status, status, page_id) for page_id, content, status in pages if content is None]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return False
+
+    def add_page_snapshots(self, snapshots: list[tuple[str, str, str]]) -> bool:
+        """
+        records (normalized_url, fetched_at, content_hash) of the DOM snapshots saved in the SnapshotStore
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    INSERT OR REPLACE INTO page_snapshots (url_hash, fetched_at, url, content_hash)
+                    VALUES (?, ?, ?, ?)
+                """,
+                [(self.url_hash(url), fetched_at, url, content_hash) for url, fetched_at, content_hash in snapshots]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return False
+
+    def prune_page_snapshots(self, keep: int) -> int:
+        """
+        deletes the page_snapshots rows of every url but its `keep` most recent ones, returns how many were deleted
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    DELETE FROM page_snapshots
+                    WHERE (url_hash, fetched_at) IN (
+                        SELECT url_hash, fetched_at
+                        FROM (
+                            SELECT url_hash, fetched_at, ROW_NUMBER() OVER (PARTITION BY url_hash ORDER BY fetched_at DESC) AS age
+                            FROM page_snapshots
+                        )
+                        WHERE age > ?
+                    )
+                """, (keep,)
+            )
+            deleted = cursor.rowcount
+            self.conn.commit()
+            return deleted
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return 0
+
+    def get_snapshot_hashes(self, validators_source: str) -> set:
+        """
+        the content hashes of the SnapshotStore files still in use: the page snapshots, and the page bodies the
+        crawler's conditional requests need (the body_hash of the http_validators of `validators_source`).
+        None on a database error, so nothing is removed
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT content_hash FROM page_snapshots
+                    UNION
+                    SELECT body_hash FROM http_validators WHERE source = ? AND body_hash IS NOT NULL
+                """, (validators_source,)
+            )
+            return {row[0] for row in cursor}
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return None
+
+    def get_latest_page_snapshots(self, normalized_urls: list[str]) -> dict:
+        """
+        returns {normalized_url: content_hash} of the most recent snapshot of each url that has one
+        """
+        by_hash = {self.url_hash(url): url for url in normalized_urls}
+        url_hashes = list(by_hash)
+        snapshots = {}
+        try:
+            cursor = self.conn.cursor()
+            for start in range(0, len(url_hashes), 500):
+                chunk = url_hashes[start:start + 500]
+                # sqlite returns the content_hash of the row with the MAX(fetched_at)
+                cursor.execute(
+                    f"""
+                        SELECT url_hash, content_hash, MAX(fetched_at) AS fetched_at
+                        FROM page_snapshots
+                        WHERE url_hash IN ({','.join('?' * len(chunk))})
+                        GROUP BY url_hash
+                    """, chunk
+                )
+                for row in cursor.fetchall():
+                    snapshots[by_hash[row['url_hash']]] = row['content_hash']
+            return snapshots
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return {}
+
+    def record_page_attempts(self, attempts: list[tuple[int, int, str, str]]) -> bool:
+        """
+        stores the (page_id, attempts, next_attempt, last_error) of downloads, see retry_policy.RetryPolicy
+        a page downloaded fine is passed as (page_id, 0, None, None)
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    UPDATE pages
+                    SET attempts=?, next_attempt=?, last_error=?
+                    WHERE page_id=?;
+                """, [(count, next_attempt, last_error, page_id) for page_id, count, next_attempt, last_error in attempts]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return False
+
+    def get_due_retries(self, job: str = None) -> list[sqlite3.Row]:
+        """
+        the pages in 'retry' status whose next attempt is due, the longest waiting first
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                    SELECT page_id, normalized_url, job, attempts, next_attempt, last_error
+                    FROM pages
+                    WHERE status = 'retry' AND next_attempt <= ? {'AND job = ?' if job else ''}
+                    ORDER BY next_attempt
+                """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),) + ((job,) if job else ())
+            )
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return []
+
+    def get_retry_counts(self, job: str = None) -> dict:
+        """
+        returns {'waiting': pages in 'retry' status, 'due': those due now, 'next_attempt': the earliest next attempt}
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                    SELECT count(*) AS waiting, sum(next_attempt <= ?) AS due, min(next_attempt) AS next_attempt
+                    FROM pages
+                    WHERE status = 'retry' {'AND job = ?' if job else ''}
+                """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),) + ((job,) if job else ())
+            )
+            row = cursor.fetchone()
+            return {'waiting': row['waiting'], 'due': row['due'] or 0, 'next_attempt': row['next_attempt']}
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return {'waiting': 0, 'due': 0, 'next_attempt': None}
+
+    def get_dedupe_pages(self, job: str) -> sqlite3.Cursor:
+        """
+        an iterable cursor over the pages of a job with content that are, or could be, uploaded:
+        'scraped', 'uploaded' and the ones already marked 'duplicate', see dedupe.py
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT page_id, normalized_url, canonical_url, content, status, duplicate_of
+                    FROM pages
+                    WHERE job = ? AND status IN ('scraped', 'uploaded', 'duplicate') AND content IS NOT NULL AND content != ''
+                    ORDER BY page_id
+                """, (job,)
+            )
+            return cursor
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return []
+
+    def set_duplicates(self, pages: list[tuple[int, int, str]]) -> bool:
+        """
+        stores the (page_id, duplicate_of, status) the dedupe step decided on, duplicate_of is None for a page that
+        isn't a duplicate (any more)
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    UPDATE pages
+                    SET duplicate_of=?, status=?
+                    WHERE page_id=?;
+                """, [(duplicate_of, status, page_id) for page_id, duplicate_of, status in pages]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return False
+
+    def get_http_validators(self, normalized_url: str, source: str) -> sqlite3.Row:
+        """
+        returns the http_validators row of a url for the crawler ('crawl') or the downloader ('download'), or None
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT normalized_url, url, etag, last_modified, body_hash, checked_at
+                    FROM http_validators
+                    WHERE url_hash = ? AND source = ?
+                """, (self.url_hash(normalized_url), source)
+            )
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return None
+
+    def set_http_validators(self, source: str, validators: list[tuple[str, str, str, str, str]]) -> bool:
+        """
+        stores the (normalized_url, url, etag, last_modified, body_hash) of the last response of each url
+        """
+        try:
+            sqlite_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    INSERT OR REPLACE INTO http_validators
+                    (url_hash, source, normalized_url, url, etag, last_modified, body_hash, checked_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (self.url_hash(normalized_url), source, normalized_url, url, etag, last_modified, body_hash, sqlite_datetime_str)
+                    for normalized_url, url, etag, last_modified, body_hash in validators
+                ]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return False
+
+    def get_downloaded_pages(self, job: str = None) -> list[sqlite3.Row]:
+        """
+        the pages the downloader scraped ('scraped' and 'uploaded'), without their content. Duplicates, retries
+        and errors keep the status they were given
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                    SELECT page_id, normalized_url, original_url, title, content_hash, status, job, tags
+                    FROM pages
+                    WHERE status IN ('scraped', 'uploaded') {'AND job = ?' if job else ''}
+                    ORDER BY normalized_url
+                """, (job,) if job else ()
+            )
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return []
     def get_pages_count(self, status: str = None, job: str = None) -> int:
         """
         returns the count for all pages mathing job (or all jobs).
@@ -307,6 +1052,43 @@ class DatabaseManager:
             print(f"database error: {e}")
             return None
         
+    def get_pages_last_update(self, job: str) -> dict:
+        """
+        returns a dict of normalized_url -> last_update for all pages of a job
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT normalized_url, last_update
+                    FROM pages
+                    WHERE job = ?
+                """, (job,)
+            )
+            return {row['normalized_url']: row['last_update'] for row in cursor}
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return {}
+
+    def set_pages_status(self, normalized_urls: list[str], status: str, revalidate: bool = False) -> None:
+        """
+        sets the status for a list of pages, e.g. back to 'new' when the sitemap says they changed.
+        with revalidate the downloader first asks the site whether the page really changed (a conditional
+        request, see http_cache.py), a page set back to 'new' any other way is always downloaded again
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    UPDATE pages
+                    SET status = ?, revalidate = ?
+                    WHERE normalized_url = ?
+                """, [(status, int(revalidate), url) for url in normalized_urls]
+            )
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
     def update_uploaded_page(self, page_id: int, status: str, uploaded_hash: str) -> None:
         """
         set the complete flag for a specific page_id
@@ -400,6 +1182,398 @@ class DatabaseManager:
             return None
 
 
+    def get_crawl_run(self, job: str) -> sqlite3.Row:
+        """
+        returns the crawl_runs row for a job (status is running, paused or complete), None if it never ran with a frontier
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT job, start_url, status, started, last_update
+                    FROM crawl_runs
+                    WHERE job = ?
+                """, (job,)
+            )
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return None
+
+    def set_crawl_run(self, job: str, start_url: str, status: str, new_run: bool = False) -> None:
+        """
+        records the state of a job's crawl. new_run resets the start time
+        """
+        try:
+            now = datetime.now()
+            sqlite_datetime_str = now.strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    INSERT INTO crawl_runs (job, start_url, status, started, last_update)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (job) DO UPDATE SET
+                        start_url = COALESCE(excluded.start_url, crawl_runs.start_url),
+                        status = excluded.status,
+                        started = CASE WHEN ? THEN excluded.started ELSE crawl_runs.started END,
+                        last_update = excluded.last_update
+                """, (job, start_url, status, sqlite_datetime_str, sqlite_datetime_str, new_run)
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def save_frontier_checkpoint(self, job: str, frontier_rows: list[tuple], found_pages: list[dict]) -> bool:
+        """
+        writes frontier changes and found pages for a job in one transaction
+        frontier_rows are (normalized_url, url, state, seq, priority) tuples, an existing row only has its state updated
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    INSERT INTO crawl_frontier (job, normalized_url, url, state, seq, priority)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (job, normalized_url) DO UPDATE SET
+                        state = excluded.state
+                """, [(job, *row) for row in frontier_rows]
+            )
+            cursor.executemany(
+                """
+                    INSERT INTO crawl_found_pages (job, normalized_url, original_url, title, image_urls)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (job, normalized_url) DO UPDATE SET
+                        original_url = excluded.original_url,
+                        title = excluded.title,
+                        image_urls = excluded.image_urls
+                """, [
+                    (job, p['normalized_url'], p['original_url'], p['title'], json.dumps(p['image_urls']))
+                    for p in found_pages
+                ]
+            )
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return False
+
+    def pop_spilled_frontier_urls(self, job: str, limit: int) -> list[tuple]:
+        """
+        moves the best spilled frontier urls (lowest priority, then oldest) back to the queued state
+        and returns them as (url, normalized_url, priority)
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT normalized_url, url, priority
+                    FROM crawl_frontier
+                    WHERE job = ? AND state = 'spilled'
+                    ORDER BY priority, seq
+                    LIMIT ?
+                """, (job, limit)
+            )
+            rows = cursor.fetchall()
+            cursor.executemany(
+                """
+                    UPDATE crawl_frontier SET state = 'queued'
+                    WHERE job = ? AND normalized_url = ?
+                """, [(job, row['normalized_url']) for row in rows]
+            )
+            self.conn.commit()
+            return [(row['url'], row['normalized_url'], row['priority'] or 0) for row in rows]
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return []
+
+    def load_frontier(self, job: str) -> tuple[set, int, int, list[dict]]:
+        """
+        loads a job's saved frontier for a resume. every url that was queued or in flight is marked as spilled,
+        so it is read back in order as the queue drains.
+        returns (visited normalized urls, number of spilled urls, highest queue sequence number, found pages)
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    UPDATE crawl_frontier SET state = 'spilled'
+                    WHERE job = ? AND state = 'queued'
+                """, (job,)
+            )
+            self.conn.commit()
+
+            cursor.execute("SELECT normalized_url, state, seq FROM crawl_frontier WHERE job = ?", (job,))
+            visited = set()
+            spilled = 0
+            max_seq = 0
+            for row in cursor:
+                visited.add(row['normalized_url'])
+                if row['state'] == 'spilled':
+                    spilled += 1
+                max_seq = max(max_seq, row['seq'] or 0)
+
+            cursor.execute(
+                """
+                    SELECT normalized_url, original_url, title, image_urls
+                    FROM crawl_found_pages
+                    WHERE job = ?
+                """, (job,)
+            )
+            found_pages = [
+                {
+                    'normalized_url': row['normalized_url'],
+                    'original_url': row['original_url'],
+                    'title': row['title'],
+                    'image_urls': json.loads(row['image_urls'] or "[]")
+                }
+                for row in cursor
+            ]
+            return visited, spilled, max_seq, found_pages
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return set(), 0, 0, []
+
+    def clear_frontier(self, job: str) -> None:
+        """
+        removes a job's saved frontier and found pages
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM crawl_frontier WHERE job = ?", (job,))
+            cursor.execute("DELETE FROM crawl_found_pages WHERE job = ?", (job,))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def enqueue_work(self, queue: str, items: list[tuple[str, str, int]], requeue_finished: bool = False) -> None:
+        """
+        adds (item_key, payload, priority) items to a work queue. items already in the queue are left alone,
+        unless requeue_finished is set and they are done or failed, then they are pending again
+        """
+        try:
+            now = datetime.now()
+            sqlite_datetime_str = now.strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    INSERT INTO work_queue (queue, item_key, payload, state, attempts, priority, last_update)
+                    VALUES (?, ?, ?, 'pending', 0, ?, ?)
+                    ON CONFLICT (queue, item_key) DO UPDATE SET
+                        payload = excluded.payload,
+                        priority = excluded.priority,
+                        state = 'pending',
+                        lease_owner = NULL,
+                        lease_expires = NULL,
+                        attempts = 0,
+                        last_update = excluded.last_update
+                    WHERE ? AND work_queue.state IN ('done', 'failed')
+                """, [(queue, key, payload, priority, sqlite_datetime_str, requeue_finished) for key, payload, priority in items]
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def claim_work(self, queue: str, owner: str, limit: int, lease_seconds: float) -> tuple[list[sqlite3.Row], int]:
+        """
+        leases up to `limit` pending items of a queue to `owner` for `lease_seconds`, lowest priority first, then oldest.
+        leases that expired (their owner died or hung) are put back to pending first.
+        both happen in one write transaction, so processes claiming at the same time get disjoint items.
+        returns (claimed rows with item_key, payload, attempts, priority; number of expired leases reclaimed)
+        """
+        try:
+            now = time.time()
+            sqlite_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    UPDATE work_queue
+                    SET state = 'pending', lease_owner = NULL, lease_expires = NULL
+                    WHERE queue = ? AND state = 'leased' AND lease_expires < ?
+                """, (queue, now)
+            )
+            reclaimed = cursor.rowcount
+            cursor.execute(
+                """
+                    UPDATE work_queue
+                    SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, last_update = ?
+                    WHERE rowid IN (
+                        SELECT rowid FROM work_queue
+                        WHERE queue = ? AND state = 'pending'
+                        ORDER BY priority, rowid
+                        LIMIT ?
+                    )
+                    RETURNING item_key, payload, attempts, priority
+                """, (owner, now + lease_seconds, sqlite_datetime_str, queue, limit)
+            )
+            rows = cursor.fetchall()
+            self.conn.commit()
+            return rows, reclaimed
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return [], 0
+
+    def heartbeat_work(self, queue: str, owner: str, item_keys: list[str], lease_seconds: float) -> set:
+        """
+        extends owner's leases on the items, returns the keys whose lease was lost (expired and claimed by someone else)
+        """
+        try:
+            cursor = self.conn.cursor()
+            lost = set()
+            expires = time.time() + lease_seconds
+            for key in item_keys:
+                cursor.execute(
+                    """
+                        UPDATE work_queue
+                        SET lease_expires = ?
+                        WHERE queue = ? AND item_key = ? AND lease_owner = ? AND state = 'leased'
+                    """, (expires, queue, key, owner)
+                )
+                if cursor.rowcount == 0:
+                    lost.add(key)
+            self.conn.commit()
+            return lost
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return set()
+
+    def finish_work(self, queue: str, owner: str, item_keys: list[str], state: str, payloads: dict = None) -> None:
+        """
+        ends owner's leases on the items with state 'done', 'failed' or 'pending' (handed back).
+        `payloads` maps item_key -> a new payload for the item, the others keep theirs.
+        an item whose lease was taken over by another owner is left to them
+        """
+        payloads = payloads or {}
+        try:
+            sqlite_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                """
+                    UPDATE work_queue
+                    SET state = ?, payload = COALESCE(?, payload), lease_owner = NULL, lease_expires = NULL, last_update = ?
+                    WHERE queue = ? AND item_key = ? AND lease_owner = ?
+                """, [(state, payloads.get(key), sqlite_datetime_str, queue, key, owner) for key in item_keys]
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def get_work_counts(self, queue: str) -> dict:
+        """
+        returns {state: count} for a queue, leases that already expired are counted as 'expired'
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT CASE WHEN state = 'leased' AND lease_expires < ? THEN 'expired' ELSE state END AS state,
+                           COUNT(*) AS count
+                    FROM work_queue
+                    WHERE queue = ?
+                    GROUP BY 1
+                """, (time.time(), queue)
+            )
+            return {row['state']: row['count'] for row in cursor}
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return {}
+
+    def start_shared_crawl_run(
+            self, job: str, start_url: str, queue: str, owner: str, resume: bool, active_seconds: float) -> tuple[str, sqlite3.Row]:
+        """
+        starts a job's crawl run on the work queue `queue`, or joins the one that's there, in one write transaction so
+        processes started at the same time agree on it. A running run is joined when other owners hold unexpired
+        leases on the queue or it started less than `active_seconds` ago, with resume a paused or unfinished one too.
+        Anything else starts a new run, which clears the queue.
+        returns ('joined' or 'new', the crawl_runs row before), (None, None) on a database error
+        """
+        try:
+            now = datetime.now()
+            sqlite_datetime_str = now.strftime('%Y-%m-%d %H:%M:%S')
+            active_since = (now - timedelta(seconds=active_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+            if self.conn.in_transaction:
+                self.conn.commit()
+            cursor = self.conn.cursor()
+            # takes the write lock before reading, a second process waits here until the first one decided
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                """
+                    SELECT job, start_url, status, started, last_update
+                    FROM crawl_runs
+                    WHERE job = ?
+                """, (job,)
+            )
+            run = cursor.fetchone()
+            cursor.execute(
+                """
+                    SELECT count(*) AS leases
+                    FROM work_queue
+                    WHERE queue = ? AND state = 'leased' AND lease_expires >= ? AND lease_owner != ?
+                """, (queue, time.time(), owner)
+            )
+            live_leases = cursor.fetchone()['leases']
+            active = run is not None and run['status'] == 'running' and (live_leases > 0 or (run['started'] or '') >= active_since)
+            if active or (resume and run is not None and run['status'] in ('running', 'paused')):
+                action = 'joined'
+                cursor.execute(
+                    "UPDATE crawl_runs SET status = 'running', last_update = ? WHERE job = ?",
+                    (sqlite_datetime_str, job)
+                )
+            else:
+                action = 'new'
+                cursor.execute("DELETE FROM work_queue WHERE queue = ?", (queue,))
+                cursor.execute(
+                    """
+                        INSERT INTO crawl_runs (job, start_url, status, started, last_update)
+                        VALUES (?, ?, 'running', ?, ?)
+                        ON CONFLICT (job) DO UPDATE SET
+                            start_url = excluded.start_url,
+                            status = excluded.status,
+                            started = excluded.started,
+                            last_update = excluded.last_update
+                    """, (job, start_url, sqlite_datetime_str, sqlite_datetime_str)
+                )
+            self.conn.commit()
+            return action, run
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+            return None, None
+
+    def clear_work_queue(self, queue: str) -> None:
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM work_queue WHERE queue = ?", (queue,))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"database error: {e}")
+
+    def get_page(self, page_id: int) -> sqlite3.Row:
+        """
+        returns a single page by its page_id, None if it doesn't exist
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                    SELECT page_id, normalized_url, original_url, title, content, content_hash, uploaded_hash, status, job, tags, workspaces, last_update, attempts, revalidate
+                    FROM pages
+                    WHERE page_id = ?
+                """, (page_id,)
+            )
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"database error: {e}")
+            return None
+
     def commit(self) -> bool:
         try:
             self.conn.commit()
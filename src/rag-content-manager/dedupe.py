@@ -0,0 +1,244 @@
+import hashlib
+import re
+import time
+import numpy as np
+from typing import Callable
+from db import DatabaseManager
+
+# pages whose SimHash signatures differ in at most this many of their 64 bits are near-duplicates: about 1% of
+# the words changed moves 4-7 bits, unrelated pages sharing a lot of boilerplate stay 10 or more apart
+DEFAULT_THRESHOLD = 6
+
+# words per shingle
+SHINGLE_WORDS = 3
+
+# pages with fewer shingles than this (stubs, "this page has moved") are too short to compare
+MIN_SHINGLES = 20
+
+# pages whose signatures are computed together
+SIGNATURE_BATCH = 256
+# cells of the distance matrix compared at once, the rows per batch shrink as a job has more distinct signatures
+# (32 MB of xors)
+COMPARE_CELLS = 1 << 22
+
+# rough characters per token of the embedding model, for the report
+CHARS_PER_TOKEN = 4
+
+# the YAML metadata header html_to_markdown writes, it has the page's own url and title
+_METADATA = re.compile(r'\A\s*---.*?---', re.DOTALL)
+# markdown link targets, the same link carries ?view= or a localized path on each variant of a page
+_LINK_TARGETS = re.compile(r'\]\([^)]*\)')
+_WORDS = re.compile(r'\w+')
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    the splitmix64 finalizer over an array of uint64, spreads every input bit over all 64 output bits
+    """
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+def shingle_hashes(markdown: str, word_ids: dict) -> np.ndarray:
+    """
+    the 64 bit hashes of the SHINGLE_WORDS word shingles of a page's markdown, without the metadata header and
+    the link targets. `word_ids` caches the hash of every word seen, share it between the pages of a job
+    """
+    text = _LINK_TARGETS.sub(']', _METADATA.sub('', markdown, count=1))
+    words = _WORDS.findall(text.lower())
+    shingles = len(words) - SHINGLE_WORDS + 1
+    if shingles < MIN_SHINGLES:
+        return np.empty(0, dtype=np.uint64)
+
+    ids = []
+    for word in words:
+        word_id = word_ids.get(word)
+        if word_id is None:
+            word_id = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+            word_ids[word] = word_id
+        ids.append(word_id)
+    ids = np.array(ids, dtype=np.uint64)
+
+    hashes = ids[:shingles]
+    for offset in range(1, SHINGLE_WORDS):
+        hashes = _mix(hashes) ^ ids[offset:offset + shingles]
+    return _mix(hashes)
+
+def simhashes(pages: list[np.ndarray]) -> np.ndarray:
+    """
+    the 64 bit SimHash of each page from its shingle_hashes(), all pages at once: the bits of every shingle of
+    every page are unpacked into one (64, shingles) matrix and counted per page with np.add.reduceat. A bit of
+    the signature is set when it is set in more than half of the page's shingles. Pages must have at least one
+    shingle.
+    """
+    lengths = np.array([len(hashes) for hashes in pages], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    hashes = np.concatenate(pages).astype('<u8', copy=False)
+    # bit major, so each bit's counts are summed over contiguous memory (about 4x faster than shingle major)
+    byte_rows = np.ascontiguousarray(hashes.view(np.uint8).reshape(-1, 8).T)
+    bits = np.unpackbits(byte_rows, axis=0, bitorder='little')
+    counts = np.add.reduceat(bits, offsets, axis=1, dtype=np.int32)
+    signature_bytes = np.packbits(counts * 2 > lengths, axis=0, bitorder='little')
+    return np.ascontiguousarray(signature_bytes.T).view('<u8').ravel()
+
+def signature_neighbours(signatures: np.ndarray, threshold: int) -> tuple[np.ndarray, list[list[int]]]:
+    """
+    returns (inverse, neighbours): the index of each signature among the distinct ones, and for each distinct
+    signature the distinct ones at most `threshold` bits from it, itself included. The distinct signatures are
+    compared a batch of rows at a time with xor and a popcount, at most COMPARE_CELLS at once
+    """
+    unique, inverse = np.unique(signatures, return_inverse=True)
+    neighbours = [[] for _ in range(len(unique))]
+    batch_rows = max(1, COMPARE_CELLS // max(1, len(unique)))
+    for start in range(0, len(unique), batch_rows):
+        distances = np.bitwise_count(unique[start:start + batch_rows, None] ^ unique[None, :])
+        rows, columns = np.nonzero(distances <= threshold)
+        for row, column in zip((rows + start).tolist(), columns.tolist()):
+            neighbours[row].append(column)
+    return inverse, neighbours
+
+def dedupe_job(db: DatabaseManager, job: str, threshold: int = DEFAULT_THRESHOLD, canonicalize: Callable = None) -> dict:
+    """
+    Marks the pages of a job that carry the same content as another page of the job as 'duplicate', with the
+    page_id of the page that is kept in duplicate_of, so upload skips them.
+
+    Pages linked by <link rel=canonical> (recorded by the crawler), directly or through other pages, are one
+    group, of which only one page is kept. So are pages whose urls are the same under `canonicalize` (the job's
+    current url normalization rules, pages stored before the rules changed). Near-duplicates aren't grouped that way: a chain of pages that each
+    differ a little from the next can end far from where it started (sibling API reference pages). Instead the
+    pages are visited best first, and a page that isn't a duplicate yet is kept and marks the pages whose SimHash
+    signature is at most `threshold` bits from its own (?view= variants, localized mirrors). So every near-duplicate
+    is close to the page it is a duplicate of.
+
+    The best pages are canonical targets, then pages already uploaded, then the ones with the shortest url.
+    Pages marked before that aren't duplicates any more go back to 'scraped'. Returns the counts for the report.
+    """
+    if not 0 <= threshold <= 64:
+        raise ValueError(f"the SimHash threshold is a number of bits from 0 to 64, not {threshold}")
+    start_time = time.perf_counter()
+    stats = {
+        'pages': 0, 'short': 0, 'groups': 0, 'canonical': 0, 'same_url': 0, 'near': 0, 'chars': 0, 'total_chars': 0,
+        'uploaded': 0, 'restored': 0, 'seconds': 0.0
+    }
+
+    pages = [] # the pages without their content
+    signatures = []
+    signed = [] # index in pages of each signature
+    batch = []
+    word_ids = {}
+    for row in db.get_dedupe_pages(job):
+        hashes = shingle_hashes(row['content'], word_ids)
+        if len(hashes):
+            signed.append(len(pages))
+            batch.append(hashes)
+            if len(batch) >= SIGNATURE_BATCH:
+                signatures.append(simhashes(batch))
+                batch = []
+        pages.append({
+            'page_id': row['page_id'],
+            'normalized_url': row['normalized_url'],
+            'canonical_url': row['canonical_url'],
+            'status': row['status'],
+            'duplicate_of': row['duplicate_of'],
+            'chars': len(row['content'])
+        })
+    if batch:
+        signatures.append(simhashes(batch))
+    stats['pages'] = len(pages)
+    stats['short'] = len(pages) - len(signed)
+    stats['total_chars'] = sum(page['chars'] for page in pages)
+
+    parents = list(range(len(pages)))
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(a: int, b: int) -> None:
+        a, b = find(a), find(b)
+        if a != b:
+            parents[max(a, b)] = min(a, b)
+
+    by_url = {page['normalized_url']: index for index, page in enumerate(pages)}
+    canonical_targets = set()
+    points_to_canonical = set()
+    for index, page in enumerate(pages):
+        target = by_url.get(page['canonical_url'])
+        if target is not None and target != index:
+            union(index, target)
+            canonical_targets.add(target)
+            points_to_canonical.add(index)
+
+    same_url = set()
+    if canonicalize is not None:
+        first_by_url = {}
+        for index, page in enumerate(pages):
+            first = first_by_url.setdefault(canonicalize(page['normalized_url']), index)
+            if first != index:
+                union(first, index)
+                same_url.update((first, index))
+
+    def rank(index: int) -> tuple:
+        return (
+            index not in canonical_targets,
+            pages[index]['status'] != 'uploaded',
+            len(pages[index]['normalized_url']),
+            pages[index]['page_id']
+        )
+
+    duplicate_of = [None] * len(pages)
+    reasons = [None] * len(pages) # the stats key a duplicate is counted under
+    canonical_groups = {}
+    for index in range(len(pages)):
+        canonical_groups.setdefault(find(index), []).append(index)
+    for members in canonical_groups.values():
+        if len(members) > 1:
+            keeper = min(members, key=rank)
+            for index in members:
+                if index != keeper:
+                    duplicate_of[index] = pages[keeper]['page_id']
+                    reasons[index] = 'same_url' if index in same_url and index not in points_to_canonical else 'canonical'
+
+    if signatures:
+        inverse, neighbours = signature_neighbours(np.concatenate(signatures), threshold)
+        signature_of = dict(zip(signed, inverse.tolist()))
+        # the pages left after the canonical groups, by distinct signature
+        by_signature = [[] for _ in range(len(neighbours))]
+        for index in signed:
+            if duplicate_of[index] is None:
+                by_signature[signature_of[index]].append(index)
+        kept = set()
+        for index in sorted(signed, key=rank):
+            if duplicate_of[index] is not None:
+                continue
+            kept.add(index)
+            for neighbour in neighbours[signature_of[index]]:
+                for other in by_signature[neighbour]:
+                    if other not in kept and duplicate_of[other] is None:
+                        duplicate_of[other] = pages[index]['page_id']
+                        reasons[other] = 'near'
+
+    stats['groups'] = len({page_id for page_id in duplicate_of if page_id is not None})
+
+    updates = []
+    for index, page in enumerate(pages):
+        if duplicate_of[index] is not None:
+            status = 'duplicate'
+            stats[reasons[index]] += 1
+            stats['chars'] += page['chars']
+            if page['status'] == 'uploaded':
+                stats['uploaded'] += 1
+        elif page['status'] == 'duplicate':
+            status = 'scraped'
+            stats['restored'] += 1
+        else:
+            status = page['status']
+        if (duplicate_of[index], status) != (page['duplicate_of'], page['status']):
+            updates.append((page['page_id'], duplicate_of[index], status))
+
+    if updates:
+        db.set_duplicates(updates)
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
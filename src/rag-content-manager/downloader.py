@@ -0,0 +1,574 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from datetime import datetime
+from urllib.parse import urlparse
+from playwright.async_api import Playwright
+from db import DatabaseManager
+from browser_pool import BrowserPool
+from request_blocking import RequestBlocker
+from rate_limiter import HostRateLimiter
+from readiness import ReadinessStrategy
+from work_queue import WorkQueue
+from snapshot_store import SnapshotStore
+from get_web_markdown import scrape_page_html_async, html_to_markdown, ExtractionStats
+from http_fetcher import HttpFetcher, parse_html
+from http_cache import HttpCache, DOWNLOAD
+from retry_policy import RetryPolicy, PageFailure, classify_failure, PERMANENT
+
+# downloaded pages that may wait for the db writer before the download workers have to wait for it
+DEFAULT_MAX_PENDING_WRITES = 50
+# pages written per transaction
+DEFAULT_WRITE_BATCH = 20
+
+
+class StageStats:
+    """
+    pages through one stage of the download pipeline (browser, convert, write) and the seconds spent on them
+    """
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.pages = 0
+        self.seconds = 0.0
+
+    def add(self, seconds: float, pages: int = 1) -> None:
+        self.pages += pages
+        self.seconds += seconds
+
+    def print_stats(self, wall_seconds: float) -> None:
+        if self.pages == 0 or wall_seconds <= 0:
+            return
+        print(
+            f"    - {self.name} stage: {self.pages} pages, {self.seconds / self.pages * 1000:.0f} ms per page, "
+            f"{self.pages / wall_seconds:.2f} pages per second, busy {self.seconds / (self.workers * wall_seconds):.0%} of the time "
+            f"with {self.workers} worker{'s' if self.workers != 1 else ''}"
+        )
+
+
+def _convert(html_content: str, title: str, url: str, base_url: str, tags, job: str) -> tuple[str, float]:
+    # runs in a MarkdownConverter process
+    start = time.perf_counter()
+    markdown = html_to_markdown(html_content, title, url, base_url, tags, job)
+    return markdown, time.perf_counter() - start
+
+
+class MarkdownConverter:
+    """
+    Runs html_to_markdown (html2text and the link rewriting) in a ProcessPoolExecutor with `processes` worker
+    processes, all cores by default, so converting big pages neither blocks the event loop nor holds a browser page.
+
+    At most `max_pending` conversions (twice the processes by default) are queued, submit() waits for a free slot
+    so the raw html of pages waiting to be converted doesn't pile up in memory.
+    """
+    def __init__(self, processes: int = None, max_pending: int = None):
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self._slots = asyncio.Semaphore(max_pending or self.processes * 2)
+        self._executor = None
+        self.stats = StageStats('convert', self.processes)
+
+    def __enter__(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._executor.shutdown(cancel_futures=exc_type is not None)
+
+    async def submit(self, html_content: str, title: str, url: str, base_url: str, tags, job: str) -> asyncio.Future:
+        """
+        starts the conversion of a page, returns a future of its markdown
+        """
+        await self._slots.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, _convert, html_content, title, url, base_url, tags, job
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: asyncio.Future) -> None:
+        self._slots.release()
+        if not future.cancelled() and future.exception() is None:
+            self.stats.add(future.result()[1])
+
+
+class SiteConfigCache:
+    """
+    The sites rows and their ReadinessStrategy by base_url, read from the db once per site instead of once per page.
+    Unlike DatabaseManager.set_site_config it doesn't change the db's current site config, so pages of different
+    sites can be downloaded at the same time. A site that isn't configured is cached as None.
+    """
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self._sites = {} # base_url -> (site, readiness)
+
+    def get(self, url: str) -> tuple:
+        """
+        returns (site, readiness) for the url's base_url, (None, None) if the site isn't configured
+        """
+        base_url = urlparse(url).netloc
+        if base_url not in self._sites:
+            site = self.db.get_site_config(url)
+            readiness = None
+            if site is not None:
+                readiness = ReadinessStrategy.from_site_config(site, default='domcontentloaded')
+            self._sites[base_url] = (site, readiness)
+        return self._sites[base_url]
+
+    def print_stats(self) -> None:
+        for site, readiness in self._sites.values():
+            if readiness is not None:
+                readiness.print_stats()
+
+
+class PageWriter:
+    """
+    Writes downloaded pages to the pages table from a single task, up to `batch_size` pages per transaction.
+
+    At most `max_pending` pages wait to be written: add() holds the download workers back when the writer falls
+    behind, so memory stays bounded and SQLite only ever sees one writer. A page is completed in its work queue
+    once its row is committed, a failed write hands it back to the queue. The pages' snapshots are recorded in
+    the same batch, their http validators and download attempts once the pages are written.
+    """
+    def __init__(self, db: DatabaseManager, max_pending: int = DEFAULT_MAX_PENDING_WRITES, batch_size: int = DEFAULT_WRITE_BATCH):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self._queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self._task = None
+        self.stats = {'scraped': 0, 'error': 0, 'retry': 0, 'unchanged': 0, 'batches': 0, 'failed_batches': 0}
+        self.stage = StageStats('write', 1)
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._write_batches())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self._task.done():
+            # everything added so far is written before the writer stops
+            await self._queue.put(None)
+        await self._task
+
+    async def add(
+        self,
+        queue: WorkQueue,
+        item_key: str,
+        page_id: int,
+        content: str,
+        status: str,
+        snapshot: tuple = None,
+        validators: tuple = None,
+        attempt: tuple = None
+    ) -> None:
+        """
+        queues a page's result, `snapshot` is its (normalized_url, fetched_at, content_hash) in the SnapshotStore,
+        `validators` its HttpCache.validators_row() and `attempt` its (attempts, next_attempt, last_error).
+        content None only sets the status, the stored content stays
+        """
+        await self._queue.put((queue, item_key, page_id, content, status, snapshot, validators, attempt))
+
+    async def _write_batches(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            finished = batch[-1] is None
+            if finished:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            if finished:
+                return
+
+    def _write(self, batch: list[tuple]) -> None:
+        start = time.perf_counter()
+        snapshots = [snapshot for _, _, _, _, _, snapshot, _, _ in batch if snapshot is not None]
+        if snapshots:
+            self.db.add_page_snapshots(snapshots)
+        written = self.db.update_pages([(page_id, content, status) for _, _, page_id, content, status, _, _, _ in batch])
+        validators = [row for _, _, _, _, _, _, row, _ in batch if row is not None]
+        if written and validators:
+            # only once the content they describe is stored
+            self.db.set_http_validators(DOWNLOAD, validators)
+        attempts = [(page_id, *attempt) for _, _, page_id, _, _, _, _, attempt in batch if attempt is not None]
+        if written and attempts:
+            self.db.record_page_attempts(attempts)
+        by_queue = {}
+        for queue, item_key, page_id, content, status, _, _, _ in batch:
+            by_queue.setdefault(queue, []).append(item_key)
+            if written:
+                self.stats['unchanged' if content is None and status == "scraped" else status] += 1
+        for queue, item_keys in by_queue.items():
+            if written:
+                queue.complete(*item_keys)
+            else:
+                queue.release(*item_keys)
+        self.stats['batches' if written else 'failed_batches'] += 1
+        self.stage.add(time.perf_counter() - start, len(batch))
+
+    def print_stats(self) -> None:
+        print(
+            f"    - {self.stats['scraped']} pages scraped, {self.stats['error']} errors, "
+            + (f"{self.stats['retry']} to be retried, " if self.stats['retry'] else "")
+            + (f"{self.stats['unchanged']} not changed since their last download, " if self.stats['unchanged'] else "")
+            + f"written in {self.stats['batches']} batches"
+            + (f", {self.stats['failed_batches']} batches failed and were handed back to the queue" if self.stats['failed_batches'] else "")
+        )
+
+
+class Downloader:
+    """
+    Downloads the content of 'new' pages with `concurrency` pages loading at the same time, in three stages:
+      - browser: pages are borrowed from long lived browsers (a BrowserPool per blocking profile, sized by the
+        job's browser_pool_size / max_navigations_per_page like the crawler's) and their content html is extracted
+      - convert: the html goes to a MarkdownConverter with `processes` processes, the browser worker moves on
+        to its next page straight away
+      - write: the markdown goes through a PageWriter
+    Site configs are cached per site. The throughput of every stage is printed by print_stats().
+
+    With a `snapshots` store the rendered DOM of every page is saved as well (compressed in a thread while the
+    page is converted), see reextract_pages().
+
+    With an `http_cache` (source DOWNLOAD) a page that was downloaded before is first requested over http with the
+    validators of its last download. If it didn't change (304, or the same body) it isn't loaded in the browser nor
+    converted, only its status goes back to 'scraped'. The validators of the pages' responses are recorded.
+
+    A page ends up 'scraped' with its markdown. A failed download is classified (retry_policy.classify_failure):
+    transient failures (timeouts, 5xx, a closed browser) put the page in 'retry', keeping its content, with a next
+    attempt from the `retry_policy`. Permanent ones (404, no site config, no content on the page) and pages out of
+    attempts end up 'error' with empty content.
+
+        async with Downloader(db, playwright, job_configs, concurrency=8) as downloader:
+            await downloader.run(queue)
+    """
+    def __init__(
+        self,
+        db: DatabaseManager,
+        playwright: Playwright,
+        job_configs: dict,
+        rate_limiter: HostRateLimiter = None,
+        concurrency: int = 8,
+        max_pending_writes: int = DEFAULT_MAX_PENDING_WRITES,
+        write_batch: int = DEFAULT_WRITE_BATCH,
+        processes: int = None,
+        snapshots: SnapshotStore = None,
+        http_cache: HttpCache = None,
+        retry_policy: RetryPolicy = None
+    ):
+        self.db = db
+        self.playwright = playwright
+        self.job_configs = job_configs
+        self.rate_limiter = rate_limiter or HostRateLimiter.from_config(None, concurrency)
+        self.concurrency = max(1, concurrency)
+        self.sites = SiteConfigCache(db)
+        self.writer = PageWriter(db, max_pending_writes, write_batch)
+        self.converter = MarkdownConverter(processes)
+        self.browser_stage = StageStats('browser', self.concurrency)
+        self._conversions = set() # tasks waiting for a conversion to hand it to the writer
+        self.snapshots = snapshots
+        self.http_cache = http_cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.failure_stats = {'retry': 0, 'gave_up': 0, 'permanent': 0, 'reasons': {}}
+        self.http_fetcher = None # for the conditional requests, opened with the downloader
+        self.snapshot_stats = {'saved': 0, 'unchanged': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+
+        self._stack = AsyncExitStack()
+        self._browser_pools = {} # blocking profile -> BrowserPool
+        self.request_blockers = {} # blocking profile -> RequestBlocker
+        self.stats = {'pages': 0, 'skipped': 0, 'seconds': 0.0}
+        self.extraction_stats = ExtractionStats()
+
+    async def __aenter__(self):
+        await self._stack.__aenter__()
+        await self._stack.enter_async_context(self.writer)
+        self._stack.enter_context(self.converter)
+        if self.http_cache is not None:
+            self.http_fetcher = await self._stack.enter_async_context(HttpFetcher(max_connections=self.concurrency))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # the browser pools close first, then the converter processes, then the writer flushes what is left
+        await self._stack.__aexit__(exc_type, exc, tb)
+
+    async def _browser_pool(self, job_name: str) -> BrowserPool:
+        job = self.job_configs.get(job_name, {})
+        profile = job.get('blocking_profile', 'none')
+        if profile not in self._browser_pools:
+            self.request_blockers[profile] = RequestBlocker(profile)
+            self._browser_pools[profile] = await self._stack.enter_async_context(BrowserPool(
+                self.playwright,
+                size=job.get('browser_pool_size', 1),
+                max_navigations_per_page=job.get('max_navigations_per_page', 50),
+                max_rss_mb=job.get('max_browser_rss_mb', None),
+                request_blocker=self.request_blockers[profile]
+            ))
+        return self._browser_pools[profile]
+
+    async def download_page(self, queue: WorkQueue, item_key: str, page) -> None:
+        """
+        retrieves the core content html of a page and hands it to the converter, the markdown goes to the
+        writer once it is converted. Failed pages go to the writer straight away
+        """
+        site, readiness = self.sites.get(page['normalized_url'])
+        if site is None:
+            print(f"Error Encountered: Invalid Site Configuration: base_url: {urlparse(page['normalized_url']).netloc} not found")
+            await self._failed(queue, item_key, page, PageFailure("no site config"))
+            return
+
+        if self.http_cache is not None and await self._unchanged(page):
+            # no navigation, no conversion, the stored content stays
+            await self.writer.add(queue, item_key, page['page_id'], None, "scraped", attempt=self._succeeded(page))
+            return
+
+        start = time.perf_counter()
+        try:
+            browser_pool = await self._browser_pool(page['job'])
+            async with browser_pool.page() as browser_page:
+                scraped = await scrape_page_html_async(
+                    browser_page,
+                    page['original_url'],
+                    site['parent_element'],
+                    site['child_element'],
+                    rate_limiter=self.rate_limiter,
+                    readiness=readiness,
+                    with_dom=self.snapshots is not None,
+                    stats=self.extraction_stats,
+                    with_validators=self.http_cache is not None
+                )
+            self.browser_stage.add(time.perf_counter() - start)
+        except Exception as e:
+            print(f"An error occurred during scraping {page['original_url']}: {e}")
+            await self._failed(queue, item_key, page, e)
+            return
+
+        title, html_content, dom, response_validators = scraped
+        fetched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conversion = None
+        if html_content is not None:
+            conversion = await self.converter.submit(html_content, title, page['original_url'], site['base_url'], page['tags'], page['job'])
+        validators = None
+        if response_validators is not None:
+            validators = HttpCache.validators_row(page['normalized_url'], page['original_url'], *response_validators)
+        task = asyncio.create_task(self._write_converted(queue, item_key, page, conversion, dom, fetched_at, validators))
+        self._conversions.add(task)
+        task.add_done_callback(self._conversions.discard)
+
+    def _succeeded(self, page) -> tuple:
+        # the attempts of a page downloaded fine are reset, None when there were none
+        return (0, None, None) if page['attempts'] else None
+
+    async def _failed(self, queue: WorkQueue, item_key: str, page, error: BaseException, snapshot: tuple = None) -> None:
+        """
+        writes a failed download: a transient failure goes to 'retry' and keeps the page's content until the
+        retry policy has no attempts left, the rest to 'error' with empty content
+        """
+        kind, reason = classify_failure(error)
+        attempts = (page['attempts'] or 0) + 1
+        next_attempt = self.retry_policy.next_attempt(kind, attempts)
+        reasons = self.failure_stats['reasons']
+        reasons[reason] = reasons.get(reason, 0) + 1
+        if next_attempt is not None:
+            self.failure_stats['retry'] += 1
+            print(f"    - {reason} for {page['original_url']}, attempt {attempts} of {self.retry_policy.max_attempts}, retrying after {next_attempt}")
+            await self.writer.add(queue, item_key, page['page_id'], None, "retry", snapshot, attempt=(attempts, next_attempt, reason))
+            return
+        self.failure_stats['permanent' if kind == PERMANENT else 'gave_up'] += 1
+        await self.writer.add(queue, item_key, page['page_id'], "", "error", snapshot, attempt=(attempts, None, reason))
+
+    async def _unchanged(self, page) -> bool:
+        """
+        asks the site with a conditional request whether a page changed since its last download. Only for pages the
+        sitemap set back to 'new' (revalidate), a page reset by hand is meant to be downloaded again, e.g. after its
+        site's selectors changed
+        """
+        validators = None
+        if page['content'] and page['revalidate']:
+            validators = self.http_cache.get(page['normalized_url'], page['original_url'])
+        if validators is None:
+            self.http_cache.count('uncached', page['job'])
+            return False
+        try:
+            async with self.rate_limiter.slot(page['original_url']) as outcome:
+                response = await self.http_fetcher.fetch(
+                    page['original_url'],
+                    raise_for_status=False,
+                    headers=HttpCache.conditional_headers(validators)
+                )
+                outcome.status = response.status_code
+                outcome.retry_after = response.headers.get("retry-after")
+        except Exception as e:
+            print(f"conditional request for {page['original_url']} failed, downloading it: {e}")
+            self.http_cache.count('failed', page['job'])
+            return False
+        body_hash = HttpCache.body_hash(response.content) if response.status_code == 200 else None
+        cache_outcome = HttpCache.outcome(validators, response.status_code, body_hash)
+        self.http_cache.count(cache_outcome, page['job'])
+        return cache_outcome in ('not_modified', 'same_body')
+
+    async def _save_snapshot(self, page, dom: str, fetched_at: str) -> tuple:
+        try:
+            # gzip doesn't hold the GIL while it compresses
+            content_hash, raw_bytes, stored_bytes = await asyncio.to_thread(self.snapshots.put, dom)
+        except OSError as e:
+            print(f"could not save the snapshot of {page['original_url']}: {e}")
+            return None
+        if stored_bytes:
+            self.snapshot_stats['saved'] += 1
+            self.snapshot_stats['raw_bytes'] += raw_bytes
+            self.snapshot_stats['stored_bytes'] += stored_bytes
+        else:
+            self.snapshot_stats['unchanged'] += 1
+        return page['normalized_url'], fetched_at, content_hash
+
+    async def _write_converted(self, queue: WorkQueue, item_key: str, page, conversion: asyncio.Future, dom: str, fetched_at: str, validators: tuple = None) -> None:
+        snapshot = None
+        if dom is not None:
+            snapshot = await self._save_snapshot(page, dom, fetched_at)
+
+        if conversion is None:
+            # the site's selectors aren't on the page
+            await self._failed(queue, item_key, page, PageFailure("no content"), snapshot)
+            return
+        try:
+            markdown, seconds = await conversion
+        except Exception as e:
+            print(f"An error occurred converting {page['original_url']} to markdown: {e}")
+            await self._failed(queue, item_key, page, e, snapshot)
+            return
+        await self.writer.add(queue, item_key, page['page_id'], markdown, "scraped", snapshot, validators, self._succeeded(page))
+
+    async def run(self, queue: WorkQueue, total_pages: int = None, status: str = "new") -> None:
+        """
+        downloads the pages of a work queue (item key: page_id) until there is nothing left to claim,
+        pages no longer in `status` ('new', or 'retry' for the due retries) are skipped
+        """
+        claimed = [] # claimed by this process, not started yet
+        start = time.monotonic()
+
+        async def worker() -> None:
+            while True:
+                if not claimed:
+                    # no await between the check and the claim, the workers don't claim the same batch twice
+                    claimed.extend(queue.claim(self.concurrency))
+                    if not claimed:
+                        return
+                page_id, normalized_url, priority = claimed.pop(0)
+                page = self.db.get_page(int(page_id))
+                # another process already downloaded it, or it is gone
+                if page is None or page['status'] != status:
+                    self.stats['skipped'] += 1
+                    queue.complete(page_id)
+                    continue
+                self.stats['pages'] += 1
+                print(f"{self.stats['pages']/max(1, total_pages or 0)*100:.1f}% Retrieving markdown for page: {page['normalized_url']}")
+                await self.download_page(queue, page_id, page)
+                queue.heartbeat_if_due()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            # the last pages may still be converting
+            while self._conversions:
+                await asyncio.gather(*self._conversions)
+        finally:
+            # the unstarted pages go back to the queue, e.g. after Ctrl-C
+            if claimed:
+                queue.release(*(page_id for page_id, normalized_url, priority in claimed))
+                claimed.clear()
+            self.stats['seconds'] += time.monotonic() - start
+
+    def print_stats(self) -> None:
+        self.writer.print_stats()
+        if self.stats['seconds'] > 0:
+            print(
+                f"    - {self.stats['pages']} pages downloaded in {self.stats['seconds']:.1f} seconds with {self.concurrency} workers "
+                f"and {self.converter.processes} conversion processes, {self.stats['pages'] / self.stats['seconds']:.2f} pages per second"
+            )
+            for stage in (self.browser_stage, self.converter.stats, self.writer.stage):
+                stage.print_stats(self.stats['seconds'])
+        failures = self.failure_stats
+        if failures['reasons']:
+            print(
+                f"    - failed downloads: {failures['retry']} to be retried, {failures['gave_up']} out of attempts, {failures['permanent']} permanent "
+                f"({', '.join(f'{reason}: {count}' for reason, count in sorted(failures['reasons'].items()))})"
+            )
+        self.extraction_stats.print_stats("    ")
+        if self.http_cache is not None:
+            self.http_cache.print_stats("    ")
+        if self.snapshots is not None:
+            print(
+                f"    - snapshots: {self.snapshot_stats['saved']} saved, {self.snapshot_stats['unchanged']} unchanged since the last download, "
+                f"{self.snapshot_stats['raw_bytes'] / 1024 / 1024:.1f} MB of html stored in {self.snapshot_stats['stored_bytes'] / 1024 / 1024:.1f} MB"
+            )
+        for profile, request_blocker in self.request_blockers.items():
+            print(f"    - blocking profile: {profile}")
+            request_blocker.print_stats()
+        self.rate_limiter.print_stats()
+        self.sites.print_stats()
+
+
+def _reextract(snapshot_root: str, content_hash: str, url: str, parent_selector: str, content_selector: str, base_url: str, tags, job: str) -> tuple[str, str]:
+    # runs in a reextract_pages process: (markdown or None when there is no content, error)
+    try:
+        parsed = parse_html(SnapshotStore(snapshot_root).get(content_hash), url, parent_selector, content_selector)
+        if not parsed.content_html:
+            return None, None
+        return html_to_markdown(parsed.content_html, parsed.title, url, base_url, tags, job), None
+    except Exception as e:
+        return None, str(e)
+
+def reextract_pages(db: DatabaseManager, snapshots: SnapshotStore, job: str = None, processes: int = None, batch_size: int = DEFAULT_WRITE_BATCH) -> dict:
+    """
+    rebuilds the markdown of a job's scraped and uploaded pages (all jobs without one) from their latest snapshot, with the
+    site's current parent_element / child_element, in `processes` processes and without any network access.
+
+    The same extraction as the browser's runs on the snapshot with lxml (http_fetcher.parse_html). Pages whose
+    markdown changed are stored as 'scraped' so the next upload picks them up, pages whose content is no longer
+    found as 'error' like the downloader does. Pages without a snapshot are left alone.
+    Returns the counts of pages changed, unchanged, error, no_snapshot, no_site and failed (unreadable snapshot).
+    """
+    stats = {'changed': 0, 'unchanged': 0, 'error': 0, 'no_snapshot': 0, 'no_site': 0, 'failed': 0}
+    sites = SiteConfigCache(db)
+    pages = db.get_downloaded_pages(job)
+    latest = db.get_latest_page_snapshots([page['normalized_url'] for page in pages])
+
+    todo = []
+    for page in pages:
+        content_hash = latest.get(page['normalized_url'])
+        if content_hash is None:
+            stats['no_snapshot'] += 1
+            continue
+        site, _ = sites.get(page['normalized_url'])
+        if site is None:
+            stats['no_site'] += 1
+            continue
+        todo.append((page, (
+            str(snapshots.root), content_hash, page['original_url'], site['parent_element'], site['child_element'],
+            site['base_url'], page['tags'], page['job']
+        )))
+
+    updates = []
+    with ProcessPoolExecutor(max_workers=max(1, processes or os.cpu_count() or 1)) as executor:
+        results = executor.map(_reextract, *zip(*(arguments for page, arguments in todo)), chunksize=8) if todo else []
+        for (page, arguments), (markdown, error) in zip(todo, results):
+            if error is not None:
+                print(f"could not re-extract {page['normalized_url']}: {error}")
+                stats['failed'] += 1
+                continue
+            content, status = (markdown, "scraped") if markdown is not None else ("", "error")
+            # a scraped page that was uploaded since keeps its 'uploaded' status when its markdown is the same
+            if db.content_hash(content) == page['content_hash'] and (status == "error") == (page['status'] == "error"):
+                stats['unchanged'] += 1
+                continue
+            stats['changed' if status == "scraped" else 'error'] += 1
+            updates.append((page['page_id'], content, status))
+            if len(updates) >= batch_size:
+                db.update_pages(updates)
+                updates = []
+    if updates:
+        db.update_pages(updates)
+    return stats
+
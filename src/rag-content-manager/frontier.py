@@ -0,0 +1,412 @@
+import asyncio
+import heapq
+import time
+from db import DatabaseManager
+from work_queue import WorkQueue, DEFAULT_LEASE_SECONDS
+
+# a url's priority is one integer, so it can be stored and sorted on in SQLite:
+# depth * PRIORITY_DEPTH_STEP + (MAX_PRIORITY_FIELD - glob specificity) * PRIORITY_FIELD_STEP + version rank
+PRIORITY_DEPTH_STEP = 1_000_000
+PRIORITY_FIELD_STEP = 1_000
+MAX_PRIORITY_FIELD = PRIORITY_FIELD_STEP - 1
+
+def crawl_priority(depth: int, glob_specificity: int = 0, version_rank: int = 0) -> int:
+    """
+    the priority of a queued url, lower is crawled first: shallower pages first, then urls matched by
+    a more specific glob (a longer literal prefix), then the preferred versions (version_preference_order index)
+    """
+    return (
+        depth * PRIORITY_DEPTH_STEP +
+        (MAX_PRIORITY_FIELD - min(glob_specificity, MAX_PRIORITY_FIELD)) * PRIORITY_FIELD_STEP +
+        min(version_rank, MAX_PRIORITY_FIELD)
+    )
+
+def priority_depth(priority: int) -> int:
+    """
+    the link depth a priority was made with
+    """
+    return priority // PRIORITY_DEPTH_STEP
+
+
+class CrawlFrontier:
+    """
+    The crawl queue for one job, optionally checkpointed to SQLite so a crawl can be resumed.
+
+    Urls are handed out lowest priority first (see crawl_priority), in the order they were queued within a priority.
+
+    Without a database this is a plain in-memory priority queue. With one:
+      - every queued url, completed url and found page is written to the crawl_frontier / crawl_found_pages
+        tables at least every `checkpoint_interval` seconds
+      - once `memory_limit` urls are waiting in memory, new urls are only written to disk ('spilled')
+        and read back best priority first as the in-memory queue drains
+      - `pause()` stops handing out urls, in flight pages finish and everything left stays queued on disk
+
+    `stop()` stops handing out urls for good (e.g. once enough pages are found), the rest of the queue is dropped.
+
+    `get()` returns None once the crawl is over for the worker asking: the frontier is paused or stopped, or the
+    queue is empty with nothing in flight (no page left that could queue more urls). Workers exit on None, so a
+    briefly empty queue while other workers are still loading pages doesn't stop anyone.
+    `join()` returns when nothing is in flight and get() returns None.
+    """
+    def __init__(self, db: DatabaseManager = None, job: str = None, memory_limit: int = 50000, checkpoint_interval: float = 30):
+        self.db = db
+        self.job = job
+        # spilling needs somewhere to spill to
+        self.memory_limit = memory_limit if db is not None else None
+        self.checkpoint_interval = checkpoint_interval
+
+        self._memory = [] # heap of (priority, seq, url, normalized_url)
+        self._spilled = 0
+        self._in_flight = 0
+        self._seq = 0
+        self._cond = asyncio.Condition()
+
+        # changes not yet written to disk
+        self._pending_rows = {} # normalized_url -> (normalized_url, url, state, seq)
+        self._pending_pages = {} # normalized_url -> page dict
+        self._last_checkpoint = time.monotonic()
+
+        self.paused = False
+        self.stopped = False
+        self.resumed = False
+
+    @property
+    def persistent(self) -> bool:
+        return self.db is not None
+
+    def _drained(self) -> bool:
+        # nothing more will be handed out
+        return self.paused or self.stopped or (self._in_flight == 0 and not self._memory and self._spilled == 0)
+
+    def start(self, start_url: str, resume: bool = False) -> tuple[set, list[dict]]:
+        """
+        starts a crawl run. With resume, a saved running/paused crawl for this job is loaded and
+        (visited normalized urls, found pages) are returned. Otherwise any saved state is dropped and
+        (empty set, empty list) is returned.
+        """
+        if not self.persistent:
+            return set(), []
+
+        run = self.db.get_crawl_run(self.job)
+        if resume and run and run['status'] in ('running', 'paused'):
+            visited, spilled, max_seq, found_pages = self.db.load_frontier(self.job)
+            self._spilled = spilled
+            self._seq = max_seq
+            self.resumed = True
+            self.db.set_crawl_run(self.job, start_url, 'running')
+            print(f"       - Resuming {run['status']} crawl from {run['last_update']}: {len(visited)} urls seen, {spilled} still queued, {len(found_pages)} pages found.")
+            return visited, found_pages
+
+        self.db.clear_frontier(self.job)
+        self.db.set_crawl_run(self.job, start_url, 'running', new_run=True)
+        return set(), []
+
+    async def put(self, url: str, normalized_url: str, priority: int = 0) -> None:
+        async with self._cond:
+            self._seq += 1
+            # once anything has been spilled, new urls go to disk as well, they are read back by priority
+            if self.memory_limit is None or (self._spilled == 0 and len(self._memory) < self.memory_limit):
+                heapq.heappush(self._memory, (priority, self._seq, url, normalized_url))
+                state = 'queued'
+            else:
+                self._spilled += 1
+                state = 'spilled'
+
+            if self.persistent:
+                self._pending_rows[normalized_url] = (normalized_url, url, state, self._seq, priority)
+            self._cond.notify_all()
+
+    async def get(self) -> tuple[str, int] | None:
+        """
+        waits for and returns the next (url, priority), None when the crawl is over: the worker should exit
+        """
+        async with self._cond:
+            while True:
+                if not self.paused and not self.stopped:
+                    if self._memory:
+                        priority, seq, url, normalized_url = heapq.heappop(self._memory)
+                        self._in_flight += 1
+                        return url, priority
+                    if self._spilled:
+                        self._refill()
+                        continue
+                if self._drained():
+                    return None
+                # the queue is empty but pages in flight may still queue more urls
+                await self._cond.wait()
+
+    def _refill(self) -> None:
+        # pending rows have to be on disk before we can read them back
+        self.checkpoint()
+        rows = self.db.pop_spilled_frontier_urls(self.job, max(1, self.memory_limit // 2))
+        if not rows:
+            # nothing left on disk, don't loop on a stale counter
+            self._spilled = 0
+            return
+        for url, normalized_url, priority in rows:
+            self._seq += 1
+            heapq.heappush(self._memory, (priority, self._seq, url, normalized_url))
+        self._spilled -= len(rows)
+
+    async def task_done(self, url: str, normalized_url: str, completed: bool = True) -> None:
+        """
+        marks a url handed out by get() as finished. completed=False leaves it queued on disk, to be crawled on resume
+        """
+        async with self._cond:
+            self._in_flight -= 1
+            if self.persistent and completed:
+                self._pending_rows[normalized_url] = (normalized_url, url, 'done', 0, 0)
+            self._cond.notify_all()
+
+        if self.persistent and time.monotonic() - self._last_checkpoint > self.checkpoint_interval:
+            self.checkpoint()
+
+    def record_page(self, page: dict) -> None:
+        """
+        records a found page so it survives a restart
+        """
+        if self.persistent:
+            self._pending_pages[page['normalized_url']] = page
+
+    def checkpoint(self) -> None:
+        """
+        writes all pending frontier changes and found pages to disk
+        """
+        self._last_checkpoint = time.monotonic()
+        if not self.persistent or (not self._pending_rows and not self._pending_pages):
+            return
+        if self.db.save_frontier_checkpoint(self.job, list(self._pending_rows.values()), list(self._pending_pages.values())):
+            self._pending_rows = {}
+            self._pending_pages = {}
+
+    async def pause(self) -> None:
+        """
+        stops handing out urls. in flight pages still finish and are recorded
+        """
+        async with self._cond:
+            self.paused = True
+            self._cond.notify_all()
+
+    async def stop(self) -> None:
+        """
+        stops handing out urls, the crawl finishes with the pages in flight and the rest of the queue is dropped
+        """
+        async with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
+
+    async def join(self) -> None:
+        async with self._cond:
+            while not (self._in_flight == 0 and self._drained()):
+                await self._cond.wait()
+
+    def qsize(self) -> int:
+        return len(self._memory) + self._spilled
+
+    def finish(self) -> None:
+        """
+        ends the run: a paused crawl is checkpointed and left to continue on the next run,
+        a completed or stopped crawl has its saved frontier removed
+        """
+        if not self.persistent:
+            return
+        if self.paused:
+            self.checkpoint()
+            self.db.set_crawl_run(self.job, None, 'paused')
+        else:
+            self.db.clear_frontier(self.job)
+            self.db.set_crawl_run(self.job, None, 'complete')
+
+
+class LeasedFrontier:
+    """
+    A crawl queue shared by several processes through the work_queue table (queue "crawl:<job>"), with the same
+    interface as CrawlFrontier.
+
+    Urls are claimed in small batches under a lease and marked done when crawled. Discovered urls are added in
+    batches and deduplicated by the table's key, so every url is crawled once across all processes.
+    A process that dies leaves its leases to expire, the next claim by any process picks them up again.
+    A url put() again while it is in flight here (a throttled page, or the next variant after a failed load) is
+    handed back with the url it was put with when its task is done unfinished.
+
+    A process stops when it has nothing in flight and nothing is left to claim: get() returns None to its workers.
+    When other processes still hold leases the run stays 'running', the last process to finish marks it complete.
+    """
+    def __init__(
+        self,
+        db: DatabaseManager,
+        job: str,
+        owner: str = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        batch_size: int = 10,
+        poll_seconds: float = 1.0
+    ):
+        self.db = db
+        self.job = job
+        self.queue = WorkQueue(db, f"crawl:{job}", owner, lease_seconds)
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+
+        self._memory = [] # heap of claimed (priority, normalized_url, url) not handed out yet
+        self._pending_puts = {} # normalized_url -> (url, priority), not written yet
+        self._in_flight = 0
+        self._handed_out = set() # normalized urls in flight here
+        self._requeued = {} # normalized_url -> url it was put again with while in flight
+        # set when something changed locally. The queue itself is polled every poll_seconds for work from
+        # other processes. No lock needed: nothing awaits between reading and updating the state
+        self._changed = asyncio.Event()
+
+        self.paused = False
+        self.stopped = False
+        self.resumed = False
+
+    @property
+    def persistent(self) -> bool:
+        return True
+
+    def start(self, start_url: str, resume: bool = False) -> tuple[set, list[dict]]:
+        """
+        starts a crawl run, or joins the run other processes are working on: one that is running with leases held
+        by other processes, or that started less than a lease ago (processes started together). With resume a run
+        that was left paused or unfinished is joined too. Only a new run clears the queue.
+        The queue itself deduplicates urls, so (empty set, empty list) is always returned
+        """
+        action, run = self.db.start_shared_crawl_run(
+            self.job, start_url, self.queue.name, self.queue.owner, resume, self.queue.lease_seconds
+        )
+        if action is None:
+            raise RuntimeError(f"could not start the crawl run of {self.job}")
+        if action == 'joined':
+            self.resumed = True
+            counts = self.queue.counts()
+            print(
+                f"       - Joining {run['status']} crawl from {run['last_update']}: {counts.get('done', 0)} urls crawled, "
+                f"{counts.get('pending', 0) + counts.get('expired', 0)} waiting, {counts.get('leased', 0)} leased by other processes."
+                + ("" if resume else " Another process is crawling the job, it isn't started over.")
+            )
+        return set(), []
+
+    def _flush_puts(self) -> None:
+        if self._pending_puts:
+            self.queue.enqueue([(normalized_url, url, priority) for normalized_url, (url, priority) in self._pending_puts.items()])
+            self._pending_puts = {}
+
+    def _claimable(self, counts: dict) -> bool:
+        return counts.get('pending', 0) + counts.get('expired', 0) > 0
+
+    async def _wait_for_change(self) -> None:
+        try:
+            await asyncio.wait_for(self._changed.wait(), self.poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    async def put(self, url: str, normalized_url: str, priority: int = 0) -> None:
+        if normalized_url in self._handed_out:
+            # the item is leased by us, enqueueing it would be a no-op. It is released with this url in task_done
+            self._requeued[normalized_url] = url
+            return
+        self._pending_puts[normalized_url] = (url, priority)
+        if len(self._pending_puts) >= self.batch_size:
+            self._flush_puts()
+        self._changed.set()
+
+    async def get(self) -> tuple[str, int] | None:
+        """
+        waits for and returns the next (url, priority), claiming a new batch when the claimed urls run out.
+        None when this process is done: paused, stopped, or nothing in flight here and nothing left to claim.
+        The urls other processes still hold are theirs to finish
+        """
+        while True:
+            if self.paused or self.stopped:
+                return None
+            if self._memory:
+                priority, normalized_url, url = heapq.heappop(self._memory)
+                self._in_flight += 1
+                self._handed_out.add(normalized_url)
+                return url, priority
+            self._flush_puts()
+            claimed = self.queue.claim(self.batch_size)
+            if claimed:
+                for normalized_url, url, priority in claimed:
+                    heapq.heappush(self._memory, (priority, normalized_url, url))
+                continue
+            if self._in_flight == 0:
+                self._changed.set() # wake the other waiting workers, they are done as well
+                return None
+            # pages in flight here may still queue more urls
+            await self._wait_for_change()
+
+    async def task_done(self, url: str, normalized_url: str, completed: bool = True) -> None:
+        """
+        marks a url handed out by get() as finished. completed=False hands it back to the queue, with the url it
+        was put() with since, if any
+        """
+        self._in_flight -= 1
+        self._handed_out.discard(normalized_url)
+        requeued_url = self._requeued.pop(normalized_url, None)
+        if completed:
+            self.queue.complete(normalized_url)
+        elif requeued_url is not None:
+            self.queue.release(normalized_url, payloads={normalized_url: requeued_url})
+        else:
+            self.queue.release(normalized_url)
+        self.queue.heartbeat_if_due()
+        self._changed.set()
+
+    def record_page(self, page: dict) -> None:
+        # found pages go to the pages table through the page sink as they are crawled
+        pass
+
+    def checkpoint(self) -> None:
+        self._flush_puts()
+        self.queue.heartbeat_if_due()
+
+    async def pause(self) -> None:
+        self.paused = True
+        self._changed.set()
+
+    async def stop(self) -> None:
+        """
+        stops handing out urls. The urls left in the queue are dropped when no other process holds a lease
+        """
+        self.stopped = True
+        self._changed.set()
+
+    async def join(self) -> None:
+        """
+        waits until this process is done: nothing in flight and nothing left to claim, or paused / stopped
+        """
+        while True:
+            if self._in_flight == 0:
+                if self.paused or self.stopped:
+                    return
+                self._flush_puts()
+                if not self._memory and not self._claimable(self.queue.counts()):
+                    return
+            await asyncio.sleep(self.poll_seconds / 4)
+
+    def qsize(self) -> int:
+        counts = self.queue.counts()
+        return len(self._memory) + len(self._pending_puts) + counts.get('pending', 0) + counts.get('expired', 0)
+
+    def finish(self) -> None:
+        """
+        hands unprocessed claimed urls back, then ends the run: paused, complete when no process has anything
+        left (or it was stopped and no other process holds a lease), or still running when other processes are
+        working on it
+        """
+        self._flush_puts()
+        if self._memory:
+            self.queue.release(*(normalized_url for priority, normalized_url, url in self._memory))
+            self._memory.clear()
+        self.queue.print_stats()
+
+        counts = self.queue.counts()
+        if self.paused:
+            self.db.set_crawl_run(self.job, None, 'paused')
+        elif counts.get('leased', 0) == 0 and (self.stopped or counts.get('pending', 0) + counts.get('expired', 0) == 0):
+            self.queue.clear()
+            self.db.set_crawl_run(self.job, None, 'complete')
+        else:
+            print(f"       - Other processes are still crawling {self.job}, leaving the run open.")
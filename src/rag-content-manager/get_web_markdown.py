@@ -1,10 +1,15 @@
 #import trafilatura
+import hashlib
 import textwrap
 import html2text
 import os
 import re
 from urllib.parse import urljoin, urlparse
 from playwright.sync_api import sync_playwright
+from request_blocking import RequestBlocker
+from rate_limiter import HostRateLimiter, ThrottledError, THROTTLE_STATUSES
+from readiness import ReadinessStrategy
+from retry_policy import HttpStatusError
 
 def make_links_absolute(markdown_content, base_url):
     """
@@ -27,63 +32,230 @@ def make_links_absolute(markdown_content, base_url):
 
 
 
-def scrape_to_markdown(url, parent_selector, content_selector, base_url, tags=[], job="mslearn"):
+def html_to_markdown(html_content, title, url, base_url, tags=[], job="mslearn"):
+    """
+    Converts the extracted content HTML of a page to markdown with the YAML metadata header.
+    Shared by scrape_to_markdown, the downloader's conversion processes and the crawler's single pass
+    (extract during crawl) mode.
+    """
+    h = html2text.HTML2Text()
+    h.body_width = 0
+    # Ensure links within the combined HTML are made absolute
+    markdown_content = make_links_absolute(h.handle(html_content), base_url)
+
+    metadata = f"""
+        ---
+        title: {title}
+        source_url: {url}
+        tags: {tags}
+        crawler_job: {job}
+        ---
+    """
+    # Use textwrap.dedent for clean multi-line YAML metadata
+    return f"{textwrap.dedent(metadata)}\n\n{markdown_content}"
+
+# everything the crawler and the downloader read from a rendered page, in one evaluate (one CDP round trip)
+# instead of a locator call per content block: the title, the non-empty content_selector blocks of the
+# parentSelector container (or the whole container when they are all empty), and optionally the links, images
+# and the <link rel=canonical>
+PAGE_SCRIPT = """({parentSelector, contentSelector, withLinks, linksInContainer}) => {
+    const parent = parentSelector ? document.querySelector(parentSelector) : null;
+    const result = {title: document.title, found: parent !== null, html: null, fallback: false, blocks: 0, parts: 0, hrefs: null, imgs: null, canonical: null};
+    if (parent && contentSelector) {
+        const blocks = parent.querySelectorAll(contentSelector);
+        const parts = [];
+        for (const block of blocks) {
+            if (block.innerText.trim()) parts.push(block.innerHTML);
+        }
+        result.blocks = blocks.length;
+        result.parts = parts.length;
+        result.fallback = parts.length === 0;
+        result.html = parts.length ? parts.join("") : parent.innerHTML;
+    }
+    if (withLinks) {
+        const root = (linksInContainer && parent) || document;
+        result.hrefs = Array.from(root.querySelectorAll("a[href]")).map(a => a.href);
+        result.imgs = Array.from(document.querySelectorAll("img[src]")).map(img => img.src);
+        const canonical = document.querySelector('link[rel="canonical"][href]');
+        result.canonical = canonical ? canonical.href : null;
+    }
+    return result;
+}"""
+
+class PageExtraction:
+    """
+    What PAGE_SCRIPT read from a page. content_html is None when the container wasn't found (or no content_selector
+    was given), hrefs / img_srcs / canonical_url are None unless the links were asked for
+    """
+    __slots__ = ('title', 'with_content', 'container_found', 'content_html', 'fallback', 'blocks', 'parts', 'hrefs', 'img_srcs', 'canonical_url')
+
+    def __init__(self, result: dict, with_content: bool):
+        self.with_content = with_content
+        self.title = result['title']
+        self.container_found = result['found']
+        self.content_html = result['html']
+        self.fallback = result['fallback']
+        self.blocks = result['blocks']
+        self.parts = result['parts']
+        self.hrefs = result['hrefs']
+        self.img_srcs = result['imgs']
+        self.canonical_url = result['canonical']
+
+    @property
+    def locator_round_trips(self) -> int:
+        # what reading the same with page.title(), locators and separate evaluates took: the title, the container's
+        # count, all(), inner_text per block, inner_html per non-empty block, inner_html of the container as the
+        # fallback, and one evaluate each for the images and the links
+        round_trips = 1
+        if self.with_content:
+            round_trips += 1
+            if self.container_found:
+                round_trips += 1 + self.blocks + self.parts + (1 if self.fallback else 0)
+        if self.hrefs is not None:
+            round_trips += 2
+        return round_trips
+
+
+class ExtractionStats:
+    """
+    browser round trips spent reading pages: one evaluate per page, against what per element locator calls would take
+    """
+    def __init__(self):
+        self.stats = {'pages': 0, 'round_trips': 0, 'locator_round_trips': 0, 'blocks': 0}
+
+    def add(self, extraction: PageExtraction, round_trips: int = 1) -> None:
+        self.stats['pages'] += 1
+        self.stats['round_trips'] += round_trips
+        self.stats['locator_round_trips'] += extraction.locator_round_trips
+        self.stats['blocks'] += extraction.blocks
+
+    def print_stats(self, indent: str = "       ") -> None:
+        pages = self.stats['pages']
+        if pages == 0:
+            return
+        print(
+            f"{indent}- Page extraction: {pages} pages, {self.stats['round_trips'] / pages:.1f} browser round trips per page "
+            f"(per element locators would take {self.stats['locator_round_trips'] / pages:.1f})"
+            + (f", {self.stats['blocks'] / pages:.1f} content blocks per page" if self.stats['blocks'] else "")
+        )
+
+def _log_extraction(extraction: PageExtraction, url: str, parent_selector: str, content_selector: str) -> None:
+    if not extraction.container_found:
+        print(f"Parent selector '{parent_selector}' not found on {url}.")
+    elif extraction.fallback:
+        print(f"No non-empty child content found with '{content_selector}' on {url}. Falling back to parent selector '{parent_selector}'.")
+
+async def extract_page_async(page, parent_selector: str, content_selector: str = None, with_links: bool = False, links_in_container: bool = False, stats: ExtractionStats = None) -> PageExtraction:
+    """
+    reads a page the crawler or the downloader already navigated to with PAGE_SCRIPT, in a single round trip
+    """
+    extraction = PageExtraction(await page.evaluate(PAGE_SCRIPT, {
+        'parentSelector': parent_selector,
+        'contentSelector': content_selector,
+        'withLinks': with_links,
+        'linksInContainer': links_in_container
+    }), bool(content_selector))
+    if content_selector:
+        _log_extraction(extraction, page.url, parent_selector, content_selector)
+    if stats is not None:
+        stats.add(extraction)
+    return extraction
+
+def extract_page_sync(page, parent_selector: str, content_selector: str = None, stats: ExtractionStats = None) -> PageExtraction:
+    """
+    sync version of extract_page_async for scrape_to_markdown
+    """
+    extraction = PageExtraction(page.evaluate(PAGE_SCRIPT, {
+        'parentSelector': parent_selector,
+        'contentSelector': content_selector,
+        'withLinks': False,
+        'linksInContainer': False
+    }), bool(content_selector))
+    _log_extraction(extraction, page.url, parent_selector, content_selector)
+    if stats is not None:
+        stats.add(extraction)
+    return extraction
+
+async def scrape_page_html_async(page, url, parent_selector, content_selector, rate_limiter: HostRateLimiter = None, readiness: ReadinessStrategy = None, with_dom: bool = False, stats: ExtractionStats = None, with_validators: bool = False):
+    """
+    The browser half of scrape_to_markdown on a page borrowed from a BrowserPool, used by the downloader.
+    Request blocking is done by the pool's contexts. Returns (title, content html, dom, validators) for
+    html_to_markdown, the content html is None if there was no content. The dom (the whole rendered page) is only
+    read with_dom. validators are the (headers, sha256 of the body) of the page's response for the HttpCache,
+    only read with_validators.
+    Unlike scrape_to_markdown errors are raised, so the caller can discard the page or retry it later,
+    an http error status raises HttpStatusError.
+    The title and content are read in one round trip (extract_page_async), counted in `stats`.
+    """
+    if readiness is None:
+        readiness = ReadinessStrategy('domcontentloaded')
+    if rate_limiter is not None:
+        async with rate_limiter.slot(url) as outcome:
+            response = await readiness.goto(page, url)
+            if response is not None:
+                outcome.status = response.status
+                outcome.retry_after = response.headers.get("retry-after")
+        if outcome.status in THROTTLE_STATUSES:
+            raise ThrottledError(f"http status {outcome.status}")
+    else:
+        response = await readiness.goto(page, url)
+    if response is not None and response.status >= 400:
+        raise HttpStatusError(response.status)
+
+    extraction = await extract_page_async(page, parent_selector, content_selector, stats=stats)
+    html_content = extraction.content_html or None
+    if html_content is None:
+        print("Could not find any content to scrape.")
+    dom = await page.content() if with_dom else None
+    validators = None
+    if with_validators and response is not None:
+        try:
+            body_hash = hashlib.sha256(await response.body()).hexdigest()
+        except Exception:
+            # the ETag / Last-Modified still count
+            body_hash = None
+        validators = (response.headers, body_hash)
+    return extraction.title, html_content, dom, validators
+
+def scrape_to_markdown(url, parent_selector, content_selector, base_url, tags=[], job="mslearn", request_blocker: RequestBlocker = None, rate_limiter: HostRateLimiter = None, readiness: ReadinessStrategy = None, stats: ExtractionStats = None):
     """
     Navigates to a URL, finds a parent container, then looks for all child elements
     matching content_selector, concatenates their HTML, converts it to markdown.
+    The title and the content are read in a single round trip (PAGE_SCRIPT), counted in `stats` if given.
+    If a request_blocker is passed, images, fonts, analytics etc. are aborted according to its profile.
+    If a rate_limiter is passed, the navigation waits for a slot on the host and reports back how it went.
+    If a readiness strategy is passed it decides when the page is ready to be read, otherwise domcontentloaded.
     """
+    if readiness is None:
+        readiness = ReadinessStrategy('domcontentloaded')
     try:
         with sync_playwright() as p:
             browser = p.chromium.launch()
             page = browser.new_page()
-            page.goto(url, wait_until='domcontentloaded')
-            title = page.title()
-
-            parent_element = page.locator(parent_selector).first
-            if not parent_element:
-                print(f"Parent selector '{parent_selector}' not found.")
-                browser.close()
-                return None
-
-            # List to hold HTML content from all relevant divs
-            all_html_parts = []
-            
-            # Find all child elements that match the content_selector
-            content_divs = parent_element.locator(content_selector).all()
-
-            # Loop through the found elements and collect their HTML content
-            for div in content_divs:
-                if div.inner_text().strip(): # Only include if it has actual text content
-                    all_html_parts.append(div.inner_html())
-            
-            # If no specific content divs found or they were all empty, fall back to parent's html
-            if not all_html_parts:
-                print(f"No non-empty child content found with '{content_selector}'. Falling back to parent selector '{parent_selector}'.")
-                html_content = parent_element.inner_html()
+            if request_blocker is not None:
+                request_blocker.attach_sync(page)
+            if rate_limiter is not None:
+                with rate_limiter.slot_sync(url) as outcome:
+                    response = readiness.goto_sync(page, url)
+                    if response is not None:
+                        outcome.status = response.status
+                        outcome.retry_after = response.headers.get("retry-after")
+                if outcome.status in THROTTLE_STATUSES:
+                    raise ThrottledError(f"http status {outcome.status}")
             else:
-                # Concatenate all collected HTML parts
-                html_content = "".join(all_html_parts)
+                readiness.goto_sync(page, url)
+
+            # the non-empty content_selector blocks of the parent, or the parent's html if they are all empty
+            extraction = extract_page_sync(page, parent_selector, content_selector, stats)
+            title = extraction.title
+            html_content = extraction.content_html
 
             if not html_content:
                 print("Could not find any content to scrape.")
                 browser.close()
                 return None
 
-            h = html2text.HTML2Text()
-            h.body_width = 0
-            # Ensure links within the combined HTML are made absolute
-            markdown_content = make_links_absolute(h.handle(html_content), base_url)
-
-            metadata = f"""
-                ---
-                title: {title}
-                source_url: {url}
-                tags: {tags}
-                crawler_job: {job}
-                ---
-            """
-            # Use textwrap.dedent for clean multi-line YAML metadata
-            markdown_content = f"{textwrap.dedent(metadata)}\n\n{markdown_content}"
+            markdown_content = html_to_markdown(html_content, title, url, base_url, tags, job)
 
             browser.close()
             return markdown_content
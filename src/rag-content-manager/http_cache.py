@@ -0,0 +1,113 @@
+import hashlib
+import sqlite3
+from db import DatabaseManager
+from snapshot_store import SnapshotStore
+
+# http_validators.source of the crawler's and the downloader's validators
+CRAWL = 'crawl'
+DOWNLOAD = 'download'
+
+# what a page fetched with the cache turned out to be, see HttpCache.outcome()
+OUTCOMES = ('not_modified', 'same_body', 'changed', 'uncached', 'failed')
+
+class HttpCache:
+    """
+    The validators of the last response of each page (ETag, Last-Modified and a hash of the body), kept per
+    normalized url in the http_validators table, so a page fetched before is requested again with If-None-Match /
+    If-Modified-Since. A 304, or a 200 with the same body, means the page didn't change since then.
+
+    The crawler (`source` CRAWL) and the downloader (DOWNLOAD) keep their own validators: the downloader's describe
+    the content stored in the pages table, the crawler's the page body it kept in `snapshots`, which a 304 still
+    needs for the links. Validators are only used for the url they were recorded for, not for another variant of
+    the same normalized url.
+
+    How the pages went is counted per job, print_stats() prints the hit rate.
+    """
+    def __init__(self, db: DatabaseManager, source: str, snapshots: SnapshotStore = None, flush_every: int = 100):
+        self.db = db
+        self.source = source
+        self.snapshots = snapshots
+        self.flush_every = flush_every
+        self._pending = [] # validators waiting to be written, see record()
+        self.stats = {} # job -> {outcome: pages}
+
+    def get(self, normalized_url: str, url: str) -> sqlite3.Row:
+        """
+        the validators to send for `url`, None when there are none that can be used
+        """
+        validators = self.db.get_http_validators(normalized_url, self.source)
+        if validators is None or validators['url'] != url:
+            return None
+        if not (validators['etag'] or validators['last_modified'] or validators['body_hash']):
+            return None
+        if self.source == CRAWL and (
+            self.snapshots is None or not validators['body_hash'] or validators['body_hash'] not in self.snapshots
+        ):
+            # without the body a 304 has no links
+            return None
+        return validators
+
+    @staticmethod
+    def conditional_headers(validators: sqlite3.Row) -> dict:
+        headers = {}
+        if validators is not None:
+            if validators['etag']:
+                headers['If-None-Match'] = validators['etag']
+            if validators['last_modified']:
+                headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    @staticmethod
+    def body_hash(body) -> str:
+        """
+        sha256 of a response body, text is hashed as utf-8 the way the SnapshotStore does it
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        return hashlib.sha256(body).hexdigest()
+
+    @staticmethod
+    def outcome(validators: sqlite3.Row, status: int, body_hash: str = None) -> str:
+        if validators is None:
+            return 'uncached'
+        if status == 304:
+            return 'not_modified'
+        if validators['body_hash'] and body_hash == validators['body_hash']:
+            return 'same_body'
+        return 'changed'
+
+    @staticmethod
+    def validators_row(normalized_url: str, url: str, headers, body_hash: str) -> tuple:
+        """
+        the http_validators row of a response, `headers` are httpx or playwright response headers
+        """
+        return normalized_url, url, headers.get('etag'), headers.get('last-modified'), body_hash
+
+    def count(self, outcome: str, job: str = None) -> None:
+        job_stats = self.stats.setdefault(job, dict.fromkeys(OUTCOMES, 0))
+        job_stats[outcome] += 1
+
+    def record(self, validators: tuple) -> None:
+        """
+        queues a validators_row(), written every `flush_every` rows and by flush()
+        """
+        self._pending.append(validators)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending and self.db.set_http_validators(self.source, self._pending):
+            self._pending = []
+
+    def print_stats(self, indent: str = "       ") -> None:
+        for job, job_stats in self.stats.items():
+            pages = sum(job_stats.values())
+            if pages == 0:
+                continue
+            hits = job_stats['not_modified'] + job_stats['same_body']
+            print(
+                f"{indent}- Http cache{f' {job}' if job else ''}: {pages} pages, {job_stats['not_modified']} not modified, "
+                f"{job_stats['same_body']} with the same body, {job_stats['changed']} changed, {job_stats['uncached']} not cached"
+                + (f", {job_stats['failed']} failed" if job_stats['failed'] else "")
+                + f", hit rate {hits / pages * 100:.0f}%"
+            )
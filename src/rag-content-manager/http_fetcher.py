@@ -0,0 +1,167 @@
+import httpx
+import lxml.html
+from lxml.cssselect import CSSSelector
+from urllib.parse import urljoin
+
+# some doc sites serve a stripped down page to unknown clients, so we look like a regular browser
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+# default rules deciding when a page fetched over plain HTTP has to be re-loaded in the browser
+DEFAULT_JS_FALLBACK_RULES = {
+    'min_links': 1,             # fewer <a href> than this means the navigation is probably built by javascript
+    'min_content_chars': 200,   # less visible text than this in the content container (or body)
+    'require_container': True   # fall back if the site's parent_element is missing from the raw HTML
+}
+
+class ParsedPage:
+    """
+    The parts of a page the crawler needs: title, links, image sources, the canonical url and some numbers for the js heuristic
+    """
+    __slots__ = ('url', 'title', 'hrefs', 'img_srcs', 'container_found', 'content_chars', 'content_html', 'container_hrefs', 'canonical_url')
+
+    def __init__(
+        self,
+        url: str,
+        title: str,
+        hrefs: list[str],
+        img_srcs: list[str],
+        container_found: bool,
+        content_chars: int,
+        content_html: str = None,
+        container_hrefs: list[str] = None,
+        canonical_url: str = None
+    ):
+        self.url = url
+        self.title = title
+        self.hrefs = hrefs
+        self.img_srcs = img_srcs
+        self.container_found = container_found
+        self.content_chars = content_chars
+        self.content_html = content_html # only set when parse_html was given a content_selector
+        self.container_hrefs = container_hrefs # only set with links_in_container and a container that was found
+        self.canonical_url = canonical_url # the <link rel=canonical> href, made absolute
+
+
+class HttpFetcher:
+    """
+    Thin wrapper around a pooled httpx.AsyncClient, keeping connections to the doc site alive between pages
+    """
+    def __init__(self, max_connections: int = 20, timeout: float = 30.0, headers: dict = None):
+        self.client = httpx.AsyncClient(
+            headers=headers or DEFAULT_HEADERS,
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def fetch(self, url: str, raise_for_status: bool = True, headers: dict = None) -> httpx.Response:
+        """
+        GETs the url, by default raising for any non 2xx status
+        `headers` are sent on top of the client's, e.g. HttpCache.conditional_headers()
+        """
+        response = await self.client.get(url, headers=headers)
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+_selector_cache = {}
+
+def _compiled_selector(selector: str) -> CSSSelector:
+    compiled = _selector_cache.get(selector)
+    if compiled is None:
+        compiled = CSSSelector(selector)
+        _selector_cache[selector] = compiled
+    return compiled
+
+def is_html_response(response: httpx.Response) -> bool:
+    content_type = response.headers.get("content-type", "")
+    return "html" in content_type.lower()
+
+def _inner_html(element) -> str:
+    return (element.text or "") + "".join(lxml.html.tostring(child, encoding="unicode") for child in element)
+
+def parse_html(html: str, url: str, container_selector: str = None, content_selector: str = None, links_in_container: bool = False) -> ParsedPage:
+    """
+    Pulls the <title>, every a[href] and img[src] and the <link rel=canonical> (made absolute), and the size of
+    the content container out of raw HTML without a browser.
+    With a `content_selector` (the site's child_element) the content HTML is extracted the same way
+    scrape_to_markdown does it: the non-empty children of the container, or the whole container.
+    With `links_in_container` the a[href] inside the container are returned separately as container_hrefs,
+    hrefs still has all of them for the javascript heuristic.
+    """
+    doc = lxml.html.fromstring(html)
+
+    # honour <base href> the same way the browser does when it resolves a.href
+    base_url = url
+    base_hrefs = doc.xpath('//base/@href')
+    if base_hrefs:
+        base_url = urljoin(url, base_hrefs[0].strip())
+
+    title = (doc.findtext('.//title') or "").strip()
+    hrefs = [urljoin(base_url, href.strip()) for href in doc.xpath('//a/@href')]
+    img_srcs = [urljoin(base_url, src.strip()) for src in doc.xpath('//img/@src')]
+    canonical_hrefs = doc.xpath('//link[@rel="canonical"]/@href')
+    canonical_url = urljoin(base_url, canonical_hrefs[0].strip()) if canonical_hrefs else None
+
+    container_found = True
+    container = None
+    if container_selector:
+        matches = _compiled_selector(container_selector)(doc)
+        if matches:
+            container = matches[0]
+        else:
+            container_found = False
+
+    if container is None:
+        body = doc.find('body')
+        container = body if body is not None else doc
+
+    content_chars = len(container.text_content().strip()) if container_found else 0
+
+    content_html = None
+    if content_selector and container_selector and container_found:
+        all_html_parts = [
+            _inner_html(element) for element in _compiled_selector(content_selector)(container)
+            if element.text_content().strip()
+        ]
+        content_html = "".join(all_html_parts) if all_html_parts else _inner_html(container)
+
+    container_hrefs = None
+    if links_in_container and container_selector and container_found:
+        container_hrefs = [urljoin(base_url, href.strip()) for href in container.xpath('.//a/@href')]
+
+    return ParsedPage(url, title, hrefs, img_srcs, container_found, content_chars, content_html, container_hrefs, canonical_url)
+
+def needs_javascript(parsed: ParsedPage, js_fallback_rules: dict = None) -> tuple[bool, str]:
+    """
+    Decides if a page fetched over HTTP looks like it needs javascript to render.
+    returns (True, reason) when the page should be handed to the browser
+    """
+    rules = dict(DEFAULT_JS_FALLBACK_RULES)
+    if js_fallback_rules:
+        rules.update(js_fallback_rules)
+
+    if rules['require_container'] and not parsed.container_found:
+        return True, "content container not found"
+    if len(parsed.hrefs) < rules['min_links']:
+        return True, f"only {len(parsed.hrefs)} links"
+    if parsed.content_chars < rules['min_content_chars']:
+        return True, f"only {parsed.content_chars} characters of content"
+    return False, ""
@@ -7,9 +7,23 @@ import sqlite3
 import textwrap
 from db import DatabaseManager
 from urllib.parse import urlparse
-from get_web_markdown import scrape_to_markdown
 import anythingllm_api
 import crawler
+from browser_pool import BrowserPool
+from request_blocking import RequestBlocker
+from frontier import CrawlFrontier, LeasedFrontier
+from work_queue import WorkQueue, DEFAULT_LEASE_SECONDS
+import sitemap
+from rate_limiter import HostRateLimiter
+from readiness import ReadinessStrategy
+from page_sink import DatabasePageSink
+from canonicalize import Canonicalizer
+from downloader import Downloader, reextract_pages
+from snapshot_store import SnapshotStore
+from http_cache import HttpCache, CRAWL, DOWNLOAD
+from dedupe import dedupe_job, DEFAULT_THRESHOLD, CHARS_PER_TOKEN
+from contextlib import nullcontext, AsyncExitStack
+import scheduler
 import sys
 import argparse
 from playwright.async_api import async_playwright, Playwright, Page
@@ -17,6 +31,9 @@ from playwright.async_api import async_playwright, Playwright, Page
 # where the SQLite database resides
 DB_File = Path('../../db/sites.db')
 
+# where the downloader keeps the rendered pages for --reextract
+SNAPSHOT_DIR = DB_File.parent / 'snapshots'
+
 # Define the path to the json job links configuration file
 JOBS_FILE = './crawler_jobs.json'
 
@@ -51,18 +68,38 @@ def get_links_json() -> list[dict]:
 # endregion GetJSON
 
 # region Crawler
-async def crawl_site(db: DatabaseManager, job: dict, max_pages: int = None, dbupdates: bool = True) -> None:
+async def crawl_site(
+        db: DatabaseManager,
+        job: dict,
+        max_pages: int = None,
+        dbupdates: bool = True,
+        playwright: Playwright = None,
+        browser_pool: BrowserPool = None,
+        rate_limiter: HostRateLimiter = None,
+        page_slot = None) -> None:
     """
     Performs a crawl for a specific site job
 
     crawls the site, finds all the links for that specific job, and updates the database with discovered URL's
+
+    when several jobs run at the same time the scheduler passes in the shared playwright, browser pool,
+    rate limiter and worker budget (page_slot), otherwise the job creates its own
     """
     print(f"    -  crawl job: {job['job']}")
 
+    ## a crawl that was paused by its time budget always continues on the next run,
+    ## an interrupted one only continues with --resume
+    ## with --work-queue a running crawl is joined, other processes may be working on it
+    crawl_run = db.get_crawl_run(job['job'])
+    resume = crawl_run is not None and (
+        crawl_run['status'] == 'paused' or
+        ((args.resume or args.work_queue) and crawl_run['status'] == 'running')
+    )
+
     ## get the last runtime for the crawl to see if we run or skip
     jobs_last_update = db.get_jobs_runtime()
     cutoff = datetime.now() - timedelta(days=30)
-    if not args.force:
+    if not args.force and not resume:
         for j in jobs_last_update:
             if j['last_update'] and j['job']:
                 if job['job'] == j['job']:
@@ -76,46 +113,146 @@ async def crawl_site(db: DatabaseManager, job: dict, max_pages: int = None, dbup
     if max_pages is not None and max_pages > 0:
         print(f"      MAXURLS of {max_pages} detected!")
 
-    try:
-        # get the current site config that we should use for this url
-        db.set_site_config(job['url'])
-    except Exception as e:
-        print(f"Error setting Site config: {e}")
-
-    async with async_playwright() as playwright:
-        pages_found = await crawler.run_crawler(
-            playwright, 
-            job['url'], 
+    # get the site config that we should use for this url
+    # kept locally, other jobs running at the same time have their own
+    site = db.get_site_config(job['url'])
+    if site is None:
+        print(f"Error setting Site config: Invalid Site Configuration: base_url: {urlparse(job['url']).netloc} not found")
+        if dbupdates:
+            print(f"      - no site config for job: {job['job']}, pages can't be stored - skipping")
+            return
+
+    # abort images, fonts, analytics etc. that the crawler never reads
+    request_blocker = RequestBlocker(job.get('blocking_profile', 'none'))
+
+    # the http engine asks for the pages it fetched before with conditional requests, their bodies are kept
+    # in the snapshot store so an unchanged page still gives its links
+    http_cache = None
+    if dbupdates and not args.no_http_cache and not args.no_snapshots:
+        http_cache = HttpCache(db, CRAWL, SnapshotStore(args.snapshot_dir))
+
+    # the crawl queue is checkpointed to the sites db so a crash or a time budget doesn't lose the progress
+    # dry runs (no db updates) keep it in memory
+    # with --work-queue it lives in the work_queue table, shared with other processes crawling the same job
+    if args.work_queue and dbupdates:
+        frontier = LeasedFrontier(db, job['job'], lease_seconds=args.lease_seconds)
+    else:
+        frontier = CrawlFrontier(
+            db if dbupdates else None,
+            job['job'],
+            memory_limit=job.get('frontier_memory_limit', 50000)
+        )
+    time_budget_minutes = job.get('time_budget_minutes', None)
+
+    # single pass mode: the content is extracted in the same navigation that finds the links,
+    # pages go straight to 'scraped' and skip the download step
+    extract_during_crawl = job.get('extract_during_crawl', False) and site is not None
+
+    # when a page counts as loaded, stored with the site config (networkidle if the site has none)
+    readiness = ReadinessStrategy.from_site_config(site) if site is not None else None
+
+    # per host AIMD concurrency / token bucket, the job's "concurrency" is the ceiling
+    if rate_limiter is None:
+        rate_limiter = HostRateLimiter.from_config(job.get('rate_limit', None), job.get('concurrency', 20))
+
+    # sitemap discovery: "seed" adds the sitemap urls to the crawl, "only" crawls just the sitemap urls.
+    # with lastmod, pages that didn't change since their last_update are left alone
+    sitemap_config = job.get('sitemap', None)
+    seed_urls = {}
+    unchanged_urls = set()
+    changed_urls = set()
+    last_updates = {}
+    if sitemap_config and not resume:
+        if sitemap_config.get('use_lastmod', True):
+            last_updates = db.get_pages_last_update(job['job'])
+        seed_urls, unchanged_urls, changed_urls = await sitemap.discover_urls(
+            job['url'],
             job['globs'],
-            max_concurrency=job.get('concurrency', 20), # Use 'concurrency' from job or default to 20
             url_normalization_rules=job.get('url_normalization_rules', {}),
-            max_urls_to_find=max_pages
+            sitemap_urls=sitemap_config.get('urls', None),
+            last_updates=last_updates,
+            exclude_globs=job.get('exclude_globs', [])
         )
 
-        if dbupdates:
-            print(f"      - inserting {len(pages_found)} url's in db for job: {job['job']}")
-        try:
-            # insert the pages
-            for page in pages_found:
-                if dbupdates:
-                    db.insert_new_page(
-                        normalized_url=page['normalized_url'],
-                        original_url=page['original_url'],
-                        title=page['title'],
-                        job=job['job'],
-                        tags=job['tags'],
-                        workspaces=job['workspaces'],
-                        image_urls=page['image_urls']
-                    )
-                else:
-                    print(page['normalized_url'])
-        except Exception as e:
-            print(f"Error Encountered: {e}")
+    # pages are written to the db in batches while the crawl runs, dry runs print them instead.
+    # pages whose sitemap lastmod is newer than their last crawl are set back to 'new' to be downloaded again,
+    # not the ones without a lastmod
+    if dbupdates:
+        page_sink = DatabasePageSink(
+            db,
+            site,
+            job,
+            flush_pages=job.get('db_flush_pages', 100),
+            flush_seconds=job.get('db_flush_seconds', 10),
+            reset_urls=changed_urls
+        )
+        on_page = page_sink.add
+    else:
+        page_sink = None
+        on_page = lambda page: print(page['normalized_url'])
+
+    owns_browser_pool = browser_pool is None
+    async with (
+        nullcontext(playwright) if playwright is not None else async_playwright()
+    ) as playwright, (page_sink or nullcontext()):
+        # browsers are pooled separately from the crawl concurrency, 40 workers can share 1 or 2 browsers
+        async with (
+            nullcontext(browser_pool) if not owns_browser_pool else BrowserPool(
+                playwright,
+                size=job.get('browser_pool_size', 1),
+                max_navigations_per_page=job.get('max_navigations_per_page', 50),
+                max_rss_mb=job.get('max_browser_rss_mb', None),
+                request_blocker=request_blocker
+            )
+        ) as browser_pool:
+            pages_found = await crawler.run_crawler(
+                playwright, 
+                job['url'], 
+                job['globs'],
+                max_concurrency=job.get('concurrency', 20), # Use 'concurrency' from job or default to 20
+                url_normalization_rules=job.get('url_normalization_rules', {}),
+                max_urls_to_find=max_pages,
+                browser_pool=browser_pool,
+                crawl_engine=job.get('crawl_engine', 'browser'),
+                js_fallback_rules=job.get('js_fallback', {}),
+                container_selector=site['parent_element'] if site is not None else None,
+                frontier=frontier,
+                resume=resume,
+                time_budget_seconds=time_budget_minutes * 60 if time_budget_minutes else None,
+                seed_urls=list(seed_urls.values()),
+                skip_normalized_urls=unchanged_urls,
+                follow_links=not (sitemap_config and sitemap_config.get('mode', 'seed') == 'only'),
+                rate_limiter=rate_limiter,
+                exclude_globs=job.get('exclude_globs', []),
+                extract_content=extract_during_crawl,
+                content_selector=site['child_element'] if site is not None else None,
+                readiness=readiness,
+                bloom_filter_capacity=job.get('bloom_filter_capacity', None),
+                on_page=on_page,
+                page_slot=page_slot,
+                max_depth=job.get('max_depth', None),
+                links_in_container=job.get('links_in_container', False),
+                http_cache=http_cache
+            )
+            if owns_browser_pool:
+                request_blocker.print_stats()
+
+    if frontier.paused:
+        print(f"      - crawl for job: {job['job']} is paused and will continue on the next run")
+
+    if page_sink is not None:
+        print(f"      - {len(pages_found)} url's in db for job: {job['job']}")
+        page_sink.print_stats()
 
 
 async def crawler_mode(args: argparse.ArgumentParser, db: DatabaseManager) -> None:
     """
     asynchronously calls the web crawler for specified or all jobs and commits all DB changes
+
+    up to --parallel-jobs jobs crawl at the same time. They share:
+      - a budget of --crawl-workers page loads in flight, split by the jobs' "weight" (default 1)
+      - one browser pool per blocking profile
+      - one per host rate limiter capped at --host-concurrency, jobs with their own "rate_limit" keep their own
     """
     print("\ncrawler mode\n")
 
@@ -123,22 +260,63 @@ async def crawler_mode(args: argparse.ArgumentParser, db: DatabaseManager) -> No
 
     max_urls = args.maxurls
 
-    run_specific_job = False
+    jobs = []
     if len(args.jobs) > 0:
         print("will perform specific job runs:")
-        run_specific_job = True
         for argjob in args.jobs:
             for j in job_list:
                 if "job" in j and j["job"] == argjob:
                     print(f" - Now processing job: {argjob}")
-                    await crawl_site(db, j, max_urls, args.db_updates)
+                    jobs.append(j)
                     break
-    
-    # only perform the full job list if there were no jobs specified
-    if run_specific_job == False:
+    else:
+        # only perform the full job list if there were no jobs specified
         print("will perform a full job run")
-        for job in job_list:
-            await crawl_site(db, job, max_urls, args.db_updates)
+        jobs = job_list
+
+    print(f"    - running up to {args.parallel_jobs} jobs at a time with {args.crawl_workers} crawl workers, at most {args.host_concurrency} per host")
+    worker_budget = scheduler.WorkerBudget(args.crawl_workers)
+    shared_rate_limiter = HostRateLimiter.from_config(None, args.host_concurrency)
+
+    async with async_playwright() as playwright, AsyncExitStack() as stack:
+        browser_pools = {} # blocking profile -> BrowserPool
+        request_blockers = {} # blocking profile -> RequestBlocker
+
+        async def get_browser_pool(job: dict) -> BrowserPool:
+            # the first job using a blocking profile sets up its pool
+            profile = job.get('blocking_profile', 'none')
+            if profile not in browser_pools:
+                request_blockers[profile] = RequestBlocker(profile)
+                browser_pools[profile] = await stack.enter_async_context(BrowserPool(
+                    playwright,
+                    size=job.get('browser_pool_size', 1),
+                    max_navigations_per_page=job.get('max_navigations_per_page', 50),
+                    max_rss_mb=job.get('max_browser_rss_mb', None),
+                    request_blocker=request_blockers[profile]
+                ))
+            return browser_pools[profile]
+
+        async def run_job(job: dict) -> None:
+            await worker_budget.register(job['job'], job.get('weight', 1))
+            try:
+                await crawl_site(
+                    db,
+                    job,
+                    max_urls,
+                    args.db_updates,
+                    playwright=playwright,
+                    browser_pool=await get_browser_pool(job),
+                    rate_limiter=None if job.get('rate_limit') else shared_rate_limiter,
+                    page_slot=worker_budget.job_slot(job['job'])
+                )
+            finally:
+                await worker_budget.unregister(job['job'])
+
+        await scheduler.run_jobs(jobs, run_job, args.parallel_jobs)
+
+        for profile, request_blocker in request_blockers.items():
+            print(f"    - blocking profile: {profile}")
+            request_blocker.print_stats()
     
     if args.db_updates:
         print(f"      - committing all changes in the DB")
@@ -146,65 +324,162 @@ async def crawler_mode(args: argparse.ArgumentParser, db: DatabaseManager) -> No
 # endregion Crawler
 
 # region Download
-def download_page(db, page):
+async def download(db, jobs, retry: bool = False):
     """
-    retrieves the core content as markdown from the page and updates the appropriate pages table row
+    downloads the markdown of all pages in 'new' status and updates the database
+    with `retry` (--retry-errors) only the pages in 'retry' status whose next attempt is due are downloaded
+
+    up to --download-concurrency pages load at the same time, on browsers that stay open for the whole run.
+    their html is converted to markdown in --convert-processes processes.
+    the rendered pages are kept in the --snapshot-dir store for --reextract, unless --no-snapshots.
+    pages downloaded before are first asked for with a conditional request, unchanged ones aren't downloaded again
+    (unless --no-http-cache)
+    transient failures (timeouts, 5xx, ...) go to 'retry' with exponential backoff, permanent ones to 'error'
     """
     
-    db.set_site_config(page['normalized_url'])
-    
-    try:      
-        markdown = scrape_to_markdown(
-            page['original_url'],
-            db.site_parent_element,
-            db.site_child_element,
-            db.site_base_url,
-            page['tags'],
-            page['job']
-        )
+    print("\nRetry mode\n" if retry else "\nDownload mode\n")
+
+    # one limiter for the whole run, so every job downloading from the same host shares its limits
+    rate_limiter = HostRateLimiter.from_config(None, args.download_concurrency)
+
+    job_configs = {j['job']: j for j in get_links_json()}
+
+    # pages of a job whose urls are the same under the job's current normalization rules are downloaded once
+    canonicalizers = {}
+    def get_canonicalizer(job_name):
+        if job_name not in canonicalizers:
+            canonicalizers[job_name] = Canonicalizer(job_configs.get(job_name, {}).get('url_normalization_rules'))
+        return canonicalizers[job_name]
+
+    print(f"    - downloading up to {args.download_concurrency} pages at a time")
+    async with async_playwright() as playwright, Downloader(
+        db,
+        playwright,
+        job_configs,
+        rate_limiter=rate_limiter,
+        concurrency=args.download_concurrency,
+        processes=args.convert_processes,
+        snapshots=None if args.no_snapshots else SnapshotStore(args.snapshot_dir),
+        http_cache=None if args.no_http_cache else HttpCache(db, DOWNLOAD)
+    ) as page_downloader:
+        # the 'new' pages go through a leased work queue, so several download processes (on this host or others
+        # sharing the db file) can work on the same job at once without downloading a page twice
+        # retries have their own queues, a download running at the same time doesn't claim them
+        queue_prefix = "retry" if retry else "download"
+        queue_names = [f"{queue_prefix}:{job}" for job in jobs] if len(jobs) > 0 else [f"{queue_prefix}:*"]
+        for queue_name, job in zip(queue_names, jobs or [None]):
+            queue = WorkQueue(db, queue_name, lease_seconds=args.lease_seconds)
+            items = []
+            seen = {} # (job, canonical url) -> page_id of the page downloaded for it
+            duplicates = []
+            for page in (db.get_due_retries(job) if retry else db.get_pages(status="new", job=job)):
+                key = (page['job'], get_canonicalizer(page['job'])(page['normalized_url']))
+                if key in seen:
+                    # marked like upload does, so the page doesn't stay 'new' for every run
+                    duplicates.append((page['page_id'], seen[key], "duplicate"))
+                    continue
+                seen[key] = page['page_id']
+                items.append((str(page['page_id']), key[1]))
+            if duplicates:
+                db.set_duplicates(duplicates)
+                print(f"    - {len(duplicates)} pages marked 'duplicate', their url is a duplicate of another page of their job")
+            queue.enqueue(items, requeue_finished=True)
+            counts = queue.counts()
+            total_pages = counts.get('pending', 0) + counts.get('expired', 0) + counts.get('leased', 0)
+            await page_downloader.run(queue, total_pages, status="retry" if retry else "new")
+            queue.print_stats()
+
+    page_downloader.print_stats()
+    for job in jobs or [None]:
+        retries = db.get_retry_counts(job)
+        if retries['waiting']:
+            print(
+                f"    - {retries['waiting']} pages{f' of {job}' if job else ''} wait for a retry, {retries['due']} due now, "
+                f"the next one at {retries['next_attempt']}. run with --retry-errors to download them"
+            )
 
-        db.update_page(
-            page_id=page['page_id'],
-            content=markdown,
-            status="scraped"
-        )
-    except Exception as e:
-        try:
-            db.update_page(
-            page_id=page['page_id'],
-            content="",
-            status="error"
+def reextract(db, jobs):
+    """
+    rebuilds the markdown of the downloaded pages from their snapshots, with the sites' current selectors
+    """
+
+    print("\nRe-extract mode\n")
+
+    snapshots = SnapshotStore(args.snapshot_dir)
+    for job in jobs or [None]:
+        print(f"Re-extracting pages for job: {job or 'all jobs'}")
+        stats = reextract_pages(db, snapshots, job, processes=args.convert_processes)
+        print(
+            f"    - {stats['changed']} pages changed, {stats['unchanged']} unchanged, {stats['error']} without content, "
+            f"{stats['failed']} with an unreadable snapshot"
         )
-        except Exception as dbe:
-            print(f"could not insert error into DB: {dbe}")
-        print(f"Error Encountered: {e}")
+        if stats['no_snapshot']:
+            print(f"    - {stats['no_snapshot']} pages have no snapshot, set them back to 'new' to download them again")
+        if stats['no_site']:
+            print(f"    - {stats['no_site']} pages have no site config")
 
-def download(db, jobs):
+def prune_snapshots(db, keep):
     """
-    calls get_web_markdown for all pages in 'new' status and updates the database
+    keeps the `keep` most recent snapshots of every page and removes the snapshot files nothing refers to any more
     """
-    
-    print("\nDownload mode\n")
 
-    # get all new pages
-    if len(jobs) > 0:
-        for job in jobs:
-            total_pages = db.get_pages_count(status="new", job=job)
-            count = 0
-            for page in db.get_pages(status="new", job=job):
-                count += 1
-                print(f"{count/total_pages*100:.1f}% Retrieving markdown for page: {page['normalized_url']}")
-                download_page(db, page)
-    else:
-        total_pages = db.get_pages_count(status="new")
-        count = 0
-        for page in db.get_pages(status="new"):
-            count += 1
-            print(f"{count/total_pages*100:.1f}% Retrieving markdown for page: {page['normalized_url']}")
-            download_page(db, page)
+    print("\nPrune snapshots mode\n")
+
+    if keep < 1:
+        # --reextract needs the latest one
+        print("    - at least 1 snapshot per page is kept")
+        keep = 1
+    forgotten = db.prune_page_snapshots(keep)
+    referenced = db.get_snapshot_hashes(CRAWL)
+    if referenced is None:
+        return
+    removed, freed = SnapshotStore(args.snapshot_dir).prune(referenced)
+    print(
+        f"    - {forgotten} older page snapshots forgotten, {removed} snapshot files removed, "
+        f"{freed / 1024 / 1024:.1f} MB freed"
+    )
 
 # endregion Download
 
+# region Dedupe
+
+def dedupe(db, jobs, threshold):
+    """
+    marks the pages that are canonical or near-duplicates of another page of their job, upload skips them
+    """
+
+    print("\nDedupe mode\n")
+
+    if len(jobs) == 0:
+        jobs = db.get_jobs()
+    job_configs = {j['job']: j for j in get_links_json()}
+
+    for job in jobs:
+        print(f"Finding duplicate pages for job: {job}")
+        # pages stored before the job's url normalization rules changed can be the same url now, like upload checks
+        job_config = job_configs.get(job)
+        canonicalize = Canonicalizer(job_config.get('url_normalization_rules')) if job_config else None
+        stats = dedupe_job(db, job, threshold, canonicalize)
+        duplicates = stats['canonical'] + stats['same_url'] + stats['near']
+        print(
+            f"    - {stats['pages']} pages, {duplicates} duplicates in {stats['groups']} groups: {stats['canonical']} "
+            f"with a canonical url to another page, {stats['same_url']} with the same url as another page, "
+            f"{stats['near']} near-duplicates (SimHash threshold {threshold} bits)"
+        )
+        print(
+            f"    - {stats['chars']} characters (~{stats['chars'] // CHARS_PER_TOKEN} tokens) won't be uploaded and embedded"
+            + (f" ({stats['chars'] / stats['total_chars'] * 100:.0f}% of the job)" if stats['total_chars'] else "")
+        )
+        if stats['uploaded']:
+            print(f"    - {stats['uploaded']} of the duplicates were uploaded before and are still in anythingllm")
+        if stats['restored']:
+            print(f"    - {stats['restored']} pages aren't duplicates any more and go back to 'scraped'")
+        if stats['short']:
+            print(f"    - {stats['short']} pages are too short to compare, only their canonical url is checked")
+        print(f"    - took {stats['seconds']:.2f}s")
+
+# endregion Dedupe
+
 # region Console
 
 def console_print(args, db):
@@ -339,12 +614,31 @@ def upload(db, jobs):
         if len(anythingllm_docs) == 0:
             print(f"warning: 0 length list of documents from anythingllm!!")
 
+        # a page whose url is the same as an uploaded one under the job's current normalization rules
+        # (stored before the rules changed) would be the same document twice
+        canonicalize = Canonicalizer(job_config.get('url_normalization_rules'))
+        uploaded_urls = {} # canonical url -> page_id of the page uploaded for it
+        duplicates = []
+
         total_pages = db.get_pages_count(status="scraped", job=job)
         count = 0
         for page in db.get_pages(status="scraped", job=job):
             count += 1
+            canonical_url = canonicalize(page['normalized_url'])
+            if canonical_url in uploaded_urls:
+                duplicates.append((page['page_id'], uploaded_urls[canonical_url], "duplicate"))
+                print(f" {count/total_pages*100:.1f}% - skipping page with a duplicate url: {page['normalized_url']}")
+                continue
+            uploaded_urls[canonical_url] = page['page_id']
             print(f" {count/total_pages*100:.1f}% - uploading page: {page["normalized_url"]}")
             upload_page(db, page, anythingllm_docs)
+        if duplicates:
+            # marked like --dedupe does, so they aren't read again on the next upload
+            db.set_duplicates(duplicates)
+            print(f"    - {len(duplicates)} pages marked 'duplicate', their url is a duplicate of another page of the job")
+        marked_duplicates = db.get_pages_count(status="duplicate", job=job)
+        if marked_duplicates:
+            print(f"    - {marked_duplicates} pages of the job are marked as a copy of another page and aren't uploaded")
     
     # clear out the old items
     #anythingllm_api.delete_anythingllm_folder(junk_folder_name)
@@ -374,12 +668,53 @@ if __name__ == "__main__":
         help="Enables crawler mode"
     )
 
+    parser.add_argument(
+        "--convert-processes",
+        type=int,
+        default=None,
+        help="Download mode only. processes converting the downloaded html to markdown (default: one per cpu core)"
+    )
+
+    parser.add_argument(
+        "--crawl-workers",
+        type=int,
+        default=60,
+        help=
+    """    Crawler mode only. global budget of pages loading at the same time across all running jobs (default 60).
+    Each job gets a share by its "weight" in crawler_jobs.json, and can use idle capacity other jobs don't need.
+    """
+    )
+
     parser.add_argument(
         "-d", "--download",
         action="store_true",
         help="Enables content download mode. Must be run after crawler jobs have completed successfully"
     )
 
+    parser.add_argument(
+        "--download-concurrency",
+        type=int,
+        default=8,
+        help="Download mode only. how many pages are downloaded at the same time (default 8)"
+    )
+
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help=
+    """    Dedupe mode. Marks the pages (of --jobs, or all of them) that are a copy of another page of their job as
+    'duplicate', so upload skips them: pages with a <link rel=canonical> to another page, and pages whose
+    content is nearly the same (?view= variants, localized mirrors). Runs before --upload.
+    """
+    )
+
+    parser.add_argument(
+        "--dedupe-threshold",
+        type=int,
+        default=DEFAULT_THRESHOLD,
+        help=f"Dedupe mode only. how many of the 64 SimHash bits two near-duplicate pages may differ in (default {DEFAULT_THRESHOLD}, 0 only finds identical content)"
+    )
+
     parser.add_argument(
         "-db", "--db_updates",
         action="store_false",
@@ -401,6 +736,13 @@ if __name__ == "__main__":
     """
     )
 
+    parser.add_argument(
+        "--host-concurrency",
+        type=int,
+        default=40,
+        help="Crawler mode only. maximum concurrent requests per host, shared by all jobs crawling the same host (default 40)"
+    )
+
     parser.add_argument(
         "-j", "--jobs",
         type=lambda s: [item.strip() for item in s.split(',')], # Custom type to split by comma and strip whitespace
@@ -409,7 +751,7 @@ if __name__ == "__main__":
     """    A comma-separated list of crawler job names to process.
     if ommitted, all defined jobs will be processed
 
-    NOTE: requires --crawler, --print, --download, or --upload
+    NOTE: requires --crawler, --print, --download, --dedupe, or --upload
     
     Examples:
         --jobs cleanup,report,sync # no whitespaces
@@ -417,6 +759,16 @@ if __name__ == "__main__":
     """
     )
 
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help=
+    """    Work queue lease time in seconds (default 300). Urls or pages claimed by a process that dies
+    are picked up by another process once their lease runs out.
+    """
+    )
+
     parser.add_argument(
         "--maxurls",
         type=int,
@@ -424,12 +776,95 @@ if __name__ == "__main__":
         help="maximum amount of pages for the crawler to return. requires --crawler or --print"
     )
 
+    parser.add_argument(
+        "--no-http-cache",
+        action="store_true",
+        help=
+    """    Crawler and download mode. Fetches every page in full. By default the pages fetched before are asked for
+    with conditional requests (If-None-Match / If-Modified-Since), unchanged pages aren't downloaded or converted again.
+    The downloader only does so for pages the sitemap set back to 'new', a page set to 'new' by hand is downloaded in full.
+    """
+    )
+
+    parser.add_argument(
+        "--no-snapshots",
+        action="store_true",
+        help="Crawler and download mode. doesn't keep the rendered pages for --reextract, nor the page bodies the crawler's conditional requests need"
+    )
+
+    parser.add_argument(
+        "--parallel-jobs",
+        type=int,
+        default=3,
+        help="Crawler mode only. how many crawler jobs run at the same time (default 3, 1 runs them one after another)"
+    )
+
     parser.add_argument(
         "-p", "--print",
         type=str,
         help="prints urls belonging to a crawler job to the console. specify a job name or '*' for all jobs"
     )
 
+    parser.add_argument(
+        "--prune-snapshots",
+        type=int,
+        metavar="KEEP",
+        default=None,
+        help=
+    """    Prune mode. Keeps the KEEP most recent snapshots of every page (at least 1, the one --reextract uses) and
+    removes the files in --snapshot-dir nothing refers to any more, for all jobs. Files stored in the last hour
+    are kept for downloads still running.
+    """
+    )
+
+    parser.add_argument(
+        "--reextract",
+        action="store_true",
+        help=
+    """    Re-extract mode. Rebuilds the markdown of the scraped and uploaded pages (of --jobs, or all of them) from the snapshots
+    the downloader kept, with the sites' current parent_element / child_element. No pages are loaded.
+    Changed pages go back to 'scraped' to be uploaded again.
+    """
+    )
+
+    parser.add_argument(
+        "-r", "--resume",
+        action="store_true",
+        help=
+    """    Crawler mode only. Continues crawls that were interrupted (crash, Ctrl-C) from their last checkpoint
+    instead of starting them over. Crawls paused by a job's "time_budget_minutes" always continue on the next run.
+    """
+    )
+
+    parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        help=
+    """    Retry mode. Downloads only the pages (of --jobs, or all of them) whose download failed with a transient
+    error (timeout, 5xx, a closed browser) and whose next attempt is due. The wait doubles after every failed
+    attempt, a page that keeps failing ends up in 'error'.
+    """
+    )
+
+    parser.add_argument(
+        "--snapshot-dir",
+        type=str,
+        default=str(SNAPSHOT_DIR),
+        help=f"Crawler, download and re-extract mode. where the rendered pages and the crawled page bodies are kept (default {SNAPSHOT_DIR}). Every changed download adds a snapshot, run --prune-snapshots to remove old ones"
+    )
+
+    parser.add_argument(
+        "--work-queue",
+        action="store_true",
+        help=
+    """    Crawler mode only. Keeps the crawl queue in the database's work_queue table with leases, so several
+    processes (or hosts sharing the db file) can crawl the same job at once. A process started later joins
+    the running crawl. Download mode always uses a work queue.
+    For several hosts, put the db on a share (the default rollback journal works there). On a single host
+    SITES_DB_JOURNAL_MODE=WAL lets readers run while a crawl writes, never use it for a db on a share.
+    """
+    )
+
     parser.add_argument(
         "-u", "--upload",
         action="store_true",
@@ -455,7 +890,19 @@ if __name__ == "__main__":
         asyncio.run(crawler_mode(args, db))
     
     if args.download:
-        download(db, args.jobs)
+        asyncio.run(download(db, args.jobs))
+
+    if args.retry_errors:
+        asyncio.run(download(db, args.jobs, retry=True))
+
+    if args.reextract:
+        reextract(db, args.jobs)
+
+    if args.prune_snapshots is not None:
+        prune_snapshots(db, args.prune_snapshots)
+
+    if args.dedupe:
+        dedupe(db, args.jobs, args.dedupe_threshold)
 
     if args.upload:
         upload(db, args.jobs)
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from db import DatabaseManager
+from get_web_markdown import html_to_markdown
+
+class DatabasePageSink:
+    """
+    Writes pages to the pages table while the crawl is still running.
+
+    Pass `sink.add` as run_crawler's `on_page`. Pages are buffered and written in one transaction every
+    `flush_pages` pages or `flush_seconds` seconds, whichever comes first, so a crash only loses the last batch
+    and the downloader can start on the first pages before the crawl is done.
+
+    A full buffer is handed to a single writer task, the way the downloader's PageWriter works: the markdown
+    conversion runs in a thread and the batch is written from the writer, so neither blocks the crawl. At most
+    `max_pending_batches` batches wait for the writer, add() holds the crawl back when it falls behind.
+
+    The site (a sites row from DatabaseManager.get_site_config) is passed in, so the sink doesn't depend on
+    the DatabaseManager's current site config while it runs.
+
+    Pages with 'content_html' (extract during crawl) are converted to markdown and stored as scraped.
+    Pages in `reset_urls` without content (e.g. the sitemap says they changed) are set back to 'new'.
+    """
+    def __init__(
+        self,
+        db: DatabaseManager,
+        site,
+        job: dict,
+        flush_pages: int = 100,
+        flush_seconds: float = 10,
+        reset_urls: set = None,
+        max_pending_batches: int = 2
+    ):
+        self.db = db
+        self.job = job
+        self.site_id = site['site_id']
+        self.base_url = site['base_url']
+        self.flush_pages = flush_pages
+        self.flush_seconds = flush_seconds
+        self.reset_urls = reset_urls or set()
+
+        self._buffer = {} # normalized_url -> page, a better variant found before the flush replaces the first one
+        self._last_flush = time.monotonic()
+        self._batches = asyncio.Queue(maxsize=max(1, max_pending_batches))
+        self._flush_task = None
+        self._writer_task = None
+        self.stats = {'pages': 0, 'scraped': 0, 'reset': 0, 'flushes': 0, 'failed_flushes': 0}
+
+    async def __aenter__(self):
+        self._writer_task = asyncio.create_task(self._write_batches())
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        # everything added so far is written before the writer stops
+        await self.flush()
+        await self._batches.put(None)
+        await self._writer_task
+        if self._buffer:
+            print(f"      - {len(self._buffer)} pages could not be written to the database")
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            if self._buffer and time.monotonic() - self._last_flush >= self.flush_seconds:
+                await self.flush()
+
+    async def add(self, page: dict) -> None:
+        self._buffer[page['normalized_url']] = page
+        if len(self._buffer) >= self.flush_pages:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        hands the buffered pages to the writer, raises when the writer stopped instead of waiting for it forever
+        """
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if self._writer_task is not None and self._writer_task.done():
+            error = None if self._writer_task.cancelled() else self._writer_task.exception()
+            raise RuntimeError(f"the page writer stopped, {len(self._buffer)} pages were not written: {error}")
+        batch = list(self._buffer.values())
+        self._buffer = {}
+        await self._batches.put(batch)
+
+    async def _write_batches(self) -> None:
+        while True:
+            batch = await self._batches.get()
+            if batch is None:
+                return
+            # a batch that fails goes back to the buffer, the writer keeps running so flush() never waits on it
+            try:
+                rows, reset, scraped = await asyncio.to_thread(self._rows, batch)
+                written = self._write(rows, reset, scraped)
+            except Exception as e:
+                print(f"      - could not write {len(batch)} pages to the database: {e}")
+                written = False
+            if not written:
+                # back in the buffer for the next flush, unless a newer variant of the page came in since
+                self.stats['failed_flushes'] += 1
+                for page in batch:
+                    self._buffer.setdefault(page['normalized_url'], page)
+
+    def _rows(self, batch: list[dict]) -> tuple[list[dict], list[str], int]:
+        """
+        the insert_pages rows of a batch and the urls to set back to 'new', converts the content to markdown
+        """
+        rows = []
+        reset = []
+        scraped = 0
+        for page in batch:
+            row = {
+                'normalized_url': page['normalized_url'],
+                'original_url': page['original_url'],
+                'title': page['title'],
+                'image_urls': page['image_urls'],
+                'canonical_url': page.get('canonical_url')
+            }
+            content = None
+            if page.get('content_html'):
+                try:
+                    content = html_to_markdown(
+                        page['content_html'],
+                        page['title'],
+                        page['original_url'],
+                        self.base_url,
+                        self.job['tags'],
+                        self.job['job']
+                    )
+                except Exception as e:
+                    # stored without content, the downloader scrapes it like any other new page
+                    print(f"      - could not convert {page['original_url']} to markdown: {e}")
+            if content is not None:
+                row['content'] = content
+                row['status'] = "scraped"
+                scraped += 1
+            elif page['normalized_url'] in self.reset_urls:
+                reset.append(page['normalized_url'])
+            rows.append(row)
+        return rows, reset, scraped
+
+    def _write(self, rows: list[dict], reset: list[str], scraped: int) -> bool:
+        """
+        writes a batch, returns False when it has to be written again
+        """
+        if not self.db.insert_pages(self.site_id, self.job['job'], self.job['tags'], self.job['workspaces'], rows):
+            return False
+        if reset:
+            self.db.set_pages_status(reset, "new", revalidate=True)
+            if not self.db.commit():
+                return False
+            self.stats['reset'] += len(reset)
+        self.stats['pages'] += len(rows)
+        self.stats['scraped'] += scraped
+        self.stats['flushes'] += 1
+        return True
+
+    def print_stats(self) -> None:
+        print(
+            f"      - {self.stats['pages']} pages written in {self.stats['flushes']} batches, "
+            f"{self.stats['scraped']} stored as scraped, {self.stats['reset']} changed pages set back to 'new'"
+            + (f", {self.stats['failed_flushes']} batches failed and were tried again" if self.stats['failed_flushes'] else "")
+        )
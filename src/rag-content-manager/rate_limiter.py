@@ -0,0 +1,299 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+# statuses that mean the host wants us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+# how long we back off after a throttle response without a Retry-After header
+DEFAULT_BACKOFF_SECONDS = 5.0
+
+# how often a waiting request re-checks for a free slot
+POLL_SECONDS = 0.05
+
+class ThrottledError(Exception):
+    """
+    raised when a host answered with one of the THROTTLE_STATUSES
+    """
+    pass
+
+
+class RequestOutcome:
+    """
+    filled in by the caller inside a rate limiter slot, read when the slot is released
+    """
+    __slots__ = ('status', 'retry_after')
+
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+
+
+class HostState:
+    """
+    token bucket and AIMD concurrency state for a single host
+    """
+    def __init__(self, concurrency: float, rate: float):
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.rate = rate # requests per second, None for no limit
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.latency = None # ewma of response times
+        self.baseline_latency = None # best ewma seen, what "healthy" looks like for this host
+        self.last_decrease = 0.0
+        self.robots_checked = False
+        self.crawl_delay = None
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'decreases': 0}
+
+
+class HostRateLimiter:
+    """
+    Per host rate limiting shared by the crawler and the downloader.
+
+    Each host gets:
+      - a concurrency limit that grows by one per window of healthy responses (additive increase) and is
+        halved on 429/503, timeouts or latency well above the host's baseline (multiplicative decrease)
+      - a token bucket, when `requests_per_second` is set or the host's robots.txt has a Crawl-delay
+      - a pause honouring Retry-After after a throttle response
+
+    Use `async with limiter.slot(url) as outcome:` (or `with limiter.slot_sync(url)` from sync code) around a
+    single request, and set `outcome.status` / `outcome.retry_after` from the response.
+    """
+    def __init__(
+        self,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 40,
+        requests_per_second: float = None,
+        latency_threshold: float = 2.0,
+        decrease_factor: float = 0.5,
+        respect_robots: bool = True,
+        user_agent: str = "*"
+    ):
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.requests_per_second = requests_per_second
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+
+        self._hosts: dict[str, HostState] = {}
+        # the downloader is sync and may share a limiter with async code, so state changes take a thread lock
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict = None, max_concurrency: int = 40) -> "HostRateLimiter":
+        """
+        builds a limiter from a job's "rate_limit" block in crawler_jobs.json
+        """
+        config = config or {}
+        return cls(
+            initial_concurrency=config.get('initial_concurrency', min(4, max_concurrency)),
+            min_concurrency=config.get('min_concurrency', 1),
+            max_concurrency=config.get('max_concurrency', max_concurrency),
+            requests_per_second=config.get('requests_per_second', None),
+            latency_threshold=config.get('latency_threshold', 2.0),
+            respect_robots=config.get('respect_robots', True)
+        )
+
+    def _host_state(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = HostState(min(self.initial_concurrency, self.max_concurrency), self.requests_per_second)
+            self._hosts[host] = state
+        return state
+
+    def _load_robots(self, url: str, state: HostState) -> None:
+        """
+        reads the host's robots.txt once and applies its Crawl-delay / Request-rate to the token bucket
+        """
+        parsed = urlparse(url)
+        robots = RobotFileParser(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+        try:
+            robots.read()
+            crawl_delay = robots.crawl_delay(self.user_agent)
+            request_rate = robots.request_rate(self.user_agent)
+        except Exception as e:
+            print(f"       - could not read robots.txt for {parsed.netloc}: {e}")
+            return
+
+        rate = None
+        if crawl_delay:
+            rate = 1.0 / float(crawl_delay)
+        if request_rate and request_rate.seconds:
+            rate = min(rate or float('inf'), request_rate.requests / request_rate.seconds)
+
+        with self._lock:
+            state.crawl_delay = float(crawl_delay) if crawl_delay else None
+            if rate is not None:
+                state.rate = rate if state.rate is None else min(state.rate, rate)
+                print(f"       - robots.txt for {parsed.netloc}: limited to {rate:.2f} requests per second")
+
+    def _try_acquire(self, host: str) -> float:
+        """
+        reserves a slot for the host if one is free now, returns 0. otherwise returns how long to wait
+        """
+        with self._lock:
+            state = self._host_state(host)
+            now = time.monotonic()
+
+            if now < state.blocked_until:
+                return state.blocked_until - now
+
+            if state.in_flight >= int(state.concurrency):
+                return POLL_SECONDS
+
+            if state.rate is not None:
+                # a burst of one when a crawl delay is set, otherwise allow up to a second worth of requests
+                burst = 1.0 if state.crawl_delay else max(1.0, state.rate)
+                state.tokens = min(burst, state.tokens + (now - state.last_refill) * state.rate)
+                state.last_refill = now
+                if state.tokens < 1.0:
+                    return (1.0 - state.tokens) / state.rate
+                state.tokens -= 1.0
+
+            state.in_flight += 1
+            state.stats['requests'] += 1
+            return 0
+
+    def _needs_robots(self, host: str) -> bool:
+        with self._lock:
+            state = self._host_state(host)
+            if not self.respect_robots or state.robots_checked:
+                return False
+            state.robots_checked = True
+            return True
+
+    async def acquire(self, url: str) -> None:
+        host = urlparse(url).netloc
+        if self._needs_robots(host):
+            await asyncio.to_thread(self._load_robots, url, self._host_state(host))
+        while True:
+            wait = self._try_acquire(host)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, url: str) -> None:
+        host = urlparse(url).netloc
+        if self._needs_robots(host):
+            self._load_robots(url, self._host_state(host))
+        while True:
+            wait = self._try_acquire(host)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def release(self, url: str, latency: float, status: int = None, retry_after: str = None, error: Exception = None) -> None:
+        """
+        gives the slot back and adjusts the host's limits from how the request went
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            state = self._host_state(host)
+            state.in_flight = max(0, state.in_flight - 1)
+            now = time.monotonic()
+
+            throttled = status in THROTTLE_STATUSES
+            timed_out = error is not None and "timeout" in type(error).__name__.lower()
+
+            if throttled:
+                state.stats['throttled'] += 1
+                state.blocked_until = max(state.blocked_until, now + _parse_retry_after(retry_after))
+            if error is not None:
+                state.stats['errors'] += 1
+
+            if throttled or timed_out:
+                self._decrease(state, now)
+                return
+
+            if error is not None or latency is None:
+                return
+
+            # track latency, the best average we've seen is the host's healthy baseline
+            state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+            if state.baseline_latency is None or state.latency < state.baseline_latency:
+                state.baseline_latency = state.latency
+
+            if state.latency > state.baseline_latency * self.latency_threshold:
+                self._decrease(state, now)
+            else:
+                # additive increase: +1 after a full window of healthy responses
+                state.concurrency = min(self.max_concurrency, state.concurrency + 1.0 / max(1.0, state.concurrency))
+                if state.rate is not None and state.crawl_delay is None and self.requests_per_second:
+                    state.rate = min(self.requests_per_second, state.rate + 0.1)
+
+    def _decrease(self, state: HostState, now: float) -> None:
+        # only back off once per round trip, otherwise every request in flight halves the limit again
+        if now - state.last_decrease < max(1.0, state.latency or 0):
+            return
+        state.last_decrease = now
+        state.stats['decreases'] += 1
+        state.concurrency = max(self.min_concurrency, state.concurrency * self.decrease_factor)
+        if state.rate is not None and state.crawl_delay is None:
+            state.rate = max(0.1, state.rate * self.decrease_factor)
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        await self.acquire(url)
+        outcome = RequestOutcome()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception as e:
+            self.release(url, None, outcome.status, outcome.retry_after, error=e)
+            raise
+        except BaseException:
+            # cancelled, just give the slot back
+            self.release(url, None, outcome.status, outcome.retry_after)
+            raise
+        self.release(url, time.monotonic() - start, outcome.status, outcome.retry_after)
+
+    @contextmanager
+    def slot_sync(self, url: str):
+        self.acquire_sync(url)
+        outcome = RequestOutcome()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception as e:
+            self.release(url, None, outcome.status, outcome.retry_after, error=e)
+            raise
+        except BaseException:
+            self.release(url, None, outcome.status, outcome.retry_after)
+            raise
+        self.release(url, time.monotonic() - start, outcome.status, outcome.retry_after)
+
+    def print_stats(self) -> None:
+        for host, state in sorted(self._hosts.items()):
+            rate = f"{state.rate:.2f}/s" if state.rate is not None else "unlimited"
+            latency = f"{state.latency:.2f}s" if state.latency is not None else "n/a"
+            print(
+                f"       - Rate limit {host}: concurrency {int(state.concurrency)}, rate {rate}, latency {latency}, "
+                f"{state.stats['requests']} requests, {state.stats['throttled']} throttled, "
+                f"{state.stats['errors']} errors, {state.stats['decreases']} back-offs."
+            )
+
+
+def _parse_retry_after(retry_after: str) -> float:
+    """
+    Retry-After is either a number of seconds or an http date
+    """
+    if not retry_after:
+        return DEFAULT_BACKOFF_SECONDS
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return DEFAULT_BACKOFF_SECONDS
@@ -0,0 +1,112 @@
+import time
+# the sync and async apis raise the same TimeoutError class
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# the playwright wait_until states, plus our own "selector" and "js" strategies
+READY_STRATEGIES = ('networkidle', 'load', 'domcontentloaded', 'selector', 'js')
+
+# hard cap on how long a page may take to become ready, matching playwright's default navigation timeout
+DEFAULT_READY_TIMEOUT_MS = 30000
+
+class ReadinessStrategy:
+    """
+    Decides when a page is ready to be read after page.goto().
+
+      - networkidle / load / domcontentloaded: passed straight to page.goto(wait_until=...)
+      - selector: goto until domcontentloaded, then wait for `value` (a css selector, usually the site's
+        parent_element) to be attached
+      - js: goto until domcontentloaded, then wait for `value` (a javascript predicate) to return a truthy value
+
+    `timeout_ms` is a hard cap for the whole navigation. When a selector or predicate doesn't show up in time
+    the page is read as it is rather than failed.
+
+    Every navigation is timed so strategies can be compared, see print_stats().
+    """
+    def __init__(self, strategy: str = 'networkidle', value: str = None, timeout_ms: int = None):
+        if strategy not in READY_STRATEGIES:
+            raise ValueError(f"Invalid ready strategy: {strategy}, must be one of {READY_STRATEGIES}")
+        if strategy in ('selector', 'js') and not value:
+            raise ValueError(f"ready strategy '{strategy}' needs a ready value")
+        self.strategy = strategy
+        self.value = value
+        self.timeout_ms = timeout_ms or DEFAULT_READY_TIMEOUT_MS
+        self.stats = {'pages': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'wait_timeouts': 0, 'goto_timeouts': 0}
+
+    @classmethod
+    def from_site_config(cls, site, default: str = 'networkidle') -> "ReadinessStrategy":
+        """
+        builds the strategy stored with a site (a sites row from DatabaseManager.get_site_config: ready_strategy /
+        ready_value / ready_timeout_ms), or `default` when the site has none.
+        A "selector" strategy without a value waits for the site's parent_element
+        """
+        strategy = site['ready_strategy'] or default
+        value = site['ready_value']
+        if strategy == 'selector' and not value:
+            value = site['parent_element']
+        return cls(strategy, value, site['ready_timeout_ms'])
+
+    @property
+    def label(self) -> str:
+        return f"{self.strategy} ({self.value})" if self.value else self.strategy
+
+    @property
+    def _goto_wait_until(self) -> str:
+        return self.strategy if self.strategy not in ('selector', 'js') else 'domcontentloaded'
+
+    def _record(self, start: float) -> None:
+        elapsed = time.monotonic() - start
+        self.stats['pages'] += 1
+        self.stats['total_seconds'] += elapsed
+        self.stats['max_seconds'] = max(self.stats['max_seconds'], elapsed)
+
+    def _remaining_ms(self, start: float) -> float:
+        return max(1, self.timeout_ms - (time.monotonic() - start) * 1000)
+
+    async def goto(self, page, url: str):
+        """
+        navigates `page` to `url` and waits until it is ready, returns the goto response
+        """
+        start = time.monotonic()
+        try:
+            response = await page.goto(url, wait_until=self._goto_wait_until, timeout=self.timeout_ms)
+        except PlaywrightTimeoutError:
+            self.stats['goto_timeouts'] += 1
+            raise
+        try:
+            if self.strategy == 'selector':
+                await page.wait_for_selector(self.value, state='attached', timeout=self._remaining_ms(start))
+            elif self.strategy == 'js':
+                await page.wait_for_function(self.value, timeout=self._remaining_ms(start))
+        except PlaywrightTimeoutError:
+            self.stats['wait_timeouts'] += 1
+        self._record(start)
+        return response
+
+    def goto_sync(self, page, url: str):
+        """
+        sync version of goto() for the downloader
+        """
+        start = time.monotonic()
+        try:
+            response = page.goto(url, wait_until=self._goto_wait_until, timeout=self.timeout_ms)
+        except PlaywrightTimeoutError:
+            self.stats['goto_timeouts'] += 1
+            raise
+        try:
+            if self.strategy == 'selector':
+                page.wait_for_selector(self.value, state='attached', timeout=self._remaining_ms(start))
+            elif self.strategy == 'js':
+                page.wait_for_function(self.value, timeout=self._remaining_ms(start))
+        except PlaywrightTimeoutError:
+            self.stats['wait_timeouts'] += 1
+        self._record(start)
+        return response
+
+    def print_stats(self) -> None:
+        pages = self.stats['pages']
+        average = self.stats['total_seconds'] / pages if pages else 0
+        print(
+            f"       - Page readiness {self.label}: {pages} pages, average {average:.2f}s, "
+            f"max {self.stats['max_seconds']:.2f}s, {self.stats['wait_timeouts']} ready waits timed out, "
+            f"{self.stats['goto_timeouts']} navigations timed out."
+        )
@@ -0,0 +1,142 @@
+import re
+
+# analytics / telemetry endpoints seen on the doc sites we crawl
+ANALYTICS_URL_PATTERNS = [
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"doubleclick\.net",
+    r"clarity\.ms",
+    r"js\.monitor\.azure\.com",
+    r"\.events\.data\.microsoft\.com",
+    r"mscom\.demdex\.net",
+    r"adobedtm\.com",
+    r"hotjar\.com",
+    r"segment\.(io|com)",
+    r"facebook\.(net|com)/tr",
+    r"/analytics(\.min)?\.js"
+]
+
+# named interception profiles, selected per job with "blocking_profile" in crawler_jobs.json
+# resource types are the ones playwright reports in request.resource_type
+BLOCKING_PROFILES = {
+    # load everything, same as not routing at all
+    "none": {
+        "resource_types": [],
+        "url_patterns": []
+    },
+    # doc sites: we only read links and the content container, so skip anything that is never part of the DOM text
+    "docs": {
+        "resource_types": ["image", "media", "font", "beacon", "ping", "csp_report", "manifest", "texttrack"],
+        "url_patterns": ANALYTICS_URL_PATTERNS
+    },
+    # also drops stylesheets. faster, but inner_text() no longer knows what is hidden by css
+    "aggressive": {
+        "resource_types": ["image", "media", "font", "beacon", "ping", "csp_report", "manifest", "texttrack", "stylesheet", "websocket", "eventsource"],
+        "url_patterns": ANALYTICS_URL_PATTERNS + [
+            r"\.(png|jpe?g|gif|bmp|svg|webp|ico|woff2?|ttf|otf|mp4|webm)(\?|$)"
+        ]
+    }
+}
+
+class RequestBlocker:
+    """
+    Aborts requests by resource type or URL pattern through playwright routing, and counts what was blocked.
+
+    `profile` is either the name of one of the BLOCKING_PROFILES, or a dict with the same
+    "resource_types" / "url_patterns" keys for a job specific profile.
+
+    Aborted requests never download a body, so there is no byte count for them. Instead we count the
+    blocked requests (per resource type) and the bytes of the responses we did let through (from the
+    content-length header), which is the number that drops when a profile is working.
+    """
+    def __init__(self, profile="none"):
+        if isinstance(profile, dict):
+            self.name = profile.get("name", "custom")
+            config = profile
+        else:
+            if profile not in BLOCKING_PROFILES:
+                raise ValueError(f"Invalid blocking profile: {profile}")
+            self.name = profile
+            config = BLOCKING_PROFILES[profile]
+
+        self.resource_types = frozenset(config.get("resource_types", []))
+        patterns = config.get("url_patterns", [])
+        self.url_pattern = re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE) if patterns else None
+
+        self.stats = {
+            'blocked_requests': 0,
+            'blocked_by_type': {},
+            'allowed_requests': 0,
+            'allowed_bytes': 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.resource_types) or self.url_pattern is not None
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        """
+        returns True (and counts it) if the request should be aborted
+        """
+        if resource_type in self.resource_types or (self.url_pattern is not None and self.url_pattern.search(url)):
+            self.stats['blocked_requests'] += 1
+            self.stats['blocked_by_type'][resource_type] = self.stats['blocked_by_type'].get(resource_type, 0) + 1
+            return True
+        self.stats['allowed_requests'] += 1
+        return False
+
+    async def handle_route(self, route) -> None:
+        """
+        route handler for the playwright async api, e.g. `await context.route("**/*", blocker.handle_route)`
+        """
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def handle_route_sync(self, route) -> None:
+        """
+        route handler for the playwright sync api, e.g. `page.route("**/*", blocker.handle_route_sync)`
+        """
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            route.abort()
+        else:
+            route.continue_()
+
+    def on_response(self, response) -> None:
+        """
+        response listener (works with both apis) tallying the bytes we did not block
+        """
+        try:
+            self.stats['allowed_bytes'] += int(response.headers.get("content-length", 0))
+        except (TypeError, ValueError):
+            pass
+
+    async def attach(self, context) -> None:
+        """
+        installs the route handler and response listener on an async BrowserContext
+        """
+        if not self.enabled:
+            return
+        await context.route("**/*", self.handle_route)
+        context.on("response", self.on_response)
+
+    def attach_sync(self, page) -> None:
+        """
+        installs the route handler and response listener on a sync Page
+        """
+        if not self.enabled:
+            return
+        page.route("**/*", self.handle_route_sync)
+        page.on("response", self.on_response)
+
+    def print_stats(self) -> None:
+        if not self.enabled:
+            return
+        by_type = ", ".join(f"{t}: {c}" for t, c in sorted(self.stats['blocked_by_type'].items()))
+        print(
+            f"       - Request blocking ({self.name}): {self.stats['blocked_requests']} requests blocked ({by_type}), "
+            f"{self.stats['allowed_requests']} allowed, {self.stats['allowed_bytes'] / 1024 / 1024:.1f} MB transferred."
+        )
@@ -0,0 +1,90 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from playwright._impl._errors import TargetClosedError, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
+from rate_limiter import ThrottledError
+
+# how a failed download is treated
+TRANSIENT = 'transient' # worth another attempt later: timeouts, 5xx, a browser that went away
+PERMANENT = 'permanent' # won't get better by asking again: 404, the site's selectors missing from the page
+
+# http statuses that may be gone on the next attempt
+TRANSIENT_STATUSES = (408, 425, 429)
+
+# playwright error messages of failures on the way to the site, not of the page itself
+TRANSIENT_MESSAGES = ('net::ERR_', 'NS_ERROR_NET', 'Page crashed', 'Navigation failed because page was closed')
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 300.0 # before the second attempt, doubled for every attempt after it
+DEFAULT_MAX_BACKOFF_SECONDS = 24 * 60 * 60.0
+
+class HttpStatusError(Exception):
+    """
+    raised when a page answered with an http error status
+    """
+    def __init__(self, status: int):
+        super().__init__(f"http status {status}")
+        self.status = status
+
+
+class PageFailure(Exception):
+    """
+    a page that loaded but can't be used, e.g. the site's parent_element isn't on it. Always permanent
+    """
+    pass
+
+
+def classify_failure(error: BaseException) -> tuple[str, str]:
+    """
+    returns (TRANSIENT or PERMANENT, a short reason) for an exception raised while downloading a page
+    """
+    if isinstance(error, HttpStatusError):
+        kind = TRANSIENT if error.status >= 500 or error.status in TRANSIENT_STATUSES else PERMANENT
+        return kind, f"http {error.status}"
+    if isinstance(error, ThrottledError):
+        return TRANSIENT, "throttled"
+    if isinstance(error, PageFailure):
+        return PERMANENT, str(error)
+    if isinstance(error, (PlaywrightTimeoutError, asyncio.TimeoutError, TimeoutError)):
+        return TRANSIENT, "timeout"
+    if isinstance(error, TargetClosedError):
+        return TRANSIENT, "browser closed"
+    if isinstance(error, ConnectionError) or (
+        isinstance(error, PlaywrightError) and any(message in str(error) for message in TRANSIENT_MESSAGES)
+    ):
+        return TRANSIENT, "network error"
+    return PERMANENT, type(error).__name__
+
+
+class RetryPolicy:
+    """
+    When a page whose download failed transiently is tried again: exponential backoff with jitter, starting at
+    `backoff_seconds` and capped at `max_backoff_seconds`, for up to `max_attempts` attempts in total.
+    The jitter spreads the retries of pages that failed together (a site outage) over half the backoff,
+    so they don't all come back at the same moment.
+    """
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        max_backoff_seconds: float = DEFAULT_MAX_BACKOFF_SECONDS
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def backoff(self, attempts: int) -> float:
+        """
+        seconds to wait after the `attempts`th failed attempt
+        """
+        backoff = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** max(0, attempts - 1))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    def next_attempt(self, kind: str, attempts: int) -> str:
+        """
+        the sqlite datetime of the next attempt after `attempts` failed ones, None when the page shouldn't be
+        tried again (a permanent failure, or no attempts left)
+        """
+        if kind != TRANSIENT or attempts >= self.max_attempts:
+            return None
+        return (datetime.now() + timedelta(seconds=self.backoff(attempts))).strftime('%Y-%m-%d %H:%M:%S')
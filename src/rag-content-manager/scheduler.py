@@ -0,0 +1,99 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+class WorkerBudget:
+    """
+    A global budget of crawl workers shared by the jobs running at the same time.
+
+    Each registered job is entitled to a share of the budget proportional to its weight. A job may go over its
+    share while no other job is waiting for a slot, so the budget isn't left idle while the other jobs are in their
+    long tail. As soon as another job waits, jobs over their share get no new slots until they are back under it.
+    """
+    def __init__(self, total: int):
+        self.total = max(1, total)
+        self.in_use = 0
+        self._weights = {} # job -> weight
+        self._used = {} # job -> slots held
+        self._waiting = {} # job -> workers waiting for a slot
+        self._cond = asyncio.Condition()
+
+    async def register(self, job: str, weight: float = 1.0) -> None:
+        async with self._cond:
+            self._weights[job] = max(0.01, float(weight))
+            self._used.setdefault(job, 0)
+            self._waiting.setdefault(job, 0)
+            self._cond.notify_all()
+
+    async def unregister(self, job: str) -> None:
+        async with self._cond:
+            self._weights.pop(job, None)
+            self._used.pop(job, None)
+            self._waiting.pop(job, None)
+            # the remaining jobs' shares just grew
+            self._cond.notify_all()
+
+    def share(self, job: str) -> int:
+        total_weight = sum(self._weights.values())
+        return max(1, int(self.total * self._weights[job] / total_weight))
+
+    def _can_acquire(self, job: str) -> bool:
+        if self.in_use >= self.total:
+            return False
+        if self._used[job] < self.share(job):
+            return True
+        # over its share, only while nobody else is waiting
+        return not any(waiting for other, waiting in self._waiting.items() if other != job)
+
+    @asynccontextmanager
+    async def slot(self, job: str):
+        async with self._cond:
+            self._waiting[job] += 1
+            try:
+                while not self._can_acquire(job):
+                    await self._cond.wait()
+            finally:
+                self._waiting[job] -= 1
+            self._used[job] += 1
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_use -= 1
+                if job in self._used:
+                    self._used[job] -= 1
+                self._cond.notify_all()
+
+    def job_slot(self, job: str) -> Callable:
+        """
+        returns a factory for the job's slots, to pass to run_crawler as its `page_slot`
+        """
+        return lambda: self.slot(job)
+
+
+async def run_jobs(
+    jobs: list[dict],
+    run_job: Callable[[dict], Awaitable],
+    max_parallel_jobs: int = 1
+) -> None:
+    """
+    Runs `run_job(job)` for every job, at most `max_parallel_jobs` at a time, starting them in list order.
+    A failing job is reported and doesn't stop the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_parallel_jobs))
+    start_time = time.time()
+
+    async def run(job: dict):
+        async with semaphore:
+            job_start = time.time()
+            try:
+                await run_job(job)
+            except Exception as e:
+                print(f"    - job: {job['job']} failed: {e}")
+            finally:
+                print(f"    - job: {job['job']} done in {(time.time() - job_start) / 60:.1f} minutes")
+
+    await asyncio.gather(*(run(job) for job in jobs))
+    print(f"    - {len(jobs)} jobs done in {(time.time() - start_time) / 60:.1f} minutes")
@@ -0,0 +1,175 @@
+import zlib
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+from xml.etree.ElementTree import XMLPullParser
+import crawler
+from http_fetcher import HttpFetcher
+from url_filter import UrlFilter
+from canonicalize import Canonicalizer
+
+# sitemap indexes can point at other indexes, don't follow a misconfigured site forever
+MAX_SITEMAP_DEPTH = 3
+
+def _local_name(tag: str) -> str:
+    # strips the "{http://www.sitemaps.org/schemas/sitemap/0.9}" namespace
+    return tag.rsplit('}', 1)[-1]
+
+def parse_lastmod(value: str) -> datetime:
+    """
+    parses a W3C datetime lastmod value into a naive local datetime (the way pages.last_update is stored),
+    returns None if it can't be parsed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+async def find_sitemaps(fetcher: HttpFetcher, start_url: str) -> list[str]:
+    """
+    returns the sitemaps listed in the site's robots.txt, or /sitemap.xml when robots.txt lists none
+    """
+    parsed = urlparse(start_url)
+    site_root = f"{parsed.scheme}://{parsed.netloc}"
+    sitemaps = []
+    try:
+        response = await fetcher.fetch(f"{site_root}/robots.txt")
+        for line in response.text.splitlines():
+            if line.lower().startswith("sitemap:"):
+                sitemaps.append(line.split(":", 1)[1].strip())
+    except Exception as e:
+        print(f"       - could not read robots.txt for {site_root}: {e}")
+
+    if not sitemaps:
+        sitemaps.append(f"{site_root}/sitemap.xml")
+    return sitemaps
+
+async def iter_sitemap(fetcher: HttpFetcher, sitemap_url: str, depth: int = 0):
+    """
+    streams a sitemap (plain or gzipped) and yields (loc, lastmod) for every <url> in it.
+    sitemap indexes are followed, the parsed elements are dropped as we go so huge sitemaps stay small in memory
+    """
+    parser = XMLPullParser(events=('end',))
+    child_sitemaps = []
+    decompressor = None
+
+    def drain():
+        for event, element in parser.read_events():
+            name = _local_name(element.tag)
+            if name not in ('url', 'sitemap'):
+                continue
+            loc = None
+            lastmod = None
+            for child in element:
+                child_name = _local_name(child.tag)
+                if child_name == 'loc':
+                    loc = (child.text or "").strip()
+                elif child_name == 'lastmod':
+                    lastmod = parse_lastmod(child.text)
+            element.clear()
+            if not loc:
+                continue
+            if name == 'sitemap':
+                child_sitemaps.append(urljoin(sitemap_url, loc))
+            else:
+                yield loc, lastmod
+
+    try:
+        async with fetcher.client.stream("GET", sitemap_url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "").lower()
+            if sitemap_url.endswith(".gz") or "gzip" in content_type:
+                # a .gz file, not gzip transfer encoding (httpx already handles that)
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+            async for chunk in response.aiter_bytes():
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                parser.feed(chunk)
+                for entry in drain():
+                    yield entry
+    except Exception as e:
+        print(f"       - could not read sitemap {sitemap_url}: {e}")
+        return
+
+    parser.close()
+    for entry in drain():
+        yield entry
+
+    if depth < MAX_SITEMAP_DEPTH:
+        for child_sitemap in child_sitemaps:
+            async for entry in iter_sitemap(fetcher, child_sitemap, depth + 1):
+                yield entry
+
+async def discover_urls(
+    start_url: str,
+    globs: list[str],
+    url_normalization_rules: dict = None,
+    sitemap_urls: list[str] = None,
+    last_updates: dict = None,
+    exclude_globs: list[str] = None
+) -> tuple[dict, set, set]:
+    """
+    Reads the site's sitemaps and returns the urls matching the job's globs, normalized the same way the crawler does.
+
+    `last_updates` maps normalized_url -> pages.last_update. A url whose sitemap lastmod is older than the
+    page's last_update has not changed since we last crawled it and is returned in the unchanged set instead.
+    A known page whose lastmod is newer than its last_update is also returned in the changed set, those are the
+    only pages to download again. A url without a lastmod is crawled, but isn't known to have changed.
+
+    returns ({normalized_url: url} to crawl, normalized urls that are unchanged, normalized urls that changed)
+    """
+    canonicalize = Canonicalizer(url_normalization_rules)
+    rules = canonicalize.rules
+    last_updates = last_updates or {}
+    url_filter = UrlFilter(globs, exclude_globs)
+
+    to_crawl = {} # normalized_url -> url
+    unchanged = set()
+    changed = set()
+    stats = {'entries': 0, 'matched': 0, 'unchanged': 0}
+
+    async with HttpFetcher(max_connections=4) as fetcher:
+        if not sitemap_urls:
+            sitemap_urls = await find_sitemaps(fetcher, start_url)
+        print(f"       - Reading sitemaps: {sitemap_urls}")
+
+        for sitemap_url in sitemap_urls:
+            async for loc, lastmod in iter_sitemap(fetcher, sitemap_url):
+                stats['entries'] += 1
+                if not url_filter.matches(loc):
+                    continue
+                stats['matched'] += 1
+
+                normalized_url = canonicalize(loc)
+                last_update = last_updates.get(normalized_url)
+                if lastmod is not None and last_update:
+                    last_update_dt = datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S")
+                    if lastmod <= last_update_dt:
+                        unchanged.add(normalized_url)
+                        continue
+                    changed.add(normalized_url)
+
+                # keep the most preferred variant when a sitemap lists several versions of a page
+                current = to_crawl.get(normalized_url)
+                if current is None or (
+                    crawler._get_version_rank_and_numeric(loc, "view", rules['version_preference_order']) <
+                    crawler._get_version_rank_and_numeric(current, "view", rules['version_preference_order'])
+                ):
+                    to_crawl[normalized_url] = loc
+
+    # a page listed twice, once unchanged and once not, has changed
+    unchanged -= to_crawl.keys()
+    stats['unchanged'] = len(unchanged)
+    print(
+        f"       - Sitemap discovery: {stats['entries']} entries, {stats['matched']} matched the globs, "
+        f"{stats['unchanged']} unchanged since the last crawl, {len(changed)} changed, {len(to_crawl)} to crawl."
+    )
+    return to_crawl, unchanged, changed
@@ -0,0 +1,80 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+class SnapshotStore:
+    """
+    The rendered DOM of downloaded pages, so their markdown can be rebuilt (--reextract) after a site's
+    parent_element / child_element or the html2text settings change, without loading the pages again.
+
+    Snapshots are gzip compressed and content addressed: <root>/<first 2 hex digits>/<sha256>.html.gz.
+    A page that didn't change since its last download is stored once. The page_snapshots table records which
+    snapshot a url had at which fetch time.
+
+    Nothing is removed by itself: every changed download adds a snapshot. prune() (--prune-snapshots) removes
+    the ones nothing refers to any more.
+    """
+    def __init__(self, root: str, compresslevel: int = 6):
+        self.root = Path(root)
+        self.compresslevel = compresslevel
+
+    def _path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}.html.gz"
+
+    def put(self, html: str) -> tuple[str, int, int]:
+        """
+        stores a snapshot, returns (content_hash, raw bytes, bytes written). Nothing is written when the same
+        snapshot is already stored. Safe to call from several threads
+        """
+        data = html.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(content_hash)
+        if path.exists():
+            try:
+                # stored again just now, prune() leaves it alone until it is recorded
+                os.utime(path)
+                return content_hash, len(data), 0
+            except FileNotFoundError:
+                # pruned in the meantime
+                pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = gzip.compress(data, compresslevel=self.compresslevel)
+        # written next to the final name and renamed, a reader never sees half a snapshot
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return content_hash, len(data), len(compressed)
+
+    def get(self, content_hash: str) -> str:
+        with open(self._path(content_hash), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+
+    def __contains__(self, content_hash: str) -> bool:
+        return self._path(content_hash).exists()
+
+    def prune(self, referenced: set, min_age_seconds: float = 3600) -> tuple[int, int]:
+        """
+        removes the snapshots whose hash isn't in `referenced`, returns (files removed, bytes freed).
+        Snapshots stored less than `min_age_seconds` ago are kept, a running download may not have recorded them yet
+        """
+        removed = 0
+        freed = 0
+        cutoff = time.time() - min_age_seconds
+        for path in self.root.glob('*/*.html.gz'):
+            if path.name[:-len('.html.gz')] in referenced:
+                continue
+            try:
+                stat = path.stat()
+                if stat.st_mtime >= cutoff:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+        return removed, freed
@@ -0,0 +1,29 @@
+"""
+shared fixtures for the tests, run from src/rag-content-manager:
+    python -m pytest -q tests
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db import DatabaseManager
+
+TABLES_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'db', 'tables.sql')
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    a DatabaseManager on a new db with the schema of db/tables.sql
+    """
+    db_file = str(tmp_path / "sites.db")
+    with open(TABLES_SQL) as f:
+        connection = sqlite3.connect(db_file)
+        connection.executescript(f.read())
+        connection.close()
+    manager = DatabaseManager(db_file)
+    yield manager
+    manager.conn.close()
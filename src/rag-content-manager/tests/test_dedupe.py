@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+from dedupe import dedupe_job, shingle_hashes, simhashes
+
+def text(seed: int, words: int = 200) -> str:
+    rng = random.Random(seed)
+    return " ".join(f"word{rng.randrange(5000)}" for _ in range(words))
+
+def edit(content: str, changes: int, seed: int = 0) -> str:
+    """
+    the content with `changes` of its words replaced
+    """
+    rng = random.Random(seed)
+    words = content.split()
+    for index in rng.sample(range(len(words)), changes):
+        words[index] = f"changed{rng.randrange(5000)}"
+    return " ".join(words)
+
+def add_page(db, url: str, content: str, status: str = "scraped", canonical_url: str = None, duplicate_of: int = None) -> int:
+    cursor = db.conn.execute(
+        """
+            INSERT INTO pages (site_id, normalized_url, original_url, content, status, job, canonical_url, duplicate_of)
+            VALUES (1, ?, ?, ?, ?, 'job', ?, ?)
+        """, (url, "https://" + url, content, status, canonical_url, duplicate_of)
+    )
+    db.conn.commit()
+    return cursor.lastrowid
+
+def marks(db) -> dict:
+    """
+    normalized_url -> (status, normalized_url of the page it is a duplicate of)
+    """
+    rows = db.conn.execute(
+        """
+            SELECT page.normalized_url, page.status, kept.normalized_url AS kept_url
+            FROM pages page LEFT JOIN pages kept ON kept.page_id = page.duplicate_of
+        """
+    )
+    return {row['normalized_url']: (row['status'], row['kept_url']) for row in rows}
+
+def signature(content: str) -> int:
+    return int(simhashes([shingle_hashes(content, {})])[0])
+
+def test_canonical_links_are_one_group(db):
+    add_page(db, "site/a", text(1))
+    add_page(db, "site/a?view=old", text(2), canonical_url="site/a")
+    # through another page of the group
+    add_page(db, "site/a?view=older", text(3), canonical_url="site/a?view=old")
+
+    stats = dedupe_job(db, "job")
+    assert marks(db) == {
+        "site/a": ("scraped", None),
+        "site/a?view=old": ("duplicate", "site/a"),
+        "site/a?view=older": ("duplicate", "site/a"),
+    }
+    assert stats['canonical'] == 2
+    assert stats['groups'] == 1
+
+def test_same_url_under_the_current_rules(db):
+    add_page(db, "site/b?lang=en", text(1))
+    add_page(db, "site/b", text(2))
+
+    stats = dedupe_job(db, "job", canonicalize=lambda url: url.split("?")[0])
+    assert marks(db)["site/b?lang=en"] == ("duplicate", "site/b")
+    assert stats['same_url'] == 1
+
+def test_near_duplicates_keep_the_best_page(db):
+    content = text(1)
+    add_page(db, "site/page?view=net-8", content)
+    add_page(db, "site/page", edit(content, 1))
+    add_page(db, "site/uploaded-copy", edit(content, 1, seed=1), status="uploaded")
+    add_page(db, "site/other", text(2))
+
+    stats = dedupe_job(db, "job")
+    # an uploaded page is kept before a shorter url, so the copy in anythingllm stays
+    assert marks(db) == {
+        "site/page?view=net-8": ("duplicate", "site/uploaded-copy"),
+        "site/page": ("duplicate", "site/uploaded-copy"),
+        "site/uploaded-copy": ("uploaded", None),
+        "site/other": ("scraped", None),
+    }
+    assert stats['near'] == 2
+
+def test_near_duplicates_are_close_to_their_page(db):
+    # each page differs a little from the one before it, the last is far from the first
+    pages = [text(1)]
+    for step in range(1, 12):
+        pages.append(edit(pages[-1], 4, seed=step))
+    for step, content in enumerate(pages):
+        add_page(db, f"site/chain/{step:02}", content)
+
+    dedupe_job(db, "job", threshold=6)
+    by_url = {f"site/chain/{step:02}": content for step, content in enumerate(pages)}
+    kept = []
+    for url, (status, kept_url) in marks(db).items():
+        if status == "duplicate":
+            distance = bin(signature(by_url[url]) ^ signature(by_url[kept_url])).count("1")
+            assert distance <= 6
+        else:
+            kept.append(url)
+    assert len(kept) > 1
+
+def test_pages_that_are_no_longer_duplicates_go_back_to_scraped(db):
+    kept = add_page(db, "site/c", text(1))
+    add_page(db, "site/c-copy", text(2), status="duplicate", duplicate_of=kept)
+
+    stats = dedupe_job(db, "job")
+    assert marks(db)["site/c-copy"] == ("scraped", None)
+    assert stats['restored'] == 1
+
+def test_short_pages_are_only_compared_by_url(db):
+    add_page(db, "site/moved", "this page has moved")
+    add_page(db, "site/moved-too", "this page has moved")
+
+    stats = dedupe_job(db, "job")
+    assert stats['short'] == 2
+    assert {status for status, kept_url in marks(db).values()} == {"scraped"}
+
+def test_threshold_is_a_number_of_bits(db):
+    with pytest.raises(ValueError):
+        dedupe_job(db, "job", threshold=65)
+
+def test_simhash_of_a_small_change_is_close():
+    content = text(1, words=400)
+    distance = bin(signature(content) ^ signature(edit(content, 2))).count("1")
+    assert distance <= 6
@@ -0,0 +1,66 @@
+import asyncio
+
+from frontier import CrawlFrontier, crawl_priority
+
+# the frontier's condition is bound to one event loop, each test runs in one asyncio.run()
+
+async def crawl(frontier: CrawlFrontier, pause_after: int = None) -> list[str]:
+    """
+    one worker taking every url from the frontier, pausing it after `pause_after` urls. Returns the urls in the
+    order they were handed out
+    """
+    handed_out = []
+    while (next_url := await frontier.get()) is not None:
+        url, priority = next_url
+        handed_out.append(url)
+        await frontier.task_done(url, url)
+        if pause_after is not None and len(handed_out) >= pause_after:
+            await frontier.pause()
+    await frontier.join()
+    return handed_out
+
+async def put(frontier: CrawlFrontier, urls: list[tuple[str, int]]) -> None:
+    for url, priority in urls:
+        await frontier.put(url, url, priority)
+
+def test_memory_frontier_is_by_priority():
+    async def run():
+        frontier = CrawlFrontier()
+        frontier.start("a")
+        await put(frontier, [("deep", crawl_priority(2)), ("a", crawl_priority(0)), ("b", crawl_priority(1)), ("c", crawl_priority(1))])
+        assert await crawl(frontier) == ["a", "b", "c", "deep"]
+    asyncio.run(run())
+
+def test_spills_past_the_memory_limit_and_refills(db):
+    async def run():
+        frontier = CrawlFrontier(db, "job", memory_limit=2)
+        frontier.start("u0")
+        urls = [(f"u{i}", crawl_priority(0, version_rank=9 - i)) for i in range(10)]
+        await put(frontier, urls)
+        assert len(frontier._memory) == 2
+        assert frontier._spilled == 8
+        assert frontier.qsize() == 10
+
+        handed_out = await crawl(frontier)
+        assert sorted(handed_out) == sorted(url for url, priority in urls)
+        # the urls read back from disk come best priority first
+        assert handed_out[2:] == [f"u{i}" for i in range(9, 1, -1)]
+        assert frontier.qsize() == 0
+    asyncio.run(run())
+
+def test_paused_crawl_resumes_with_the_spilled_urls(db):
+    async def run():
+        frontier = CrawlFrontier(db, "job", memory_limit=2)
+        frontier.start("u0")
+        await put(frontier, [(f"u{i}", crawl_priority(0)) for i in range(6)])
+        first_run = await crawl(frontier, pause_after=3)
+        frontier.finish()
+        assert db.get_crawl_run("job")['status'] == 'paused'
+
+        resumed = CrawlFrontier(db, "job", memory_limit=2)
+        visited, found_pages = resumed.start("u0", resume=True)
+        assert resumed.resumed
+        assert set(first_run) <= visited
+        second_run = await crawl(resumed)
+        assert sorted(first_run + second_run) == [f"u{i}" for i in range(6)]
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+import time
+
+from work_queue import WorkQueue
+
+def test_claims_are_disjoint_and_by_priority(db):
+    first = WorkQueue(db, "test", owner="first")
+    second = WorkQueue(db, "test", owner="second")
+    first.enqueue([("a", "url a", 2), ("b", "url b", 0), ("c", "url c", 1)])
+
+    assert first.claim(2) == [("b", "url b", 0), ("c", "url c", 1)]
+    assert second.claim(2) == [("a", "url a", 2)]
+    assert second.claim(2) == []
+    assert db.get_work_counts("test") == {'leased': 3}
+
+def test_enqueue_keeps_existing_items(db):
+    queue = WorkQueue(db, "test", owner="first")
+    queue.enqueue([("a", "url a")])
+    queue.claim(1)
+    queue.complete("a")
+
+    queue.enqueue([("a", "url a again")])
+    assert queue.claim(1) == []
+    queue.enqueue([("a", "url a again")], requeue_finished=True)
+    assert queue.claim(1) == [("a", "url a again", 0)]
+
+def test_expired_lease_is_reclaimed(db):
+    dead = WorkQueue(db, "test", owner="dead", lease_seconds=0.05)
+    alive = WorkQueue(db, "test", owner="alive", lease_seconds=60)
+    dead.enqueue([("a", "url a")])
+    assert dead.claim(1) == [("a", "url a", 0)]
+    assert alive.claim(1) == []
+
+    time.sleep(0.1)
+    assert db.get_work_counts("test") == {'expired': 1}
+    assert alive.claim(1) == [("a", "url a", 0)]
+    assert alive.stats['reclaimed'] == 1
+
+    # the process that lost the lease can't finish the item any more
+    dead.complete("a")
+    assert db.get_work_counts("test") == {'leased': 1}
+    alive.complete("a")
+    assert db.get_work_counts("test") == {'done': 1}
+
+def test_heartbeat_keeps_the_lease(db):
+    holder = WorkQueue(db, "test", owner="holder", lease_seconds=0.15)
+    other = WorkQueue(db, "test", owner="other")
+    holder.enqueue([("a", "url a")])
+    holder.claim(1)
+
+    for _ in range(4):
+        time.sleep(0.06)
+        holder.heartbeat_if_due()
+    assert other.claim(1) == []
+    assert holder.stats['lost'] == 0
+
+def test_heartbeat_reports_a_lost_lease(db):
+    holder = WorkQueue(db, "test", owner="holder", lease_seconds=0.05)
+    other = WorkQueue(db, "test", owner="other")
+    holder.enqueue([("a", "url a")])
+    holder.claim(1)
+
+    time.sleep(0.1)
+    assert other.claim(1) == [("a", "url a", 0)]
+    holder.heartbeat_if_due()
+    assert holder.stats['lost'] == 1
+
+def test_release_hands_the_item_back(db):
+    queue = WorkQueue(db, "test", owner="first")
+    queue.enqueue([("a", "url a"), ("b", "url b")])
+    queue.claim(2)
+
+    queue.release("a", payloads={"a": "url a, another variant"})
+    queue.release("b")
+    assert sorted(queue.claim(2)) == [("a", "url a, another variant", 0), ("b", "url b", 0)]
@@ -0,0 +1,82 @@
+import fnmatch
+import re
+
+# Define common image extensions for filtering and collection
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp')
+
+def _literal_prefix(glob: str) -> str:
+    """
+    returns the part of a glob before its first wildcard, e.g. "https://learn.microsoft.com/en-us/dotnet/api/"
+    """
+    match = re.search(r'[*?\[]', glob)
+    return glob[:match.start()] if match else glob
+
+def _compile_globs(globs: list[str]) -> re.Pattern:
+    """
+    compiles a list of fnmatch globs into a single regex. fnmatch's "*" already crosses "/",
+    so "**" and "***" behave exactly as they did with fnmatch.fnmatch
+    """
+    if not globs:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(glob)})" for glob in globs))
+
+class UrlFilter:
+    """
+    Decides which discovered links a job should follow, built once per job.
+
+    Replaces the per link `urlparse` image check and `fnmatch.fnmatch` loop over the globs with:
+      - a `str.startswith` check against the literal prefixes of the include globs (rejects most nav links)
+      - one compiled regex for all include globs
+      - one compiled regex for the exclude globs and image extensions
+
+    Matching is case sensitive, like fnmatch on linux.
+    """
+    def __init__(self, globs: list[str], exclude_globs: list[str] = None, exclude_extensions: tuple = IMAGE_EXTENSIONS):
+        self.globs = list(globs)
+        self.exclude_globs = list(exclude_globs or [])
+
+        prefixes = [_literal_prefix(glob) for glob in self.globs]
+        # an empty prefix (glob starting with a wildcard) means anything can match
+        self._prefixes = None if any(p == "" for p in prefixes) else tuple(set(prefixes))
+        self._include = _compile_globs(self.globs)
+        self._exclude = _compile_globs(self.exclude_globs)
+        # each include glob on its own with its literal prefix length, most specific first, for specificity()
+        self._by_specificity = sorted(
+            ((len(prefix), re.compile(fnmatch.translate(glob))) for glob, prefix in zip(self.globs, prefixes)),
+            key=lambda item: item[0],
+            reverse=True
+        )
+
+        # an extension at the end of the path, ignoring the query string and fragment
+        extensions = "|".join(re.escape(ext.lstrip('.')) for ext in exclude_extensions)
+        self._image = re.compile(
+            rf"^[a-z][a-z0-9+.-]*://[^/?#]*/[^?#]*\.(?:{extensions})(?:[?#]|$)",
+            re.IGNORECASE
+        ) if extensions else None
+
+    def is_image(self, url: str) -> bool:
+        return self._image is not None and self._image.match(url) is not None
+
+    def matches(self, url: str) -> bool:
+        """
+        True if the url should be followed: it matches an include glob, no exclude glob, and isn't an image
+        """
+        if self._include is None:
+            return False
+        if self._prefixes is not None and not url.startswith(self._prefixes):
+            return False
+        if self._include.match(url) is None:
+            return False
+        if self._exclude is not None and self._exclude.match(url) is not None:
+            return False
+        return not self.is_image(url)
+
+    def specificity(self, url: str) -> int:
+        """
+        the literal prefix length of the most specific include glob matching the url, 0 if none match.
+        A url under ".../dotnet/api/microsoft.maui*" is more specific than one only under ".../dotnet/*"
+        """
+        for prefix_length, pattern in self._by_specificity:
+            if pattern.match(url) is not None:
+                return prefix_length
+        return 0
@@ -0,0 +1,112 @@
+import os
+import socket
+import time
+import uuid
+from db import DatabaseManager
+
+# how long a claimed item stays leased without a heartbeat before another process may take it over
+DEFAULT_LEASE_SECONDS = 300
+
+def default_owner() -> str:
+    """
+    a lease owner id unique to this process: host:pid:random
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class WorkQueue:
+    """
+    A named queue in the work_queue table that several main.py processes (on one host, or on several hosts
+    sharing the db file) can take work from without stepping on each other.
+
+    Items are claimed in batches with a lease. The holder renews its leases with heartbeat_if_due() while it
+    works, and ends them with complete() / fail() / release(). When a process dies its leases run out and
+    the items are reclaimed by the next claim() of any process.
+    """
+    def __init__(self, db: DatabaseManager, name: str, owner: str = None, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.db = db
+        self.name = name
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self._held = set() # item keys we hold a lease on
+        self._last_heartbeat = time.monotonic()
+        self.stats = {'claimed': 0, 'completed': 0, 'failed': 0, 'released': 0, 'reclaimed': 0, 'lost': 0}
+
+    def enqueue(self, items: list[tuple], requeue_finished: bool = False) -> None:
+        """
+        adds (item_key, payload) or (item_key, payload, priority) items, see DatabaseManager.enqueue_work.
+        Lower priorities are claimed first, the default is 0
+        """
+        if items:
+            self.db.enqueue_work(
+                self.name,
+                [item if len(item) == 3 else (item[0], item[1], 0) for item in items],
+                requeue_finished
+            )
+
+    def claim(self, limit: int = 10) -> list[tuple[str, str, int]]:
+        """
+        leases up to `limit` items to this process, returns them as (item_key, payload, priority)
+        """
+        rows, reclaimed = self.db.claim_work(self.name, self.owner, limit, self.lease_seconds)
+        if reclaimed:
+            print(f"       - work queue {self.name}: reclaimed {reclaimed} expired leases")
+        self.stats['reclaimed'] += reclaimed
+        self.stats['claimed'] += len(rows)
+        for row in rows:
+            self._held.add(row['item_key'])
+        return [(row['item_key'], row['payload'], row['priority'] or 0) for row in rows]
+
+    def heartbeat_if_due(self) -> None:
+        """
+        renews our leases once a third of the lease time has passed. Call it regularly while working
+        """
+        if not self._held or time.monotonic() - self._last_heartbeat < self.lease_seconds / 3:
+            return
+        self._last_heartbeat = time.monotonic()
+        lost = self.db.heartbeat_work(self.name, self.owner, list(self._held), self.lease_seconds)
+        if lost:
+            print(f"       - work queue {self.name}: lost the lease on {len(lost)} items")
+            self.stats['lost'] += len(lost)
+            self._held -= lost
+
+    def _finish(self, item_keys: list[str], state: str, payloads: dict = None) -> None:
+        self.db.finish_work(self.name, self.owner, item_keys, state, payloads)
+        self._held.difference_update(item_keys)
+
+    def complete(self, *item_keys: str) -> None:
+        self._finish(list(item_keys), 'done')
+        self.stats['completed'] += len(item_keys)
+
+    def fail(self, *item_keys: str) -> None:
+        self._finish(list(item_keys), 'failed')
+        self.stats['failed'] += len(item_keys)
+
+    def release(self, *item_keys: str, payloads: dict = None) -> None:
+        """
+        hands items back unprocessed, they can be claimed again straight away.
+        `payloads` ({item_key: payload}) replaces the payload of some of them
+        """
+        self._finish(list(item_keys), 'pending', payloads)
+        self.stats['released'] += len(item_keys)
+
+    def release_all(self) -> None:
+        if self._held:
+            self.release(*self._held)
+
+    def counts(self) -> dict:
+        """
+        {state: count} over all processes: pending, leased, expired, done, failed
+        """
+        return self.db.get_work_counts(self.name)
+
+    def clear(self) -> None:
+        self.db.clear_work_queue(self.name)
+        self._held = set()
+
+    def print_stats(self) -> None:
+        print(
+            f"       - Work queue {self.name} ({self.owner}): {self.stats['claimed']} claimed, {self.stats['completed']} completed, "
+            f"{self.stats['failed']} failed, {self.stats['released']} released, {self.stats['reclaimed']} expired leases reclaimed, "
+            f"{self.stats['lost']} leases lost."
+        )